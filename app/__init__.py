@@ -37,6 +37,8 @@ def create_app():
     app.config['SESSION_COOKIE_SECURE'] = True
     app.config['SESSION_COOKIE_HTTPONLY'] = True
     app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
+    app.config['QUIZ_DEADLINE_GRACE_SECONDS'] = int(os.getenv("QUIZ_DEADLINE_GRACE_SECONDS", 30))
+    app.config['DASHBOARD_STATS_MAX_AGE'] = int(os.getenv("DASHBOARD_STATS_MAX_AGE", 60))
     
     # Create upload folder
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
@@ -84,6 +86,14 @@ def create_app():
             response.headers["Expires"] = "0"
         return response
     
+    # Maintenance commands
+    @app.cli.command('rebuild-student-stats')
+    def rebuild_student_stats():
+        """Recompute every student's stats from the published results"""
+        from app.services.student_stats import student_stats_service
+        count = student_stats_service.rebuild()
+        print(f"Rebuilt stats for {count} students")
+    
     # Error handlers
     @app.errorhandler(404)
     def not_found(error):
@@ -0,0 +1,8 @@
+from app import get_db
+
+# Collection getters
+def get_attempts_collection():
+    return get_db().attempts
+
+# Shortcut variables for easy access
+attempts_collection = get_attempts_collection()
@@ -0,0 +1,8 @@
+from app import get_db
+
+# Collection getters
+def get_leaderboards_collection():
+    return get_db().leaderboards
+
+# Shortcut variables for easy access
+leaderboards_collection = get_leaderboards_collection()
\ No newline at end of file
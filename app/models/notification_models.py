@@ -16,21 +16,35 @@ def get_admin_notifications_collection():
     db = get_db()
     return db.admin_notifications
 
+def get_broadcast_notifications_collection():
+    """Get broadcast (audience-scoped) student notifications collection"""
+    db = get_db()
+    return db.broadcast_notifications
+
+def get_notification_receipts_collection():
+    """Get per-student read and deleted markers of broadcast notifications"""
+    db = get_db()
+    return db.notification_receipts
+
+def build_notification(title, message, notification_type="info", scholar_id=None, course=None, semester=None):
+    """Build a notification document (student or admin)"""
+    return {
+        "title": title,
+        "message": message,
+        "type": notification_type,
+        "scholar_id": scholar_id,
+        "course": course,
+        "semester": semester,
+        "timestamp": datetime.utcnow(),
+        "read": False,
+        "read_at": None
+    }
+
 def create_student_notification(scholar_id, title, message, notification_type="info", course=None, semester=None):
     """Create a new notification for student"""
     try:
         notifications_collection = get_notifications_collection()
-        notification = {
-            "title": title,
-            "message": message,
-            "type": notification_type,
-            "scholar_id": scholar_id,
-            "course": course,
-            "semester": semester,
-            "timestamp": datetime.utcnow(),
-            "read": False,
-            "read_at": None
-        }
+        notification = build_notification(title, message, notification_type, scholar_id, course, semester)
         result = notifications_collection.insert_one(notification)
         return str(result.inserted_id)
     except Exception as e:
@@ -41,25 +55,70 @@ def create_admin_notification(title, message, notification_type="info", scholar_
     """Create a new notification for admin"""
     try:
         admin_notifications_collection = get_admin_notifications_collection()
-        notification = {
-            "title": title,
-            "message": message,
-            "type": notification_type,
-            "scholar_id": scholar_id,
+        notification = build_notification(title, message, notification_type, scholar_id, course, semester)
+        result = admin_notifications_collection.insert_one(notification)
+        return str(result.inserted_id)
+    except Exception as e:
+        print(f"Error creating admin notification: {str(e)}")
+        return None
+
+def create_broadcast_notification(title, message, notification_type="info", course=None, semester=None, scholar_ids=None):
+    """Create one notification for a whole audience of students.
+
+    The audience is a course/semester selection (None matches every course
+    or semester) or an explicit list of scholar_ids. Students see it merged
+    into their own notifications at read time; read and deleted markers are
+    kept per student in ``notification_receipts``.
+    """
+    try:
+        broadcast_notifications_collection = get_broadcast_notifications_collection()
+        notification = build_notification(title, message, notification_type)
+        del notification["read"], notification["read_at"]
+        notification["audience"] = {
             "course": course,
             "semester": semester,
-            "timestamp": datetime.utcnow(),
-            "read": False,
-            "read_at": None
+            "scholar_ids": list(scholar_ids) if scholar_ids is not None else None
         }
-        result = admin_notifications_collection.insert_one(notification)
+        result = broadcast_notifications_collection.insert_one(notification)
         return str(result.inserted_id)
     except Exception as e:
-        print(f"Error creating admin notification: {str(e)}")
+        print(f"Error creating broadcast notification: {str(e)}")
         return None
 
+def get_notification_receipts(scholar_id):
+    """Broadcast read/deleted markers of a student"""
+    receipts = get_notification_receipts_collection().find_one({"_id": scholar_id})
+    return receipts or {}
+
+def build_broadcast_query(scholar_id, receipts, unread_only=False):
+    """Query for the broadcast notifications a student sees, or None for
+    unknown students"""
+    user = get_db().users.find_one({"scholar_id": scholar_id}, {'_id': 0, 'course': 1, 'semester': 1})
+    if not user:
+        return None
+    
+    query = {"$or": [
+        {"audience.scholar_ids": scholar_id},
+        {
+            "audience.scholar_ids": None,
+            "audience.course": {"$in": [None, user.get('course')]},
+            "audience.semester": {"$in": [None, user.get('semester')]}
+        }
+    ]}
+    hidden = list(receipts.get('deleted_ids', []))
+    after = [receipts.get('cleared_until')]
+    if unread_only:
+        hidden += receipts.get('read_ids', [])
+        after.append(receipts.get('read_until'))
+    if hidden:
+        query["_id"] = {"$nin": hidden}
+    after = [timestamp for timestamp in after if timestamp]
+    if after:
+        query["timestamp"] = {"$gt": max(after)}
+    return query
+
 def get_student_notifications(scholar_id, limit=20, unread_only=False):
-    """Get notifications for a specific student"""
+    """Get notifications for a specific student, including broadcasts to them"""
     try:
         notifications_collection = get_notifications_collection()
         query = {"scholar_id": scholar_id}
@@ -71,6 +130,22 @@ def get_student_notifications(scholar_id, limit=20, unread_only=False):
             {'_id': 1, 'title': 1, 'message': 1, 'type': 1, 'timestamp': 1, 'read': 1, 'course': 1, 'semester': 1}
         ).sort('timestamp', -1).limit(limit))
         
+        receipts = get_notification_receipts(scholar_id)
+        broadcast_query = build_broadcast_query(scholar_id, receipts, unread_only)
+        if broadcast_query is not None:
+            read_ids = set(receipts.get('read_ids', []))
+            read_until = receipts.get('read_until')
+            broadcasts = get_broadcast_notifications_collection().find(
+                broadcast_query,
+                {'_id': 1, 'title': 1, 'message': 1, 'type': 1, 'timestamp': 1, 'course': 1, 'semester': 1}
+            ).sort('timestamp', -1).limit(limit)
+            for broadcast in broadcasts:
+                broadcast['read'] = broadcast['_id'] in read_ids or bool(read_until and broadcast['timestamp'] <= read_until)
+                broadcast['broadcast'] = True
+                notifications.append(broadcast)
+            notifications.sort(key=lambda notification: notification['timestamp'], reverse=True)
+            notifications = notifications[:limit]
+        
         # Convert ObjectId to string and format timestamp
         for notification in notifications:
             notification['_id'] = str(notification['_id'])
@@ -106,6 +181,17 @@ def get_all_admin_notifications(limit=20, unread_only=False):
         print(f"Error getting admin notifications: {str(e)}")
         return []
 
+def mark_broadcast_receipt(notification_id, scholar_id, marker):
+    """Add a broadcast to a student's ``read_ids`` or ``deleted_ids``"""
+    if not get_broadcast_notifications_collection().count_documents({"_id": notification_id}, limit=1):
+        return False
+    result = get_notification_receipts_collection().update_one(
+        {"_id": scholar_id},
+        {"$addToSet": {marker: notification_id}},
+        upsert=True
+    )
+    return result.modified_count > 0 or result.upserted_id is not None
+
 def mark_student_notification_read(notification_id, scholar_id):
     """Mark a specific student notification as read"""
     try:
@@ -114,6 +200,8 @@ def mark_student_notification_read(notification_id, scholar_id):
             {"_id": ObjectId(notification_id), "scholar_id": scholar_id},
             {"$set": {"read": True, "read_at": datetime.utcnow()}}
         )
+        if result.matched_count == 0:
+            return mark_broadcast_receipt(ObjectId(notification_id), scholar_id, "read_ids")
         return result.modified_count > 0
     except Exception as e:
         print(f"Error marking student notification as read: {str(e)}")
@@ -140,7 +228,14 @@ def mark_all_student_notifications_read(scholar_id):
             {"scholar_id": scholar_id, "read": False},
             {"$set": {"read": True, "read_at": datetime.utcnow()}}
         )
-        return result.modified_count
+        broadcast_count = count_unread_broadcasts(scholar_id)
+        # Everything broadcast so far is read; the individual markers are no longer needed
+        get_notification_receipts_collection().update_one(
+            {"_id": scholar_id},
+            {"$set": {"read_until": datetime.utcnow(), "read_ids": []}},
+            upsert=True
+        )
+        return result.modified_count + broadcast_count
     except Exception as e:
         print(f"Error marking all student notifications as read: {str(e)}")
         return 0
@@ -165,6 +260,8 @@ def delete_student_notification(notification_id, scholar_id):
         result = notifications_collection.delete_one(
             {"_id": ObjectId(notification_id), "scholar_id": scholar_id}
         )
+        if result.deleted_count == 0:
+            return mark_broadcast_receipt(ObjectId(notification_id), scholar_id, "deleted_ids")
         return result.deleted_count > 0
     except Exception as e:
         print(f"Error deleting student notification: {str(e)}")
@@ -187,7 +284,17 @@ def clear_all_student_notifications(scholar_id):
     try:
         notifications_collection = get_notifications_collection()
         result = notifications_collection.delete_many({"scholar_id": scholar_id})
-        return result.deleted_count
+        broadcast_query = build_broadcast_query(scholar_id, get_notification_receipts(scholar_id))
+        broadcast_count = 0
+        if broadcast_query is not None:
+            broadcast_count = get_broadcast_notifications_collection().count_documents(broadcast_query)
+        # Broadcasts up to now are hidden; the individual markers are no longer needed
+        get_notification_receipts_collection().update_one(
+            {"_id": scholar_id},
+            {"$set": {"cleared_until": datetime.utcnow(), "read_ids": [], "deleted_ids": []}},
+            upsert=True
+        )
+        return result.deleted_count + broadcast_count
     except Exception as e:
         print(f"Error clearing student notifications: {str(e)}")
         return 0
@@ -202,6 +309,13 @@ def clear_all_admin_notifications():
         print(f"Error clearing admin notifications: {str(e)}")
         return 0
 
+def count_unread_broadcasts(scholar_id):
+    """Number of broadcast notifications a student has not read"""
+    broadcast_query = build_broadcast_query(scholar_id, get_notification_receipts(scholar_id), unread_only=True)
+    if broadcast_query is None:
+        return 0
+    return get_broadcast_notifications_collection().count_documents(broadcast_query)
+
 def get_unread_student_notification_count(scholar_id):
     """Get count of unread notifications for a student"""
     try:
@@ -210,7 +324,7 @@ def get_unread_student_notification_count(scholar_id):
             "scholar_id": scholar_id,
             "read": False
         })
-        return count
+        return count + count_unread_broadcasts(scholar_id)
     except Exception as e:
         print(f"Error getting unread student notification count: {str(e)}")
         return 0
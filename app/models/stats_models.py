@@ -0,0 +1,8 @@
+from app import get_db
+
+# Collection getters
+def get_student_stats_collection():
+    return get_db().student_stats
+
+# Shortcut variables for easy access
+student_stats_collection = get_student_stats_collection()
\ No newline at end of file
@@ -1,10 +1,19 @@
-from flask import Blueprint, render_template, request, session, jsonify
+from flask import Blueprint, render_template, request, session, jsonify, current_app
 from app.utils.decorators import login_required, permission_required, role_required
-from app.utils.helpers import get_all_schools, get_all_departments, get_all_courses, get_all_semesters, ROLES
+from app.utils.helpers import get_all_schools, get_all_departments, get_all_courses, get_all_semesters, ROLES, sync_result_student_fields
 from app.models.user_models import users_collection, admin_users_collection
 from app.models.quiz_models import results_collection, quizzes_collection
 from app.models.question_models import question_bank_collection
 from app.models.feedback_models import feedback_collection, activities_collection
+from app.services.user_name_cache import user_name_cache
+from app.services.leaderboard_service import leaderboard_service
+from app.services.student_stats import student_stats_service
+from app.services.dashboard_stats import dashboard_stats_snapshot
+from app.services.quiz_report import quiz_report_service
+from app.services.score_percentiles import score_percentile_index
+from app.services.live_board import live_board_service
+from app.utils.pagination import keyset_page, cached_count
+from app.utils.taxonomy import academic_codes, academic_match
 from bson import ObjectId
 from datetime import datetime
 
@@ -14,22 +23,8 @@ admin_bp = Blueprint('admin', __name__)
 @login_required 
 def admin_dashboard():
     """Admin dashboard - Accessible to all admin roles"""
-    # Get accurate stats
-    total_students = users_collection.count_documents({})
-    total_questions = question_bank_collection.count_documents({})
-    total_quizzes = results_collection.count_documents({"published": True})
-    
-    # Calculate average score
-    pipeline = [
-        {"$match": {"published": True}},
-        {"$group": {
-            "_id": None,
-            "avg_score": {"$avg": {"$multiply": [{"$divide": ["$score", "$total"]}, 100]}}
-        }}
-    ]
-    
-    avg_score_result = list(results_collection.aggregate(pipeline))
-    average_score = avg_score_result[0]['avg_score'] if avg_score_result else 0
+    # Totals, average and leaderboard come from the in-memory snapshot
+    snapshot = dashboard_stats_snapshot.get(max_age=current_app.config['DASHBOARD_STATS_MAX_AGE'])
     
     # Get active quizzes
     active_quizzes = []
@@ -43,48 +38,17 @@ def admin_dashboard():
             "started_at": quiz.get('started_at', datetime.now())
         })
     
-    # Get leaderboard
-    pipeline = [
-        {"$match": {"published": True}},
-        {"$sort": {"score": -1, "completion_time": 1, "timestamp": 1}},
-        {"$limit": 10},
-        {"$lookup": {
-            "from": "users",
-            "localField": "scholar_id",
-            "foreignField": "scholar_id",
-            "as": "user_info"
-        }},
-        {"$unwind": "$user_info"},
-        {"$project": {
-            "scholar_id": 1,
-            "user_name": "$user_info.name",
-            "course": 1,
-            "semester": 1,
-            "score": 1,
-            "total": 1,
-            "timestamp": 1,
-            "completion_time": 1,
-            "percentage": {"$multiply": [{"$divide": ["$score", "$total"]}, 100]}
-        }}
-    ]
-    
-    leaderboard = list(results_collection.aggregate(pipeline))
-    
-    # Format dates in leaderboard
-    for item in leaderboard:
-        if 'timestamp' in item and isinstance(item['timestamp'], datetime):
-            item['formatted_date'] = item['timestamp'].strftime('%d/%m/%y')
-    
     # Get recent feedback and activities
     recent_feedback = list(feedback_collection.find({}, {'_id': 0}).sort('timestamp', -1).limit(5))
     recent_activities = list(activities_collection.find({}, {'_id': 0}).sort('timestamp', -1).limit(10))
     
     stats = {
-        'total_students': total_students,
-        'total_questions': total_questions,
-        'total_quizzes': total_quizzes,
-        'average_score': round(average_score, 2),
-        'leaderboard': leaderboard,
+        'total_students': snapshot['total_students'],
+        'total_questions': snapshot['total_questions'],
+        'total_quizzes': snapshot['total_quizzes'],
+        'average_score': round(snapshot['average_score'], 2),
+        'leaderboard': snapshot['leaderboard'],
+        'computed_at': snapshot['computed_at'],
         'recent_feedback': recent_feedback,
         'recent_activities': recent_activities,
         'active_quizzes': active_quizzes
@@ -106,6 +70,8 @@ def admin_users():
     # Pagination parameters
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 10, type=int)
+    after = request.args.get('after')
+    before = request.args.get('before')
     
     # Build query
     query = {}
@@ -118,16 +84,15 @@ def admin_users():
     if semester and semester != 'All' and semester != '':
         query['semester'] = semester
     
-    # Calculate pagination
-    total_students = users_collection.count_documents(query)
+    # Calculate pagination (totals are cached between pages)
+    total_students = cached_count(users_collection, query)
     total_pages = (total_students + per_page - 1) // per_page
-    skip = (page - 1) * per_page
     
-    # Get students with pagination
-    students = list(users_collection.find(
-        query, 
-        {'_id': 0, 'password': 0}
-    ).sort('scholar_id', 1).skip(skip).limit(per_page))
+    # Get students with keyset pagination on (scholar_id, _id)
+    students, next_cursor, prev_cursor = keyset_page(
+        users_collection, query, [('scholar_id', 1), ('_id', 1)], per_page,
+        page=page, after=after, before=before, projection={'_id': 0, 'password': 0}
+    )
     
     stats = {
         'total_students': total_students,
@@ -148,7 +113,9 @@ def admin_users():
                            selected_course=course, 
                            selected_semester=semester,
                            current_page=page,
-                           per_page=per_page)
+                           per_page=per_page,
+                           next_cursor=next_cursor,
+                           prev_cursor=prev_cursor)
 
 @admin_bp.route('/edit_user', methods=['POST'])
 @login_required
@@ -178,10 +145,18 @@ def edit_user():
         updates['semester'] = data.get('semester')
     if 'blocked' in data:
         updates['blocked'] = data.get('blocked')
+    codes = academic_codes(updates.get('school'), updates.get('department'), updates.get('course'))
+    for field in ('school', 'department', 'course'):
+        if field in updates:
+            updates[f"{field}_id"] = codes[f"{field}_id"]
     
     result = users_collection.update_one({"scholar_id": scholar_id}, {"$set": updates})
     
     if result.modified_count > 0:
+        user_name_cache.forget(scholar_id)
+        # Results keep the academic fields of their submission; only the name follows the user
+        if 'name' in updates:
+            sync_result_student_fields(scholar_id, {"user_name": updates['name']})
         log_activity(
             "user_updated",
             f"Updated user details for {scholar_id}",
@@ -204,11 +179,21 @@ def delete_user():
     
     # Delete user and all related data
     users_collection.delete_one({"scholar_id": scholar_id})
+    user_name_cache.forget(scholar_id)
+    published_results = list(results_collection.find({"scholar_id": scholar_id, "published": True}, {'_id': 0, 'published': 1, 'timestamp': 1, 'course': 1, 'semester': 1}))
     results_collection.delete_many({"scholar_id": scholar_id})
+    leaderboard_service.refresh_for_results(published_results)
+    student_stats_service.forget(scholar_id)
+    dashboard_stats_snapshot.invalidate()
+    quiz_report_service.invalidate()
+    score_percentile_index.invalidate()
+    live_board_service.invalidate()
     feedback_collection.delete_many({"scholar_id": scholar_id})
     
     from app.models.user_models import notifications_collection, user_sessions_collection
+    from app.models.notification_models import get_notification_receipts_collection
     notifications_collection.delete_many({"scholar_id": scholar_id})
+    get_notification_receipts_collection().delete_one({"_id": scholar_id})
     user_sessions_collection.delete_many({"scholar_id": scholar_id})
     
     log_activity(
@@ -475,54 +460,40 @@ def quiz_stats():
         "active_quizzes_list": active_quizzes_list
     })
 
-@admin_bp.route('/leaderboard')
-@login_required
-def admin_leaderboard():
-    """Admin leaderboard page"""
-    school = request.args.get('school', '')
-    department = request.args.get('department', '')
-    course = request.args.get('course', '')
-    semester = request.args.get('semester', '')
-    quiz_id = request.args.get('quiz_id', '')
-    limit = int(request.args.get('limit', 10))
+def build_leaderboard_pipeline(school, department, course, semester, quiz_id, limit):
+    """Best result per student for the admin leaderboard filters.
     
+    Results carry the student's name, school and department (with their
+    integer codes), so the filters match on indexed result fields without
+    joining users.
+    """
     # Build query based on filters
     query = {"published": True}
     
     # Add filters only if they are provided and not empty
-    if school and school != 'all' and school != '':
-        query["user_info.school"] = school
-    if department and department != 'all' and department != '':
-        query["user_info.department"] = department
-    if course and course != 'all' and course != '':
-        query["user_info.course"] = course
-    if semester and semester != 'all' and semester != '':
-        query["user_info.semester"] = semester
-    if quiz_id and quiz_id != '':
+    if school and school != 'all':
+        query.update([academic_match('school', school)])
+    if department and department != 'all':
+        query.update([academic_match('department', department)])
+    if course and course != 'all':
+        query.update([academic_match('course', course)])
+    if semester and semester != 'all':
+        query["semester"] = semester
+    if quiz_id:
         query["quiz_id"] = quiz_id
     
-    # Updated pipeline with proper filtering
-    pipeline = [
-        {"$match": {"published": True}},  # Initial match for published results
-        {"$lookup": {
-            "from": "users",
-            "localField": "scholar_id",
-            "foreignField": "scholar_id",
-            "as": "user_info"
-        }},
-        {"$unwind": "$user_info"},
-        # Apply filters after lookup
+    return [
         {"$match": query},
         {"$sort": {"score": -1, "completion_time": 1, "timestamp": 1}},
         {"$group": {
             "_id": "$scholar_id",
             "max_score": {"$max": "$score"},
             "total_questions": {"$first": "$total"},
-            "user_name": {"$first": "$user_info.name"},
-            "school": {"$first": "$user_info.school"},
-            "department": {"$first": "$user_info.department"},
-            "course": {"$first": "$user_info.course"},
-            "semester": {"$first": "$user_info.semester"},
+            "user_name": {"$first": "$user_name"},
+            "school": {"$first": "$school"},
+            "department": {"$first": "$department"},
+            "course": {"$first": "$course"},
+            "semester": {"$first": "$semester"},
             "timestamp": {"$max": "$timestamp"},
             "completion_time": {"$min": "$completion_time"}
         }},
@@ -542,6 +513,19 @@ def admin_leaderboard():
             "completion_time": 1
         }}
     ]
+
+@admin_bp.route('/leaderboard')
+@login_required
+def admin_leaderboard():
+    """Admin leaderboard page"""
+    school = request.args.get('school', '')
+    department = request.args.get('department', '')
+    course = request.args.get('course', '')
+    semester = request.args.get('semester', '')
+    quiz_id = request.args.get('quiz_id', '')
+    limit = int(request.args.get('limit', 10))
+    
+    pipeline = build_leaderboard_pipeline(school, department, course, semester, quiz_id, limit)
     
     leaderboard = list(results_collection.aggregate(pipeline))
     
@@ -580,60 +564,7 @@ def leaderboard_data():
         quiz_id = request.args.get('quiz_id', '')
         limit = int(request.args.get('limit', 10))
         
-        # Build query based on filters
-        query = {"published": True}
-        if school and school != 'all' and school != '':
-            query["user_info.school"] = school
-        if department and department != 'all' and department != '':
-            query["user_info.department"] = department
-        if course and course != 'all' and course != '':
-            query["user_info.course"] = course
-        if semester and semester != 'all' and semester != '':
-            query["user_info.semester"] = semester
-        if quiz_id and quiz_id != '':
-            query["quiz_id"] = quiz_id
-        
-        # Updated pipeline with proper filtering
-        pipeline = [
-            {"$match": {"published": True}},
-            {"$lookup": {
-                "from": "users",
-                "localField": "scholar_id",
-                "foreignField": "scholar_id",
-                "as": "user_info"
-            }},
-            {"$unwind": "$user_info"},
-            # Apply filters after lookup
-            {"$match": query},
-            {"$sort": {"score": -1, "completion_time": 1, "timestamp": 1}},
-            {"$group": {
-                "_id": "$scholar_id",
-                "max_score": {"$max": "$score"},
-                "total_questions": {"$first": "$total"},
-                "user_name": {"$first": "$user_info.name"},
-                "school": {"$first": "$user_info.school"},
-                "department": {"$first": "$user_info.department"},
-                "course": {"$first": "$user_info.course"},
-                "semester": {"$first": "$user_info.semester"},
-                "timestamp": {"$max": "$timestamp"},
-                "completion_time": {"$min": "$completion_time"}
-            }},
-            {"$sort": {"max_score": -1, "completion_time": 1}},
-            {"$limit": limit},
-            {"$project": {
-                "scholar_id": "$_id",
-                "user_name": 1,
-                "score": "$max_score",
-                "total": "$total_questions",
-                "school": 1,
-                "department": 1,
-                "course": 1,
-                "semester": 1,
-                "percentage": {"$multiply": [{"$divide": ["$max_score", "$total_questions"]}, 100]},
-                "timestamp": 1,
-                "completion_time": 1
-            }}
-        ]
+        pipeline = build_leaderboard_pipeline(school, department, course, semester, quiz_id, limit)
         
         leaderboard = list(results_collection.aggregate(pipeline))
         
@@ -656,26 +587,7 @@ def leaderboard_data():
 def dashboard_stats():
     """API endpoint for dashboard statistics"""
     try:
-        # Total students
-        total_students = users_collection.count_documents({})
-        
-        # Total questions
-        total_questions = question_bank_collection.count_documents({})
-        
-        # Total published quizzes
-        total_quizzes = results_collection.count_documents({"published": True})
-        
-        # Average score
-        pipeline = [
-            {"$match": {"published": True}},
-            {"$group": {
-                "_id": None,
-                "avg_score": {"$avg": {"$multiply": [{"$divide": ["$score", "$total"]}, 100]}}
-            }}
-        ]
-        
-        avg_score_result = list(results_collection.aggregate(pipeline))
-        average_score = round(avg_score_result[0]['avg_score'], 2) if avg_score_result else 0
+        snapshot = dashboard_stats_snapshot.get(max_age=current_app.config['DASHBOARD_STATS_MAX_AGE'])
         
         # Recent activities
         recent_activities = list(activities_collection.find({}, {'_id': 0}).sort('timestamp', -1).limit(5))
@@ -688,11 +600,12 @@ def dashboard_stats():
         return jsonify({
             "success": True,
             "stats": {
-                "total_students": total_students,
-                "total_questions": total_questions,
-                "total_quizzes": total_quizzes,
-                "average_score": average_score,
-                "recent_activities": recent_activities
+                "total_students": snapshot['total_students'],
+                "total_questions": snapshot['total_questions'],
+                "total_quizzes": snapshot['total_quizzes'],
+                "average_score": round(snapshot['average_score'], 2),
+                "recent_activities": recent_activities,
+                "computed_at": snapshot['computed_at'].isoformat()
             }
         })
     
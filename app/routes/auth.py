@@ -3,6 +3,7 @@ from app import get_bcrypt
 from app.utils.decorators import login_required, no_cache
 from app.utils.helpers import ROLES, create_notification, create_admin_notification, log_activity, schoolDepartments, departmentCourses
 from app.models.user_models import users_collection, user_sessions_collection, admin_users_collection
+from app.utils.taxonomy import academic_codes
 from datetime import datetime, timedelta
 import uuid
 
@@ -175,6 +176,7 @@ def signup():
                 "school": school,
                 "department": department,
                 "course": course,
+                **academic_codes(school, department, course),
                 "semester": semester,
                 "email": email,
                 "dob": dob,  # Store date of birth in DD/MM/YYYY format
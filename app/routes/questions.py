@@ -3,6 +3,7 @@ from app.utils.decorators import login_required, permission_required, role_requi
 from app.utils.helpers import QUESTION_TAGS
 from app.models.question_models import question_review_collection, question_bank_collection, add_ai_feedback_to_question, update_question_with_ai_suggestions
 from app.models.user_models import users_collection
+from app.models.quiz_models import quizzes_collection
 import json
 import pandas as pd
 import uuid
@@ -10,6 +11,9 @@ from datetime import datetime
 from bson import ObjectId
 from app.services.ai_review_service import ai_review_service
 from app.tasks.ai_review_tasks import ai_processor
+from app.tasks.regrade_tasks import regrade_processor
+from app.services.active_quiz_resolver import active_quiz_resolver
+from app.utils.pagination import keyset_page, cached_count
 import threading
 
 questions_bp = Blueprint('questions', __name__)
@@ -20,8 +24,8 @@ questions_bp = Blueprint('questions', __name__)
 def admin_questions_management():
     """Question management main page"""
     # Get counts for display
-    pending_count = question_review_collection.count_documents({})
-    bank_count = question_bank_collection.count_documents({})
+    pending_count = cached_count(question_review_collection, {})
+    bank_count = cached_count(question_bank_collection, {})
     
     return render_template('admin_questions_main.html', 
                          pending_count=pending_count,
@@ -155,6 +159,8 @@ def admin_question_review():
     """Question review page"""
     page = request.args.get('page', 1, type=int)
     page_size = request.args.get('page_size', 10, type=int)
+    after = request.args.get('after')
+    before = request.args.get('before')
     search = request.args.get('search', '')
     difficulty = request.args.get('difficulty', '')
     
@@ -165,13 +171,14 @@ def admin_question_review():
     if difficulty:
         query['difficulty'] = difficulty
     
-    # Get total count
-    total_count = question_review_collection.count_documents(query)
+    # Get total count (cached between pages)
+    total_count = cached_count(question_review_collection, query)
     total_pages = (total_count + page_size - 1) // page_size if total_count > 0 else 1
     
-    # Get paginated questions
-    skip = (page - 1) * page_size
-    questions = list(question_review_collection.find(query).skip(skip).limit(page_size))
+    # Get paginated questions (keyset pagination on _id)
+    questions, next_cursor, prev_cursor = keyset_page(
+        question_review_collection, query, [('_id', 1)], page_size, page=page, after=after, before=before
+    )
     
     # Get AI system status
     ai_enabled = ai_review_service.enabled
@@ -183,8 +190,8 @@ def admin_question_review():
     })
     
     # Get counts for display
-    pending_count = question_review_collection.count_documents({})
-    bank_count = question_bank_collection.count_documents({})
+    pending_count = cached_count(question_review_collection, {})
+    bank_count = cached_count(question_bank_collection, {})
     
     return render_template('admin_question_review.html', 
                          questions=questions, 
@@ -193,6 +200,8 @@ def admin_question_review():
                          total_pages=total_pages,
                          total_count=total_count,
                          page_size=page_size,
+                         next_cursor=next_cursor,
+                         prev_cursor=prev_cursor,
                          pending_count=pending_count,
                          bank_count=bank_count,
                          ai_enabled=ai_enabled,
@@ -207,6 +216,8 @@ def api_review_questions():
     """API endpoint to get review questions as JSON with pagination"""
     page = request.args.get('page', 1, type=int)
     page_size = request.args.get('page_size', 10, type=int)
+    after = request.args.get('after')
+    before = request.args.get('before')
     search = request.args.get('search', '')
     difficulty = request.args.get('difficulty', '')
     
@@ -217,13 +228,14 @@ def api_review_questions():
     if difficulty:
         query['difficulty'] = difficulty
     
-    # Get total count
-    total_count = question_review_collection.count_documents(query)
+    # Get total count (cached between pages)
+    total_count = cached_count(question_review_collection, query)
     total_pages = (total_count + page_size - 1) // page_size if total_count > 0 else 1
     
-    # Get paginated questions
-    skip = (page - 1) * page_size
-    questions = list(question_review_collection.find(query).skip(skip).limit(page_size))
+    # Get paginated questions (keyset pagination on _id)
+    questions, next_cursor, prev_cursor = keyset_page(
+        question_review_collection, query, [('_id', 1)], page_size, page=page, after=after, before=before
+    )
     
     # Convert ObjectId to string for JSON serialization
     for question in questions:
@@ -238,7 +250,9 @@ def api_review_questions():
         "total_pages": total_pages,
         "total_count": total_count,
         "current_page": page,
-        "page_size": page_size
+        "page_size": page_size,
+        "next_cursor": next_cursor,
+        "prev_cursor": prev_cursor
     })
 
 @questions_bp.route('/api/review/update', methods=['POST'])
@@ -298,6 +312,8 @@ def admin_question_bank():
     """Question bank page"""
     page = request.args.get('page', 1, type=int)
     page_size = request.args.get('page_size', 10, type=int)
+    after = request.args.get('after')
+    before = request.args.get('before')
     search = request.args.get('search', '')
     difficulty = request.args.get('difficulty', '')
     tag = request.args.get('tag', '')
@@ -311,17 +327,18 @@ def admin_question_bank():
     if tag:
         query['tags'] = {'$in': [tag]}
     
-    # Get total count
-    total_count = question_bank_collection.count_documents(query)
+    # Get total count (cached between pages)
+    total_count = cached_count(question_bank_collection, query)
     total_pages = (total_count + page_size - 1) // page_size if total_count > 0 else 1
     
-    # Get paginated questions
-    skip = (page - 1) * page_size
-    questions = list(question_bank_collection.find(query).skip(skip).limit(page_size))
+    # Get paginated questions (keyset pagination on _id)
+    questions, next_cursor, prev_cursor = keyset_page(
+        question_bank_collection, query, [('_id', 1)], page_size, page=page, after=after, before=before
+    )
     
     # Get counts for display
-    pending_count = question_review_collection.count_documents({})
-    bank_count = question_bank_collection.count_documents({})
+    pending_count = cached_count(question_review_collection, {})
+    bank_count = cached_count(question_bank_collection, {})
     
     return render_template('admin_question_bank.html', 
                          questions=questions, 
@@ -330,6 +347,8 @@ def admin_question_bank():
                          total_pages=total_pages,
                          total_count=total_count,
                          page_size=page_size,
+                         next_cursor=next_cursor,
+                         prev_cursor=prev_cursor,
                          pending_count=pending_count,
                          bank_count=bank_count)
 
@@ -341,6 +360,8 @@ def api_bank_questions():
     """API endpoint to get bank questions as JSON with pagination"""
     page = request.args.get('page', 1, type=int)
     page_size = request.args.get('page_size', 10, type=int)
+    after = request.args.get('after')
+    before = request.args.get('before')
     search = request.args.get('search', '')
     difficulty = request.args.get('difficulty', '')
     tag = request.args.get('tag', '')
@@ -354,13 +375,14 @@ def api_bank_questions():
     if tag:
         query['tags'] = {'$in': [tag]}
     
-    # Get total count
-    total_count = question_bank_collection.count_documents(query)
+    # Get total count (cached between pages)
+    total_count = cached_count(question_bank_collection, query)
     total_pages = (total_count + page_size - 1) // page_size if total_count > 0 else 1
     
-    # Get paginated questions
-    skip = (page - 1) * page_size
-    questions = list(question_bank_collection.find(query).skip(skip).limit(page_size))
+    # Get paginated questions (keyset pagination on _id)
+    questions, next_cursor, prev_cursor = keyset_page(
+        question_bank_collection, query, [('_id', 1)], page_size, page=page, after=after, before=before
+    )
     
     # Convert ObjectId to string for JSON serialization
     for question in questions:
@@ -375,7 +397,9 @@ def api_bank_questions():
         "total_pages": total_pages,
         "total_count": total_count,
         "current_page": page,
-        "page_size": page_size
+        "page_size": page_size,
+        "next_cursor": next_cursor,
+        "prev_cursor": prev_cursor
     })
 
 @questions_bp.route('/api/bank/update', methods=['POST'])
@@ -400,18 +424,49 @@ def update_question_bank():
         }
         update_data = {k: v for k, v in update_data.items() if v is not None}
         
-        question_bank_collection.update_one(
+        old_question = question_bank_collection.find_one_and_update(
             {"question_id": question_id},
-            {"$set": update_data}
+            {"$set": update_data},
+            projection={'_id': 0, 'correct_answer': 1}
         )
-        return jsonify({"success": True, "message": "Question updated successfully"})
+        # Quizzes using this question need a freshly built paper
+        quizzes_collection.update_many({"questions": question_id}, {"$inc": {"paper_version": 1}})
+        active_quiz_resolver.invalidate()
+        
+        # Submitted attempts were scored against the old answer
+        regrade_started = False
+        if old_question and 'correct_answer' in update_data and update_data['correct_answer'] != old_question.get('correct_answer'):
+            regrade_processor.start_regrade(question_id)
+            regrade_started = True
+        
+        return jsonify({"success": True, "message": "Question updated successfully", "regrade_started": regrade_started})
     
     elif action == 'delete':
         question_bank_collection.delete_one({"question_id": question_id})
+        quizzes_collection.update_many({"questions": question_id}, {"$inc": {"paper_version": 1}})
+        active_quiz_resolver.invalidate()
         return jsonify({"success": True, "message": "Question deleted"})
     
     return jsonify({"error": "Invalid action"}), 400
 
+@questions_bp.route('/api/bank/regrade/<question_id>', methods=['POST'])
+@login_required
+@permission_required('update')
+def regrade_question(question_id):
+    """Regrade all submitted attempts containing a question"""
+    if not question_bank_collection.find_one({"question_id": question_id}, {'_id': 1}):
+        return jsonify({"error": "Question not found"}), 404
+    
+    regrade_processor.start_regrade(question_id)
+    return jsonify({"success": True, "message": "Regrade started"})
+
+@questions_bp.route('/api/bank/regrade-status')
+@login_required
+@role_required(2)
+def get_regrade_status():
+    """Get progress and score changes of regrade jobs"""
+    return jsonify(regrade_processor.get_status())
+
 @questions_bp.route('/api/questions/approve/<question_id>', methods=['POST'])
 @login_required
 @permission_required('update')
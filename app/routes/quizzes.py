@@ -1,10 +1,21 @@
 from flask import Blueprint, render_template, request, session, jsonify, redirect, url_for
 from app.utils.decorators import login_required, permission_required, role_required
-from app.utils.helpers import build_student_query, schoolDepartments, departmentCourses, create_notification, create_admin_notification, log_activity
+from app.utils.helpers import build_student_query, schoolDepartments, departmentCourses, create_admin_notification, create_broadcast_notification, log_activity
 from app.models.quiz_models import quizzes_collection, quiz_participants_collection, results_collection
 from app.models.question_models import question_bank_collection, questions_collection
 from app.models.user_models import users_collection
 from app.services.ai_monitoring import ai_monitoring_service
+from app.services.paper_cache import paper_cache
+from app.services.active_quiz_resolver import active_quiz_resolver
+from app.services.enrollment_index import enrollment_index
+from app.services.leaderboard_service import leaderboard_service
+from app.services.student_stats import student_stats_service
+from app.services.dashboard_stats import dashboard_stats_snapshot
+from app.services.quiz_report import quiz_report_service
+from app.services.score_percentiles import score_percentile_index
+from app.services.live_board import live_board_service
+from app.services.item_analysis import item_analysis_service
+from pymongo import ReturnDocument
 from bson import ObjectId
 import uuid
 from datetime import datetime
@@ -193,7 +204,7 @@ def manage_quiz_questions(quiz_id):
             new_questions = list(set(current_questions + question_ids))
             result = quizzes_collection.update_one(
                 {"quiz_id": quiz_id},
-                {"$set": {"questions": new_questions}}
+                {"$set": {"questions": new_questions}, "$inc": {"paper_version": 1}}
             )
             message = f"Added {len(question_ids)} questions to quiz"
         elif action == 'remove':
@@ -201,13 +212,15 @@ def manage_quiz_questions(quiz_id):
             new_questions = [q for q in current_questions if q not in question_ids]
             result = quizzes_collection.update_one(
                 {"quiz_id": quiz_id},
-                {"$set": {"questions": new_questions}}
+                {"$set": {"questions": new_questions}, "$inc": {"paper_version": 1}}
             )
             message = f"Removed {len(question_ids)} questions from quiz"
         else:
             return jsonify({"success": False, "error": "Invalid action"}), 400
         
         if result.modified_count > 0:
+            active_quiz_resolver.invalidate()
+            
             return jsonify({
                 "success": True, 
                 "message": message,
@@ -295,6 +308,9 @@ def manage_quiz_participants(quiz_id):
         print(f"Update result - matched: {result.matched_count}, modified: {result.modified_count}")
         
         if result.matched_count > 0:
+            active_quiz_resolver.invalidate()
+            enrollment_index.invalidate(quiz_id)
+            
             log_activity(
                 f"participants_{action}ed",
                 f"{action.capitalize()}ed {len(scholar_ids)} participants from quiz: {quiz['title']}",
@@ -331,6 +347,9 @@ def handle_all_participants(quiz_id):
                 {"$set": {"participants": ["all"]}}
             )
             if result.modified_count > 0:
+                active_quiz_resolver.invalidate()
+                enrollment_index.invalidate(quiz_id)
+                
                 log_activity(
                     "all_participants_added",
                     f"Enrolled all students in quiz: {quiz['title']}",
@@ -347,6 +366,9 @@ def handle_all_participants(quiz_id):
                 {"$set": {"participants": []}}
             )
             if result.modified_count > 0:
+                active_quiz_resolver.invalidate()
+                enrollment_index.invalidate(quiz_id)
+                
                 # Also clean up quiz_participants collection
                 quiz_participants_collection.delete_many({"quiz_id": quiz_id})
                 
@@ -379,13 +401,19 @@ def update_quiz_status(quiz_id):
             return jsonify({"success": False, "error": "Quiz not found"}), 404
         
         if action == 'start':
-            # Activate the quiz
-            result = quizzes_collection.update_one(
+            # Activate the quiz under a new paper version
+            started_quiz = quizzes_collection.find_one_and_update(
                 {"quiz_id": quiz_id},
-                {"$set": {"status": "active", "started_at": datetime.now()}}
+                {"$set": {"status": "active", "started_at": datetime.now()}, "$inc": {"paper_version": 1}},
+                return_document=ReturnDocument.AFTER
             )
             
-            if result.modified_count > 0:
+            if started_quiz:
+                active_quiz_resolver.invalidate()
+                
+                # Build the answer-stripped paper once for every student of this quiz
+                paper_cache.build_for_quiz(started_quiz)
+                
                 # Determine which course/semester to activate questions for
                 target_course = quiz['course']
                 target_semester = quiz['semester']
@@ -437,6 +465,8 @@ def update_quiz_status(quiz_id):
             )
             
             if result.modified_count > 0:
+                active_quiz_resolver.invalidate()
+                
                 # Deactivate questions
                 target_course = quiz['course']
                 target_semester = quiz['semester']
@@ -491,17 +521,23 @@ def start_quiz_with_monitoring(quiz_id):
         if not quiz:
             return jsonify({"success": False, "error": "Quiz not found"}), 404
         
-        # Activate the quiz with AI monitoring
-        result = quizzes_collection.update_one(
+        # Activate the quiz with AI monitoring under a new paper version
+        started_quiz = quizzes_collection.find_one_and_update(
             {"quiz_id": quiz_id},
             {"$set": {
                 "status": "active", 
                 "started_at": datetime.now(),
                 "ai_monitoring": True
-            }}
+            }, "$inc": {"paper_version": 1}},
+            return_document=ReturnDocument.AFTER
         )
         
-        if result.modified_count > 0:
+        if started_quiz:
+            active_quiz_resolver.invalidate()
+            
+            # Build the answer-stripped paper once for every student of this quiz
+            paper_cache.build_for_quiz(started_quiz)
+            
             # Activate questions
             target_course = quiz['course']
             target_semester = quiz['semester']
@@ -553,37 +589,29 @@ def start_quiz_with_monitoring(quiz_id):
         print(f"Error in start_quiz_with_monitoring: {str(e)}")
         return jsonify({"success": False, "error": str(e)}), 500
 
+def quiz_audience(quiz):
+    """Broadcast audience of a quiz: its course/semester (None for "all")
+    or its explicit participant list"""
+    if quiz.get('participants') and 'all' in quiz.get('participants', []):
+        return {
+            "course": None if quiz['course'] == "all" else quiz['course'],
+            "semester": None if quiz['semester'] == "all" else quiz['semester']
+        }
+    return {"scholar_ids": quiz.get('participants', [])}
+
 def notify_quiz_start(quiz):
-    """Notify students when quiz starts"""
+    """Notify students when quiz starts (one broadcast for the whole audience)"""
     try:
-        target_course = quiz['course']
-        target_semester = quiz['semester']
-        
-        # Build query based on quiz scope
-        if quiz.get('participants') and 'all' in quiz.get('participants', []):
-            if target_course == "all" and target_semester == "all":
-                students = users_collection.find({})
-            elif target_course == "all":
-                students = users_collection.find({"semester": target_semester})
-            elif target_semester == "all":
-                students = users_collection.find({"course": target_course})
-            else:
-                students = users_collection.find({
-                    "course": target_course,
-                    "semester": target_semester
-                })
-        else:
-            students = users_collection.find({
-                "scholar_id": {"$in": quiz.get('participants', [])}
-            })
-        
-        for student in students:
-            create_notification(
-                student['scholar_id'],
-                "Quiz Started",
-                f"A new quiz '{quiz['title']}' has started. You can now take the quiz.",
-                "info"
-            )
+        audience = quiz_audience(quiz)
+        if audience.get('scholar_ids') == []:
+            return
+        
+        create_broadcast_notification(
+            "Quiz Started",
+            f"A new quiz '{quiz['title']}' has started. You can now take the quiz.",
+            "info",
+            **audience
+        )
     
     except Exception as e:
         print(f"Error notifying students: {str(e)}")
@@ -591,38 +619,53 @@ def notify_quiz_start(quiz):
 def notify_quiz_start_with_monitoring(quiz):
     """Notify students when quiz starts with AI monitoring"""
     try:
-        target_course = quiz['course']
-        target_semester = quiz['semester']
-        
-        # Build query based on quiz scope
-        if quiz.get('participants') and 'all' in quiz.get('participants', []):
-            if target_course == "all" and target_semester == "all":
-                students = users_collection.find({})
-            elif target_course == "all":
-                students = users_collection.find({"semester": target_semester})
-            elif target_semester == "all":
-                students = users_collection.find({"course": target_course})
-            else:
-                students = users_collection.find({
-                    "course": target_course,
-                    "semester": target_semester
-                })
-        else:
-            students = users_collection.find({
-                "scholar_id": {"$in": quiz.get('participants', [])}
-            })
-        
-        for student in students:
-            create_notification(
-                student['scholar_id'],
-                "Quiz Started with AI Monitoring",
-                f"A new quiz '{quiz['title']}' has started with AI-powered monitoring. Please ensure you have camera access.",
-                "warning"
-            )
+        audience = quiz_audience(quiz)
+        if audience.get('scholar_ids') == []:
+            return
+        
+        create_broadcast_notification(
+            "Quiz Started with AI Monitoring",
+            f"A new quiz '{quiz['title']}' has started with AI-powered monitoring. Please ensure you have camera access.",
+            "warning",
+            **audience
+        )
     
     except Exception as e:
         print(f"Error notifying students: {str(e)}")
 
+@quizzes_bp.route('/api/<quiz_id>/report')
+@login_required
+@permission_required('read')
+def quiz_report(quiz_id):
+    """Score distribution report of a quiz, optionally with item analysis"""
+    try:
+        report = quiz_report_service.get_report(quiz_id)
+        if report is None:
+            return jsonify({"success": False, "error": "Quiz not found"}), 404
+        
+        response = {"success": True, "report": report}
+        if request.args.get('items') in ('1', 'true'):
+            response["item_analysis"] = item_analysis_service.get_report(quiz_id)
+        return jsonify(response)
+    
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@quizzes_bp.route('/api/<quiz_id>/live')
+@login_required
+@permission_required('read')
+def quiz_live_board(quiz_id):
+    """Live standings and attempt progress of a running quiz"""
+    try:
+        if not quizzes_collection.find_one({"quiz_id": quiz_id}, {'_id': 1}):
+            return jsonify({"success": False, "error": "Quiz not found"}), 404
+        
+        limit = min(max(request.args.get('limit', 10, type=int), 1), 100)
+        return jsonify({"success": True, **live_board_service.get_board(quiz_id, limit)})
+    
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
 @quizzes_bp.route('/api/<quiz_id>', methods=['DELETE'])
 @login_required
 @permission_required('delete')
@@ -631,9 +674,22 @@ def delete_quiz(quiz_id):
     try:
         result = quizzes_collection.delete_one({"quiz_id": quiz_id})
         if result.deleted_count > 0:
+            active_quiz_resolver.invalidate()
+            enrollment_index.invalidate(quiz_id)
+            
             # Clean up related data
             quiz_participants_collection.delete_many({"quiz_id": quiz_id})
+            published_results = list(results_collection.find(
+                {"quiz_id": quiz_id, "published": True},
+                {'_id': 0, 'scholar_id': 1, 'published': 1, 'timestamp': 1, 'course': 1, 'semester': 1}
+            ))
             results_collection.delete_many({"quiz_id": quiz_id})
+            leaderboard_service.refresh_for_results(published_results)
+            student_stats_service.rebuild(result['scholar_id'] for result in published_results)
+            dashboard_stats_snapshot.invalidate()
+            quiz_report_service.invalidate([quiz_id])
+            score_percentile_index.invalidate([quiz_id])
+            live_board_service.invalidate([quiz_id])
             
             log_activity(
                 "quiz_deleted",
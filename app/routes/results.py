@@ -1,173 +1,66 @@
-from flask import Blueprint, render_template, request, session, jsonify, send_file
+from flask import Blueprint, render_template, request, session, jsonify, send_file, Response, stream_with_context
 from app.utils.decorators import login_required, permission_required
 from app.utils.helpers import get_all_schools, get_all_departments, get_all_courses, get_all_semesters, create_notification, create_admin_notification, log_activity
+from app.utils.taxonomy import course_info
 from app.models.quiz_models import results_collection, quizzes_collection
 from app.models.user_models import users_collection
-import pandas as pd
-from io import BytesIO
+from app.services.user_name_cache import user_name_cache
+from app.utils.export import iter_csv, write_xlsx
+from app.utils.results_query import ResultsQuery
+from app.services.leaderboard_service import leaderboard_service
+from app.services.student_stats import student_stats_service
+from app.services.dashboard_stats import dashboard_stats_snapshot
+from app.services.quiz_report import quiz_report_service
+from app.services.score_percentiles import score_percentile_index
 from datetime import datetime, timedelta
+import uuid
 
 results_bp = Blueprint('results', __name__)
 
-# Course to School/Department mapping
-COURSE_MAPPING = {
-    "Bachelor of Computer Application (Honors)": {
-        "school": "School of Technology, Communication and Management",
-        "department": "Department of Computer Sciences"
-    },
-    "Master of Computer Application (Data Science)": {
-        "school": "School of Technology, Communication and Management", 
-        "department": "Department of Computer Sciences"
-    },
-    "B.Sc. Information Technology (Honors)": {
-        "school": "School of Technology, Communication and Management",
-        "department": "Department of Computer Sciences"
-    },
-    "B.B.A Tourism & Travel Management (Honors)": {
-        "school": "School of Technology, Communication and Management",
-        "department": "Department of Tourism Management"
-    },
-    "M.B.A. Tourism & Travel Management": {
-        "school": "School of Technology, Communication and Management",
-        "department": "Department of Tourism Management"
-    },
-    "B.A. Journalism and Mass Communication (Honors)": {
-        "school": "School of Technology, Communication and Management",
-        "department": "Department of Journalism & Mass Communication"
-    },
-    "M. A. Journalism and Mass Communication": {
-        "school": "School of Technology, Communication and Management",
-        "department": "Department of Journalism & Mass Communication"
-    },
-    "M. A. Spiritual Journalism": {
-        "school": "School of Technology, Communication and Management",
-        "department": "Department of Journalism & Mass Communication"
-    },
-    "B.Voc. (Bachelor of Vocation) in 3D Animation and VFX (Honors)": {
-        "school": "School of Technology, Communication and Management",
-        "department": "Department of Animation and Visual Effects"
-    },
-    "Bachelor of Rural Studies (Honors)": {
-        "school": "School of Biological Sciences and Sustainability",
-        "department": "Department of Rural Studies and Sustainability"
-    },
-    "B.A. English (Honors)": {
-        "school": "School of Humanities, Social Sciences and Foundation Courses",
-        "department": "Department of English"
-    },
-    "B.Ed. (Bachelor of Education)": {
-        "school": "School of Humanities, Social Sciences and Foundation Courses",
-        "department": "Department of Education"
-    },
-    "B.A. Psychology (Honors)": {
-        "school": "School of Humanities, Social Sciences and Foundation Courses",
-        "department": "Department of Psychology"
-    },
-    "M.A. Counselling Psychology": {
-        "school": "School of Humanities, Social Sciences and Foundation Courses",
-        "department": "Department of Psychology"
-    },
-    "M.Sc. Counselling Psychology": {
-        "school": "School of Humanities, Social Sciences and Foundation Courses",
-        "department": "Department of Psychology"
-    },
-    "Life Management - Compulsory Program for PG and UG": {
-        "school": "School of Humanities, Social Sciences and Foundation Courses",
-        "department": "Department of Life Management"
-    },
-    "M.Sc. Herbal Medicine and Natural Product Chemistry": {
-        "school": "School of Humanities, Social Sciences and Foundation Courses",
-        "department": "Department of Scientific Spirituality"
-    },
-    "M.Sc. Molecular Physiology and Traditional Health Sciences": {
-        "school": "School of Humanities, Social Sciences and Foundation Courses",
-        "department": "Department of Scientific Spirituality"
-    },
-    "M.Sc. Indigenous Approaches for Child Development & Generational Dynamics": {
-        "school": "School of Humanities, Social Sciences and Foundation Courses",
-        "department": "Department of Scientific Spirituality"
-    },
-    "M.Sc. Indian Knowledge Systems": {
-        "school": "School of Humanities, Social Sciences and Foundation Courses",
-        "department": "Department of Scientific Spirituality"
-    },
-    "M.A. Indian Knowledge Systems": {
-        "school": "School of Humanities, Social Sciences and Foundation Courses",
-        "department": "Department of Scientific Spirituality"
-    },
-    "M.A. Hindu Studies": {
-        "school": "School of Humanities, Social Sciences and Foundation Courses",
-        "department": "Department of Oriental Studies, Religious Studies & Philosophy"
-    },
-    "M.A. Philosophy": {
-        "school": "School of Humanities, Social Sciences and Foundation Courses",
-        "department": "Department of Oriental Studies, Religious Studies & Philosophy"
-    },
-    "B.Sc. Yogic Science (Honors)": {
-        "school": "School of Humanities, Social Sciences and Foundation Courses",
-        "department": "Department of Yogic Sciences and Human Consciousness"
-    },
-    "M.Sc. Yoga Therapy": {
-        "school": "School of Humanities, Social Sciences and Foundation Courses",
-        "department": "Department of Yogic Sciences and Human Consciousness"
-    },
-    "M.A. Human Consciousness & Yogic Science": {
-        "school": "School of Humanities, Social Sciences and Foundation Courses",
-        "department": "Department of Yogic Sciences and Human Consciousness"
-    },
-    "M.Sc. Human Consciousness & Yogic Science": {
-        "school": "School of Humanities, Social Sciences and Foundation Courses",
-        "department": "Department of Yogic Sciences and Human Consciousness"
-    },
-    "P. G. Diploma Human Consciousness, Yoga & Alternative Therapy": {
-        "school": "School of Humanities, Social Sciences and Foundation Courses",
-        "department": "Department of Yogic Sciences and Human Consciousness"
-    },
-    "Certificate In Yoga And Alternative Therapy": {
-        "school": "School of Humanities, Social Sciences and Foundation Courses",
-        "department": "Department of Yogic Sciences and Human Consciousness"
-    },
-    "B.A. Sanskrit (Honors)": {
-        "school": "School of Indology",
-        "department": "Department of Sanskrit and Vedic Studies"
-    },
-    "M.A. Sanskrit": {
-        "school": "School of Indology",
-        "department": "Department of Sanskrit and Vedic Studies"
-    },
-    "B.A. Hindi (Honors)": {
-        "school": "School of Indology",
-        "department": "Department of Hindi"
-    },
-    "M.A. Hindi": {
-        "school": "School of Indology",
-        "department": "Department of Hindi"
-    },
-    "B.A. Music (Vocal) (Honors)": {
-        "school": "School of Indology",
-        "department": "Department of Indian Classical Music"
-    },
-    "M.A. Music (Vocal)": {
-        "school": "School of Indology",
-        "department": "Department of Indian Classical Music"
-    },
-    "B.A. Music Instrumental Mridang/Tabla (Honors)": {
-        "school": "School of Indology",
-        "department": "Department of Indian Classical Music"
-    },
-    "M.A. Music (Tabla, Pakhaawaj)": {
-        "school": "School of Indology",
-        "department": "Department of Indian Classical Music"
-    },
-    "B.A. History (Honors)": {
-        "school": "School of Indology",
-        "department": "Department of History and Indian Culture"
-    },
-    "M. A. History and Indian Culture": {
-        "school": "School of Indology",
-        "department": "Department of History and Indian Culture"
-    }
-}
+# Columns of the results export, in order
+EXPORT_COLUMNS = [
+    'scholar_id', 'user_name', 'school', 'department', 'course', 'semester',
+    'score', 'total', 'completion_time', 'late_submission', 'timestamp',
+    'quiz_id', 'workspace_id', 'published'
+]
+# Results read from the cursor (and names resolved) per batch
+EXPORT_BATCH_SIZE = 1000
+
+def iter_export_rows(query):
+    """Yield export rows for the results matching ``query``, reading the
+    cursor and resolving user names one batch at a time"""
+    cursor = results_collection.find(query, {'_id': 0}).batch_size(EXPORT_BATCH_SIZE)
+    try:
+        batch = []
+        for result in cursor:
+            batch.append(result)
+            if len(batch) >= EXPORT_BATCH_SIZE:
+                yield from build_export_rows(batch)
+                batch = []
+        if batch:
+            yield from build_export_rows(batch)
+    finally:
+        cursor.close()
+
+def fill_student_fields(results):
+    """Fill in user names and school/department missing from (legacy)
+    results; the ones stored at submission are kept"""
+    missing_names = [result['scholar_id'] for result in results if not result.get('user_name')]
+    user_names = user_name_cache.get_names(missing_names) if missing_names else {}
+    for result in results:
+        if not result.get('user_name'):
+            result['user_name'] = user_names[result['scholar_id']]
+        
+        if not result.get('school') or not result.get('department'):
+            mapping = course_info(result.get('course')) or {}
+            result['school'] = result.get('school') or mapping.get('school')
+            result['department'] = result.get('department') or mapping.get('department')
+    return results
+
+def build_export_rows(results):
+    """Export rows of a batch of results"""
+    for result in fill_student_fields(results):
+        yield [result.get(column) for column in EXPORT_COLUMNS]
 
 @results_bp.route('/')
 @login_required
@@ -180,87 +73,28 @@ def admin_results():
     semester = request.args.get('semester', '')
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 10, type=int)
+    after = request.args.get('after')
+    before = request.args.get('before')
     
     # Start with published results only
-    query = {}
-    
-    # Add filters only if they are provided and not empty
-    if school and school != 'All' and school != '':
-        # Find courses that belong to this school
-        school_courses = [course_name for course_name, mapping in COURSE_MAPPING.items() 
-                         if mapping['school'] == school]
-        query['course'] = {'$in': school_courses}
-    
-    if department and department != 'All' and department != '':
-        # Find courses that belong to this department
-        dept_courses = [course_name for course_name, mapping in COURSE_MAPPING.items() 
-                       if mapping['department'] == department]
-        if 'course' in query:
-            # Combine with existing course filter
-            existing_courses = query['course']['$in']
-            filtered_courses = [c for c in existing_courses if c in dept_courses]
-            if filtered_courses:
-                query['course']['$in'] = filtered_courses
-            else:
-                # No overlap, return empty results
-                query['course']['$in'] = []
-        else:
-            query['course'] = {'$in': dept_courses}
+    results_query = ResultsQuery(school, department, course, semester)
     
-    if course and course != 'All' and course != '':
-        if 'course' in query and isinstance(query['course'], dict):
-            # Filter existing course list
-            existing_courses = query['course']['$in']
-            if course in existing_courses:
-                query['course'] = course
-            else:
-                # Course not in filtered list, return empty
-                query['course'] = {'$in': []}
-        else:
-            query['course'] = course
+    print(f"Final query: {results_query.query}")  # Debug print
     
-    if semester and semester != 'All' and semester != '':
-        query['semester'] = semester
-    
-    print(f"Final query: {query}")  # Debug print
-    
-    # Calculate pagination
-    total_results = results_collection.count_documents(query)
+    # Page (keyset on timestamp, _id, newest first); the total and the unique
+    # students and average score ($facet) are cached per filter
+    listing = results_query.read_page(
+        results_collection, per_page, page=page, after=after, before=before, projection={'_id': 0}
+    )
+    results = listing['items']
+    next_cursor, prev_cursor = listing['next_cursor'], listing['prev_cursor']
+    total_results = listing['total']
+    total_students = listing['total_students']
+    average_score = listing['average_score']
     total_pages = (total_results + per_page - 1) // per_page
-    skip = (page - 1) * per_page
-    
-    # Get results with pagination
-    results = list(results_collection.find(query, {'_id': 0}).sort('timestamp', -1).skip(skip).limit(per_page))
-    
-    # Add user names to results
-    for result in results:
-        user = users_collection.find_one({'scholar_id': result['scholar_id']}, {'_id': 0, 'name': 1})
-        result['user_name'] = user['name'] if user else 'Unknown'
-        
-        # Add school and department info for display
-        if result['course'] in COURSE_MAPPING:
-            mapping = COURSE_MAPPING[result['course']]
-            result['school'] = mapping['school']
-            result['department'] = mapping['department']
-    
-    # Get unique students count for published results with same filters
-    pipeline = [
-        {"$match": query},
-        {"$group": {"_id": "$scholar_id"}},
-        {"$count": "total_students"}
-    ]
     
-    student_count_result = list(results_collection.aggregate(pipeline))
-    total_students = student_count_result[0]['total_students'] if student_count_result else 0
-    
-    # Calculate average score for filtered published results
-    avg_score_pipeline = [
-        {"$match": query},
-        {"$group": {"_id": None, "avg_score": {"$avg": "$score"}}}
-    ]
-    
-    avg_score_result = list(results_collection.aggregate(avg_score_pipeline))
-    average_score = avg_score_result[0]['avg_score'] if avg_score_result else 0
+    # Results carry the student's name, school and department; legacy ones are filled in
+    fill_student_fields(results)
     
     stats = {
         'total_quizzes': total_results,
@@ -283,66 +117,38 @@ def admin_results():
                          selected_course=course, 
                          selected_semester=semester,
                          current_page=page,
-                         per_page=per_page)
+                         per_page=per_page,
+                         next_cursor=next_cursor,
+                         prev_cursor=prev_cursor)
 
 @results_bp.route('/export_results', methods=['GET'])
 @login_required
 def export_results():
-    """Export published results to CSV"""
-    school = request.args.get('school', '')
-    department = request.args.get('department', '')
-    course = request.args.get('course', '')
-    semester = request.args.get('semester', '')
-    
-    # Start with published results only
-    query = {"published": True}
-    
-    # Apply same filtering logic as main route
-    if school and school != 'All' and school != '':
-        school_courses = [course_name for course_name, mapping in COURSE_MAPPING.items() 
-                         if mapping['school'] == school]
-        query['course'] = {'$in': school_courses}
+    """Export published results as streamed CSV (optionally gzipped) or XLSX"""
+    query = ResultsQuery.from_args(request.args, published_only=True).query
     
-    if department and department != 'All' and department != '':
-        dept_courses = [course_name for course_name, mapping in COURSE_MAPPING.items() 
-                       if mapping['department'] == department]
-        if 'course' in query:
-            existing_courses = query['course']['$in']
-            filtered_courses = [c for c in existing_courses if c in dept_courses]
-            query['course']['$in'] = filtered_courses if filtered_courses else []
-        else:
-            query['course'] = {'$in': dept_courses}
+    export_format = request.args.get('format', 'csv')
     
-    if course and course != 'All' and course != '':
-        if 'course' in query and isinstance(query['course'], dict):
-            existing_courses = query['course']['$in']
-            if course in existing_courses:
-                query['course'] = course
-            else:
-                query['course'] = {'$in': []}
-        else:
-            query['course'] = course
-    
-    if semester and semester != 'All' and semester != '':
-        query['semester'] = semester
-    
-    results = list(results_collection.find(query, {'_id': 0}))
-    
-    # Add user names and school/department info for export
-    for result in results:
-        user = users_collection.find_one({'scholar_id': result['scholar_id']}, {'_id': 0, 'name': 1})
-        result['user_name'] = user['name'] if user else 'Unknown'
-        
-        if result['course'] in COURSE_MAPPING:
-            mapping = COURSE_MAPPING[result['course']]
-            result['school'] = mapping['school']
-            result['department'] = mapping['department']
+    if export_format == 'xlsx':
+        try:
+            output = write_xlsx(EXPORT_COLUMNS, iter_export_rows(query), 'Results')
+        except ImportError:
+            return jsonify({"error": "XLSX export requires the XlsxWriter package"}), 400
+        return send_file(
+            output,
+            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+            as_attachment=True,
+            download_name='published_quiz_results.xlsx'
+        )
     
-    df = pd.DataFrame(results)
-    output = BytesIO()
-    df.to_csv(output, index=False)
-    output.seek(0)
-    return send_file(output, mimetype='text/csv', as_attachment=True, download_name='published_quiz_results.csv')
+    # CSV is streamed while the cursor is read, optionally gzip-compressed
+    compress = request.args.get('gzip') in ('1', 'true')
+    filename = 'published_quiz_results.csv.gz' if compress else 'published_quiz_results.csv'
+    return Response(
+        stream_with_context(iter_csv(EXPORT_COLUMNS, iter_export_rows(query), compress)),
+        mimetype='application/gzip' if compress else 'text/csv',
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
 
 @results_bp.route('/publish_results', methods=['POST'])
 @login_required
@@ -352,12 +158,21 @@ def publish_results():
     if not workspace_id:
         return jsonify({"error": "Workspace ID is required"}), 400
     
+    # Tag the results this call publishes so exactly those reach the leaderboards
+    publish_id = str(uuid.uuid4())
     result = results_collection.update_many(
-        {"workspace_id": workspace_id},
-        {"$set": {"published": True}}
+        {"workspace_id": workspace_id, "published": {"$ne": True}},
+        {"$set": {"published": True, "published_at": datetime.now(), "publish_id": publish_id}}
     )
     
     if result.modified_count > 0:
+        newly_published = list(results_collection.find({"publish_id": publish_id}))
+        leaderboard_service.add_published(newly_published)
+        student_stats_service.add_published(newly_published)
+        dashboard_stats_snapshot.invalidate()
+        quiz_report_service.invalidate({result.get('quiz_id') for result in newly_published})
+        score_percentile_index.invalidate({result.get('quiz_id') for result in newly_published})
+        
         published_result = results_collection.find_one({"workspace_id": workspace_id})
         if published_result:
             create_notification(
@@ -405,19 +220,24 @@ def bulk_publish_results():
         
         print(f"Attempting to publish {len(workspace_ids)} results: {workspace_ids}")
         
-        # Use a different variable name for the update result
+        # Use a different variable name for the update result; the publish_id
+        # tags exactly the results this call publishes
+        publish_id = str(uuid.uuid4())
         update_result = results_collection.update_many(
-            {"workspace_id": {"$in": workspace_ids}},
-            {"$set": {"published": True}}
+            {"workspace_id": {"$in": workspace_ids}, "published": {"$ne": True}},
+            {"$set": {"published": True, "published_at": datetime.now(), "publish_id": publish_id}}
         )
         
         print(f"Modified count: {update_result.modified_count}")
         
         if update_result.modified_count > 0:
-            # Create notifications for all published results
-            published_results = list(results_collection.find(
-                {"workspace_id": {"$in": workspace_ids}}
-            ))
+            # Create notifications for the newly published results
+            published_results = list(results_collection.find({"publish_id": publish_id}))
+            leaderboard_service.add_published(published_results)
+            student_stats_service.add_published(published_results)
+            dashboard_stats_snapshot.invalidate()
+            quiz_report_service.invalidate({result.get('quiz_id') for result in published_results})
+            score_percentile_index.invalidate({result.get('quiz_id') for result in published_results})
             
             for result_doc in published_results:
                 create_notification(
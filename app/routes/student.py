@@ -1,17 +1,76 @@
-from flask import Blueprint, render_template, request, session, redirect, url_for, flash, jsonify
+from flask import Blueprint, render_template, request, session, redirect, url_for, flash, jsonify, current_app
 from app.utils.decorators import login_required
-from app.utils.helpers import get_user_stats, is_quiz_active, find_active_quiz, check_student_enrollment, create_notification, create_admin_notification, log_activity
+from app.utils.helpers import get_user_stats, is_quiz_active, find_active_quiz, check_student_enrollment, create_notification, create_admin_notification, log_activity, queue_admin_notification, queue_activity, sync_result_student_fields
 from app.models.user_models import users_collection, user_sessions_collection
 from app.models.quiz_models import results_collection, quizzes_collection
 from app.models.question_models import question_bank_collection, questions_collection
 from app.models.feedback_models import feedback_collection
-from datetime import datetime
+from app.services.attempt_store import attempt_store
+from app.services.paper_cache import paper_cache
+from app.services.user_name_cache import user_name_cache
+from app.services.score_percentiles import score_percentile_index
+from app.services.live_board import live_board_service
+from app.utils.taxonomy import course_info, academic_codes
+from datetime import datetime, timedelta
+from pymongo.errors import DuplicateKeyError
 import random
 import uuid
 import time
 
 student_bp = Blueprint('student', __name__)
 
+# Upper bound on the number of answer deltas accepted in one batch
+MAX_ANSWER_BATCH = 500
+
+def get_current_attempt():
+    """Get the attempt referenced by the session, if it belongs to this student"""
+    attempt = attempt_store.get(session.get('attempt_id'))
+    if not attempt or attempt['scholar_id'] != session.get('scholar_id'):
+        return None
+    return attempt
+
+def strip_answer(question):
+    """Copy of a question document without its answer key"""
+    return {k: v for k, v in question.items() if k != 'correct_answer'}
+
+def get_attempt_user_name(attempt):
+    """Student name stored on the attempt (looked up for older attempts)"""
+    if attempt.get('user_name'):
+        return attempt['user_name']
+    user = users_collection.find_one({'scholar_id': attempt['scholar_id']}, {'name': 1})
+    return user['name'] if user else 'Unknown'
+
+def get_attempt_student_fields(attempt):
+    """Student attributes copied onto the result so leaderboards need no join"""
+    school, department = attempt.get('school'), attempt.get('department')
+    if not school or not department:
+        mapping = course_info(attempt['course']) or {}
+        school = school or mapping.get('school')
+        department = department or mapping.get('department')
+    return {
+        "user_name": get_attempt_user_name(attempt),
+        "school": school,
+        "department": department,
+        **academic_codes(school, department, attempt['course'])
+    }
+
+def get_attempt_deadline(attempt):
+    """Absolute quiz deadline (epoch seconds) for an attempt"""
+    deadline = attempt.get('deadline') or attempt['started_at'] + timedelta(seconds=attempt.get('duration', 600))
+    return deadline.timestamp()
+
+def is_past_deadline(deadline=None):
+    """Check whether the deadline plus the configured grace period has passed.
+
+    The deadline is read from the signed session cookie, so this check
+    needs no database access.
+    """
+    if deadline is None:
+        deadline = session.get('quiz_deadline')
+    if deadline is None:
+        return False
+    return time.time() > deadline + current_app.config.get('QUIZ_DEADLINE_GRACE_SECONDS', 30)
+
 @student_bp.route('/student_dashboard', methods=['GET', 'POST'])
 @login_required
 def student_dashboard():
@@ -134,7 +193,7 @@ def instructions():
 @login_required
 def quiz():
     """Quiz page for students"""
-    if 'questions' not in session:
+    if not get_current_attempt():
         return redirect(url_for('student.student_dashboard'))
     
     # Get quiz details to pass to template
@@ -147,9 +206,34 @@ def quiz():
 @login_required
 def get_questions():
     """Get questions for student quiz"""
-    if 'questions' not in session:
+    attempt = get_current_attempt()
+    if not attempt:
         return jsonify({"error": "No questions available"}), 400
-    return jsonify(session['questions'])
+    
+    # Shared quiz paper: serve the pre-serialized bytes in this attempt's order
+    paper = attempt_store.get_paper(attempt)
+    if paper is not None:
+        paper, order = paper
+        return current_app.response_class(paper.to_json(order), mimetype='application/json')
+    
+    return jsonify([strip_answer(q) for q in attempt_store.get_questions(attempt)])
+
+def begin_attempt(attempt, quiz_id):
+    """Point the session at an attempt and issue its absolute deadline once;
+    the client counts down locally"""
+    deadline = get_attempt_deadline(attempt)
+    session['attempt_id'] = attempt['attempt_id']
+    session['quiz_id'] = quiz_id  # Ensure quiz_id is set
+    session['quiz_duration'] = attempt['duration']
+    session['quiz_deadline'] = deadline
+    
+    return jsonify({
+        "success": True, 
+        "redirect": url_for('student.quiz'),
+        "quiz_id": quiz_id,
+        "deadline": int(deadline * 1000),
+        "server_time": int(time.time() * 1000)
+    })
 
 @student_bp.route('/start_quiz', methods=['POST'])
 @login_required
@@ -182,16 +266,23 @@ def start_quiz():
         if existing_result:
             return jsonify({"error": "You have already attempted this quiz. You cannot re-attempt."}), 400
         
+        # Starting again resumes the open attempt, so its deadline can't be reset
+        attempt = attempt_store.find_open(session['scholar_id'], active_quiz['quiz_id'])
+        if attempt:
+            return begin_attempt(attempt, active_quiz['quiz_id'])
+        
         # Get questions from the active quiz's question list
+        paper = None
         if active_quiz and 'questions' in active_quiz and active_quiz['questions']:
-            # Get questions from the question bank using the IDs stored in the quiz
-            question_ids = active_quiz['questions']
-            questions = list(question_bank_collection.find({
-                "question_id": {"$in": question_ids}
-            }, {'_id': 0}))
-            
-            # Shuffle questions to prevent cheating, but keep options in original order
-            random.shuffle(questions)
+            # Use the quiz's precompiled paper; each attempt only gets its own
+            # shuffle of it (options keep their original order)
+            paper = paper_cache.get(
+                active_quiz['quiz_id'],
+                active_quiz.get('paper_version', 0),
+                active_quiz['questions']
+            )
+            questions = paper.questions
+            question_source = 'question_bank'
             
         else:
             # Fallback to old system
@@ -201,16 +292,11 @@ def start_quiz():
                 "active": True
             }, {'_id': 0}))
             random.shuffle(questions)  # Only shuffle questions, not options
+            question_source = 'questions'
         
         if not questions:
             return jsonify({"error": "No active questions available"}), 400
         
-        session['questions'] = questions
-        session['current_question'] = 0
-        session['answers'] = {}
-        session['quiz_start_time'] = datetime.now().isoformat()
-        session['quiz_id'] = active_quiz['quiz_id']  # Ensure quiz_id is set
-        
         # Get duration from quiz document and handle both formats
         duration = active_quiz.get('duration', 600)
         
@@ -219,15 +305,26 @@ def start_quiz():
             duration = duration * 60
             print(f"Converted duration from {duration//60} minutes to {duration} seconds")
         
-        session['quiz_duration'] = duration
+        # Keep the paper and answers server-side; the cookie only carries the attempt id
+        attempt = attempt_store.create(
+            scholar_id=session['scholar_id'],
+            quiz_id=active_quiz['quiz_id'],
+            paper=paper,
+            questions=None if paper is not None else questions,
+            question_source=question_source,
+            course=course,
+            semester=semester,
+            duration=duration,
+            workspace_id=session.get('workspace'),
+            user_name=user.get('name') if user else None,
+            school=user.get('school') if user else None,
+            department=user.get('department') if user else None
+        )
+        live_board_service.record_start(attempt)
         
         print(f"Quiz started with {len(questions)} questions, duration: {duration} seconds ({duration//60} minutes), quiz_id: {active_quiz['quiz_id']}")
         
-        return jsonify({
-            "success": True, 
-            "redirect": url_for('student.quiz'),
-            "quiz_id": active_quiz['quiz_id']
-        })
+        return begin_attempt(attempt, active_quiz['quiz_id'])
         
     except Exception as e:
         print(f"Error in start_quiz: {str(e)}")
@@ -246,101 +343,179 @@ def submit_answer():
     if answer is None or question_index is None:
         return jsonify({"error": "No answer or question index provided"}), 400
     
-    if 'answers' not in session:
-        session['answers'] = {}
+    if is_past_deadline():
+        return jsonify({"error": "Time is up. Answers are no longer accepted.", "late": True}), 409
+    
+    attempt = get_current_attempt()
+    if not attempt:
+        return jsonify({"error": "No active quiz attempt"}), 400
+    
+    questions = attempt_store.get_questions(attempt)
+    if not isinstance(question_index, int) or not 0 <= question_index < len(questions):
+        return jsonify({"error": "Invalid question index"}), 400
     
-    session['answers'][str(question_index)] = answer
-    session.modified = True
+    if not attempt_store.record_answer(attempt['attempt_id'], question_index, answer):
+        return jsonify({"error": "Quiz attempt is already closed"}), 400
     
     print(f"Stored answer for question {question_index}: {answer}")
     
-    questions = session['questions']
-    if question_index < len(questions):
-        current_question = questions[question_index]
-        is_correct = answer == current_question['correct_answer']
-        
-        return jsonify({
-            "success": True, 
-            "is_correct": is_correct,
-            "correct_answer": current_question['correct_answer']
-        })
-    else:
-        return jsonify({"error": "Invalid question index"}), 400
+    current_question = questions[question_index]
+    is_correct = answer == current_question['correct_answer']
+    
+    return jsonify({
+        "success": True, 
+        "is_correct": is_correct,
+        "correct_answer": current_question['correct_answer']
+    })
+
+@student_bp.route('/api/submit_answers', methods=['POST'])
+@login_required
+def submit_answers():
+    """Submit a batch of answer deltas for the current attempt.
+
+    Each delta is ``{question_index, answer, client_seq}``. The whole batch is
+    applied as one atomic update on the attempt; deltas whose ``client_seq``
+    is not newer than the stored one are ignored, so retries are safe.
+    """
+    data = request.get_json(silent=True) or {}
+    deltas = data.get('answers')
+    
+    if not isinstance(deltas, list) or not deltas:
+        return jsonify({"error": "No answers provided"}), 400
+    
+    if len(deltas) > MAX_ANSWER_BATCH:
+        return jsonify({"error": f"At most {MAX_ANSWER_BATCH} answers can be submitted at once"}), 400
+    
+    if is_past_deadline():
+        return jsonify({"error": "Time is up. Answers are no longer accepted.", "late": True}), 409
+    
+    attempt = get_current_attempt()
+    if not attempt:
+        return jsonify({"error": "No active quiz attempt"}), 400
+    
+    questions = attempt_store.get_questions(attempt)
+    
+    # Keep only the newest delta per question
+    latest = {}
+    for delta in deltas:
+        if not isinstance(delta, dict):
+            return jsonify({"error": "Invalid answer format"}), 400
+        question_index = delta.get('question_index')
+        answer = delta.get('answer')
+        client_seq = delta.get('client_seq')
+        if (not isinstance(question_index, int) or not 0 <= question_index < len(questions)
+                or not isinstance(answer, str) or not isinstance(client_seq, int) or client_seq < 0):
+            return jsonify({"error": "Invalid answer format"}), 400
+        if question_index not in latest or client_seq > latest[question_index][1]:
+            latest[question_index] = (answer, client_seq)
+    
+    stored = attempt_store.apply_answers(attempt['attempt_id'], latest)
+    if stored is None:
+        return jsonify({"error": "Quiz attempt is already closed"}), 400
+    stored_answers, stored_seq = stored
+    
+    applied = []
+    ignored = []
+    results = {}
+    for question_index, (_, client_seq) in latest.items():
+        if stored_seq.get(str(question_index)) == client_seq:
+            applied.append(client_seq)
+        else:
+            ignored.append(client_seq)
+        correct_answer = questions[question_index]['correct_answer']
+        results[str(question_index)] = {
+            "is_correct": stored_answers.get(str(question_index)) == correct_answer,
+            "correct_answer": correct_answer
+        }
+    
+    return jsonify({
+        "success": True,
+        "applied": applied,
+        "ignored": ignored,
+        "results": results
+    })
+
+def build_attempt_result(attempt, answers):
+    """Result document of a closed attempt, graded from its final answers"""
+    now = datetime.now()
+    return {
+        "scholar_id": attempt['scholar_id'],
+        **get_attempt_student_fields(attempt),
+        "course": attempt['course'],
+        "semester": attempt['semester'],
+        "score": attempt_store.get_answer_key(attempt).score(answers),
+        "total": len(attempt_store.get_questions(attempt)),
+        "timestamp": now,
+        "workspace_id": attempt.get('workspace_id') or session.get('workspace'),
+        "published": False,
+        "completion_time": (now - attempt['started_at']).total_seconds(),
+        "quiz_id": attempt['quiz_id'],
+        "attempt_id": attempt['attempt_id'],
+        # The deadline is only enforced here; late submissions are kept but flagged
+        "late_submission": is_past_deadline(get_attempt_deadline(attempt)),
+        **attempt_store.get_responses(attempt, answers)
+    }
+
+def save_attempt_result(attempt, answers):
+    """Store the result of a closed attempt and put it on the live board.
+
+    Returns ``(result, saved)``; ``saved`` is False when the unique
+    (scholar_id, quiz_id) index rejected it as a duplicate submission.
+    """
+    quiz_data = build_attempt_result(attempt, answers)
+    try:
+        results_collection.insert_one(quiz_data)
+    except DuplicateKeyError:
+        return quiz_data, False
+    live_board_service.record_finish(quiz_data)
+    return quiz_data, True
 
 @student_bp.route('/api/next_question', methods=['POST'])
 @login_required
 def next_question():
     """Move to next question"""
-    session['current_question'] += 1
-    current_index = session['current_question']
-    questions = session['questions']
+    attempt = get_current_attempt()
+    if not attempt:
+        return jsonify({"error": "No active quiz attempt"}), 400
+    
+    current_index = attempt_store.advance(attempt['attempt_id'])
+    if current_index is None:
+        return jsonify({"error": "Quiz attempt is already closed"}), 400
+    
+    questions = attempt_store.get_questions(attempt)
     
     if current_index >= len(questions):
-        score = sum(1 for i, q in enumerate(questions) 
-                  if session['answers'].get(str(i)) == q['correct_answer'])
-        
-        results_collection.insert_one({
-            "scholar_id": session['scholar_id'],
-            "user_name": users_collection.find_one({'scholar_id': session['scholar_id']})['name'],
-            "course": session['course'],
-            "semester": session['semester'],
-            "score": score,
-            "total": len(questions),
-            "timestamp": datetime.now(),
-            "workspace_id": session.get('workspace'),
-            "published": False,
-            "completion_time": (datetime.now() - datetime.fromisoformat(session['quiz_start_time'])).total_seconds(),
-            "quiz_id": session.get('quiz_id')
-        })
+        answers = attempt_store.finish(attempt['attempt_id']) or {}
+        save_attempt_result(attempt, answers)
         
         return jsonify({"finished": True})
     
-    return jsonify(questions[current_index])
+    return jsonify(strip_answer(questions[current_index]))
 
 @student_bp.route('/api/finish_quiz', methods=['POST'])
 @login_required
 def finish_quiz():
     """Finish quiz and calculate results"""
     try:
-        if 'questions' not in session:
+        attempt = get_current_attempt()
+        if not attempt:
             return jsonify({"error": "No questions available"}), 400
         
-        questions = session['questions']
-        answers = session.get('answers', {})
-        
-        score = 0
-        for i, question in enumerate(questions):
-            answer_key = str(i)
-            if answer_key in answers and answers[answer_key] == question['correct_answer']:
-                score += 1
+        questions = attempt_store.get_questions(attempt)
+        # Closing the attempt also returns its final answers
+        answers = attempt_store.finish(attempt['attempt_id'])
+        if answers is None:
+            return jsonify({"error": "No questions available"}), 400
         
-        user = users_collection.find_one({'scholar_id': session['scholar_id']})
-        user_name = user['name'] if user else 'Unknown'
+        quiz_data, saved = save_attempt_result(attempt, answers)
+        score = quiz_data['score']
+        user_name = quiz_data['user_name']
         
-        quiz_start = datetime.fromisoformat(session['quiz_start_time'])
-        completion_time = (datetime.now() - quiz_start).total_seconds()
+        session_keys = ['attempt_id', 'course', 'semester', 'quiz_duration', 'quiz_deadline', 'quiz_id']
         
-        quiz_data = {
-            "scholar_id": session['scholar_id'],
-            "user_name": user_name,
-            "course": session.get('course', ''),
-            "semester": session.get('semester', ''),
-            "score": score,
-            "total": len(questions),
-            "timestamp": datetime.now(),
-            "workspace_id": session.get('workspace'),
-            "published": False,
-            "completion_time": completion_time,
-            "quiz_id": session.get('quiz_id')
-        }
-        
-        # Check if result already exists (prevent duplicate submissions)
-        existing_result = results_collection.find_one({
-            "scholar_id": session['scholar_id'],
-            "quiz_id": session.get('quiz_id')
-        })
-        
-        if existing_result:
+        if not saved:
+            for key in session_keys:
+                session.pop(key, None)
             return jsonify({
                 "success": True,
                 "score": score,
@@ -349,9 +524,7 @@ def finish_quiz():
                 "message": "Quiz already submitted"
             })
         
-        results_collection.insert_one(quiz_data)
-        
-        create_admin_notification(
+        queue_admin_notification(
             "Quiz Completed",
             f"{user_name} ({session['scholar_id']}) has completed the {session.get('course', '')} Semester {session.get('semester', '')} quiz with score {score}/{len(questions)}",
             "success",
@@ -360,7 +533,7 @@ def finish_quiz():
             session.get('semester', '')
         )
         
-        log_activity(
+        queue_activity(
             "quiz_completed",
             f"{user_name} completed {session.get('course', '')} Semester {session.get('semester', '')} quiz with score {score}/{len(questions)}",
             session['scholar_id'],
@@ -368,7 +541,6 @@ def finish_quiz():
             session.get('semester', '')
         )
         
-        session_keys = ['questions', 'answers', 'current_question', 'quiz_start_time', 'course', 'semester', 'quiz_duration', 'quiz_id']
         for key in session_keys:
             session.pop(key, None)
         
@@ -386,20 +558,39 @@ def finish_quiz():
             "error": str(e)
         }), 500
 
+@student_bp.route('/api/quiz_deadline', methods=['GET'])
+@login_required
+def quiz_deadline():
+    """Get the absolute quiz deadline so the client can count down locally"""
+    deadline = session.get('quiz_deadline')
+    if deadline is None:
+        attempt = get_current_attempt()
+        if not attempt:
+            return jsonify({"error": "Quiz not started"}), 400
+        deadline = get_attempt_deadline(attempt)
+        session['quiz_deadline'] = deadline
+    
+    return jsonify({
+        "deadline": int(deadline * 1000),
+        "server_time": int(time.time() * 1000),
+        "grace_seconds": current_app.config.get('QUIZ_DEADLINE_GRACE_SECONDS', 30)
+    })
+
 @student_bp.route('/check_time', methods=['GET'])
 @login_required
 def check_time():
     """Check remaining quiz time"""
-    if 'quiz_start_time' not in session:
-        return jsonify({"error": "Quiz not started"}), 400
+    deadline = session.get('quiz_deadline')
+    if deadline is None:
+        attempt = get_current_attempt()
+        if not attempt:
+            return jsonify({"error": "Quiz not started"}), 400
+        deadline = get_attempt_deadline(attempt)
     
-    quiz_start = datetime.fromisoformat(session['quiz_start_time'])
-    duration = session.get('quiz_duration', 600)
-    time_elapsed = (datetime.now() - quiz_start).total_seconds()
-    time_left = max(0, duration - time_elapsed)
+    time_left = max(0, deadline - time.time())
     
     return jsonify({
-        "time_up": time_elapsed >= duration,
+        "time_up": time_left <= 0,
         "time_left": time_left,
         "time_left_minutes": int(time_left // 60),
         "time_left_seconds": int(time_left % 60)
@@ -448,7 +639,7 @@ def feedback():
             session.get('semester', '')
         )
         
-        session_keys = ['questions', 'answers', 'current_question', 'quiz_start_time', 'course', 'semester', 'quiz_duration']
+        session_keys = ['attempt_id', 'course', 'semester', 'quiz_duration', 'quiz_deadline']
         for key in session_keys:
             session.pop(key, None)
         
@@ -467,12 +658,9 @@ def view_score():
         {"scholar_id": session['scholar_id'], "published": True},
         {'_id': 0}
     ).sort('timestamp', -1))
+    score_percentile_index.rank_results(results)
     
-    latest_result = results_collection.find_one(
-        {"scholar_id": session['scholar_id'], "published": True},
-        {'_id': 0},
-        sort=[('timestamp', -1)]
-    )
+    latest_result = results[0] if results else None
     
     return render_template(
         'result.html',
@@ -481,6 +669,22 @@ def view_score():
         all_results=results
     )
 
+@student_bp.route('/api/live_standing')
+@login_required
+def live_standing():
+    """Progress of the student's running quiz and their live rank once finished"""
+    user = users_collection.find_one({'scholar_id': session['scholar_id']}, {'_id': 0, 'course': 1, 'semester': 1})
+    quiz_id = session.get('quiz_id')
+    if not quiz_id and user:
+        active_quiz = find_active_quiz(user.get('course'), user.get('semester'))
+        quiz_id = active_quiz['quiz_id'] if active_quiz else None
+    
+    if not quiz_id:
+        return jsonify({"success": False, "error": "No active quiz"}), 404
+    
+    # Other students' unpublished scores stay hidden; only the rank is shared
+    return jsonify({"success": True, **live_board_service.get_standing(quiz_id, session['scholar_id'])})
+
 @student_bp.route('/api/update_profile', methods=['POST'])
 @login_required
 def update_profile():
@@ -507,6 +711,8 @@ def update_profile():
         {"scholar_id": session['scholar_id']},
         {"$set": update_data}
     )
+    user_name_cache.forget(session['scholar_id'])
+    sync_result_student_fields(session['scholar_id'], {"user_name": name})
     
     return jsonify({"success": True, "message": "Profile updated successfully"})
 
@@ -549,17 +755,20 @@ def check_blocked():
 @login_required
 def debug_answers():
     """Debug answers for testing"""
-    if 'questions' not in session:
+    attempt = get_current_attempt()
+    if not attempt:
         return jsonify({"error": "No questions available"}), 400
     
-    questions = session['questions']
-    answers = session.get('answers', {})
+    questions = attempt_store.get_questions(attempt)
+    answers = attempt_store.get_answers(attempt['attempt_id'])
+    
+    answer_key = attempt_store.get_answer_key(attempt)
+    correct = answer_key.correct(answer_key.encode(answers))
     
     debug_info = []
     for i, question in enumerate(questions):
-        answer_key = str(i)
-        student_answer = answers.get(answer_key, "NOT ANSWERED")
-        is_correct = student_answer == question['correct_answer']
+        student_answer = answers.get(str(i), "NOT ANSWERED")
+        is_correct = bool(correct[i])
         
         debug_info.append({
             'question_index': i,
@@ -579,12 +788,10 @@ def debug_answers():
 @login_required
 def clear_quiz_data():
     """Clear quiz data from session"""
-    session.pop('questions', None)
-    session.pop('answers', None)
-    session.pop('current_question', None)
-    session.pop('quiz_start_time', None)
+    session.pop('attempt_id', None)
     session.pop('course', None)
     session.pop('semester', None)
     session.pop('quiz_duration', None)
+    session.pop('quiz_deadline', None)
     
     return jsonify({"success": True})
\ No newline at end of file
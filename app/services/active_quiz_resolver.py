@@ -0,0 +1,68 @@
+import threading
+import time
+from app.models.quiz_models import quizzes_collection
+
+
+class ActiveQuizResolver:
+    """In-memory view of the active quizzes, indexed by (course, semester).
+
+    The whole set of active quizzes is loaded with one query and resolved
+    with the same precedence as the old per-scope lookups: exact course and
+    semester first, then 'all' courses, then 'all' semesters, then both.
+
+    Routes that change a quiz call ``invalidate()``, which bumps a version
+    counter so the next lookup reloads. Other worker processes don't see that
+    counter, so the snapshot is also reloaded after ``ttl`` seconds.
+    """
+
+    def __init__(self, ttl=5):
+        self.ttl = ttl
+        self.version = 0
+        self._loaded_version = None
+        self._loaded_at = 0
+        self._by_scope = {}
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        """Mark the snapshot stale after a quiz changed status or content"""
+        with self._lock:
+            self.version += 1
+
+    def _snapshot(self):
+        with self._lock:
+            if self._loaded_version == self.version and time.monotonic() - self._loaded_at < self.ttl:
+                return self._by_scope
+            version = self.version
+
+        by_scope = {}
+        for quiz in quizzes_collection.find({"status": "active"}):
+            by_scope.setdefault((quiz.get('course'), quiz.get('semester')), quiz)
+
+        with self._lock:
+            # A concurrent invalidate() keeps the snapshot marked stale
+            if self.version == version:
+                self._loaded_version = version
+                self._loaded_at = time.monotonic()
+            self._by_scope = by_scope
+        return by_scope
+
+    def find(self, course, semester):
+        """Find the active quiz for a course/semester, honouring 'all' wildcards"""
+        by_scope = self._snapshot()
+        for scope in ((course, semester), ("all", semester), (course, "all"), ("all", "all")):
+            quiz = by_scope.get(scope)
+            if quiz is not None:
+                return dict(quiz)
+        return None
+
+    def is_active(self, course, semester):
+        """Check if there's an active quiz for a course/semester"""
+        by_scope = self._snapshot()
+        return any(
+            scope in by_scope
+            for scope in ((course, semester), ("all", semester), (course, "all"), ("all", "all"))
+        )
+
+
+# Global active quiz resolver instance
+active_quiz_resolver = ActiveQuizResolver()
@@ -0,0 +1,267 @@
+import random
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument
+from app import get_db
+from app.models.attempt_models import attempts_collection
+from app.services.paper_cache import paper_cache, shuffle_order
+from app.utils.grading import AnswerKey
+from app.utils.item_analysis import question_set_key, options_key, canonical_order
+
+
+class AttemptStore:
+    """Server-side store for in-progress quiz attempts.
+
+    The attempt document lives in the ``attempts`` collection and the cookie
+    session only carries its ``attempt_id``. The immutable part of an attempt
+    (question order, start time, duration, quiz info) is also kept in a bounded
+    in-process cache so the hot quiz endpoints don't have to go to Mongo for it.
+    Answers are always written to and read from Mongo, so every worker process
+    sees the same state.
+
+    Attempts of quizzes with a question list reference a shared paper from the
+    paper cache by ``paper_version`` and only store their own ``shuffle_seed``;
+    the cached header keeps just the ``(paper, order)`` reference, never a
+    copy of the questions.
+    """
+
+    def __init__(self, max_cached=5000):
+        self.max_cached = max_cached
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remember(self, header):
+        with self._lock:
+            self._cache[header['attempt_id']] = header
+            self._cache.move_to_end(header['attempt_id'])
+            while len(self._cache) > self.max_cached:
+                self._cache.popitem(last=False)
+
+    def _forget(self, attempt_id):
+        with self._lock:
+            self._cache.pop(attempt_id, None)
+
+    def create(self, scholar_id, quiz_id, course, semester, duration, paper=None, questions=None,
+               question_source='question_bank', workspace_id=None, user_name=None, school=None, department=None):
+        """Create a new attempt, either on a shared quiz paper or on the given
+        (already shuffled) question documents"""
+        now = datetime.now()
+        shuffle_seed = None
+        order = None
+        if paper is not None:
+            shuffle_seed = random.getrandbits(32)
+            order = paper.permutation(shuffle_seed)
+            question_ids = [paper.question_ids[i] for i in order]
+        else:
+            question_ids = [q['question_id'] for q in questions]
+
+        attempt = {
+            "attempt_id": str(uuid.uuid4()),
+            "scholar_id": scholar_id,
+            "user_name": user_name,
+            "school": school,
+            "department": department,
+            "quiz_id": quiz_id,
+            "course": course,
+            "semester": semester,
+            "workspace_id": workspace_id,
+            "question_ids": question_ids,
+            "question_source": question_source,
+            "paper_version": paper.version if paper is not None else None,
+            "shuffle_seed": shuffle_seed,
+            "duration": duration,
+            "started_at": now,
+            "deadline": now + timedelta(seconds=duration),
+            "current_question": 0,
+            "answers": {},
+            "answer_seq": {},
+            "status": "in_progress",
+            "updated_at": now
+        }
+        attempts_collection.insert_one(attempt)
+
+        header = {k: v for k, v in attempt.items() if k not in ('_id', 'answers', 'answer_seq', 'current_question', 'updated_at')}
+        if paper is not None:
+            header['_paper'] = (paper, order)
+        else:
+            header['_questions'] = questions
+        self._remember(header)
+        return header
+
+    def get(self, attempt_id):
+        """Get the immutable attempt header, from cache when possible"""
+        if not attempt_id:
+            return None
+
+        with self._lock:
+            header = self._cache.get(attempt_id)
+            if header is not None:
+                self._cache.move_to_end(attempt_id)
+                return header
+
+        header = attempts_collection.find_one(
+            {"attempt_id": attempt_id},
+            {'_id': 0, 'answers': 0, 'answer_seq': 0, 'current_question': 0, 'updated_at': 0}
+        )
+        if header:
+            self._remember(header)
+        return header
+
+    def find_open(self, scholar_id, quiz_id):
+        """Header of the student's in-progress attempt on a quiz, if any"""
+        attempt = attempts_collection.find_one(
+            {"scholar_id": scholar_id, "quiz_id": quiz_id, "status": "in_progress"},
+            {'_id': 0, 'attempt_id': 1},
+            sort=[('started_at', -1)]
+        )
+        return self.get(attempt['attempt_id']) if attempt else None
+
+    def get_paper(self, header):
+        """Get ``(paper, order)`` for an attempt on a shared quiz paper, else None"""
+        if header.get('paper_version') is None:
+            return None
+
+        cached = header.get('_paper')
+        if cached is not None:
+            return cached
+
+        # Recover the paper's canonical question order from the attempt's order
+        question_ids = header['question_ids']
+        order = shuffle_order(header['shuffle_seed'], len(question_ids))
+        canonical_ids = [None] * len(question_ids)
+        for position, index in enumerate(order):
+            canonical_ids[index] = question_ids[position]
+
+        paper = paper_cache.get(header['quiz_id'], header['paper_version'], canonical_ids)
+        if paper.question_ids != tuple(canonical_ids):
+            # Questions were removed from the bank since the attempt started
+            return None
+
+        header['_paper'] = (paper, order)
+        return header['_paper']
+
+    def get_questions(self, header):
+        """Get the full question documents of an attempt in attempt order.
+
+        Attempts on a shared paper get a view of the paper's questions.
+        """
+        questions = header.get('_questions')
+        if questions is None:
+            paper = self.get_paper(header)
+            if paper is not None:
+                return paper[0].questions_with_answers(paper[1])
+
+            collection = get_db()[header.get('question_source', 'question_bank')]
+            docs = {
+                q['question_id']: q
+                for q in collection.find({"question_id": {"$in": header['question_ids']}}, {'_id': 0})
+            }
+            questions = [docs[qid] for qid in header['question_ids'] if qid in docs]
+            header['_questions'] = questions
+        return questions
+
+    def get_answer_key(self, header):
+        """Get the encoded answer key of an attempt in attempt order"""
+        answer_key = header.get('_answer_key')
+        if answer_key is None:
+            paper = self.get_paper(header)
+            if paper is not None:
+                answer_key = paper[0].answer_key.take(paper[1])
+            else:
+                answer_key = AnswerKey(self.get_questions(header))
+            header['_answer_key'] = answer_key
+        return answer_key
+
+    def get_responses(self, header, answers):
+        """Compact per-question responses of an attempt for its result.
+
+        Returns ``{"question_set": ..., "options_key": ..., "paper_version": ...,
+        "responses": [...]}`` with the chosen option index of every question,
+        ordered by question_id so attempts with different shuffles line up,
+        or an empty dict when questions of the attempt no longer exist.
+        ``options_key`` identifies the option vocabularies the indices refer to.
+        """
+        question_ids = header['question_ids']
+        answer_key = self.get_answer_key(header)
+        if len(answer_key) != len(question_ids):
+            return {}
+        order = canonical_order(question_ids)
+        row = answer_key.encode(answers)
+        return {
+            "question_set": question_set_key(question_ids),
+            "options_key": options_key(answer_key.take(order)),
+            "paper_version": header.get('paper_version'),
+            "responses": row[order].tolist()
+        }
+
+    def get_answers(self, attempt_id):
+        """Get the answer map ({question_index: answer}) of an attempt"""
+        attempt = attempts_collection.find_one({"attempt_id": attempt_id}, {'_id': 0, 'answers': 1})
+        return attempt.get('answers', {}) if attempt else {}
+
+    def record_answer(self, attempt_id, question_index, answer):
+        """Store the answer for one question of an in-progress attempt"""
+        result = attempts_collection.update_one(
+            {"attempt_id": attempt_id, "status": "in_progress"},
+            {"$set": {f"answers.{question_index}": answer, "updated_at": datetime.now()}}
+        )
+        return result.matched_count > 0
+
+    def apply_answers(self, attempt_id, deltas):
+        """Apply a batch of answer deltas in a single atomic update.
+
+        ``deltas`` maps question index to ``(answer, client_seq)``. A delta is
+        only applied when its sequence number is higher than the one already
+        stored for that question, so replayed batches are ignored. Returns the
+        stored answers and sequence numbers after the update, or None when the
+        attempt is closed.
+        """
+        stage = {"updated_at": {"$literal": datetime.now()}}
+        for question_index, (answer, client_seq) in deltas.items():
+            stored_seq = f"$answer_seq.{question_index}"
+            is_newer = {"$gt": [client_seq, {"$ifNull": [stored_seq, -1]}]}
+            stage[f"answers.{question_index}"] = {
+                "$cond": [is_newer, {"$literal": answer}, f"$answers.{question_index}"]
+            }
+            stage[f"answer_seq.{question_index}"] = {"$cond": [is_newer, client_seq, stored_seq]}
+
+        attempt = attempts_collection.find_one_and_update(
+            {"attempt_id": attempt_id, "status": "in_progress"},
+            [{"$set": stage}],
+            projection={'_id': 0, 'answers': 1, 'answer_seq': 1},
+            return_document=ReturnDocument.AFTER
+        )
+        if attempt is None:
+            return None
+        return attempt.get('answers', {}), attempt.get('answer_seq', {})
+
+    def advance(self, attempt_id):
+        """Move the attempt to its next question and return the new index"""
+        attempt = attempts_collection.find_one_and_update(
+            {"attempt_id": attempt_id, "status": "in_progress"},
+            {"$inc": {"current_question": 1}, "$set": {"updated_at": datetime.now()}},
+            projection={'_id': 0, 'current_question': 1},
+            return_document=ReturnDocument.AFTER
+        )
+        return attempt['current_question'] if attempt else None
+
+    def finish(self, attempt_id, status="submitted"):
+        """Close an attempt so no more answers are accepted.
+
+        Returns the attempt's final answer map, read in the same round trip,
+        or None when the attempt doesn't exist.
+        """
+        attempt = attempts_collection.find_one_and_update(
+            {"attempt_id": attempt_id},
+            {"$set": {"status": status, "finished_at": datetime.now()}},
+            projection={'_id': 0, 'answers': 1},
+            return_document=ReturnDocument.AFTER
+        )
+        self._forget(attempt_id)
+        return attempt.get('answers', {}) if attempt else None
+
+
+# Global attempt store instance
+attempt_store = AttemptStore()
@@ -0,0 +1,96 @@
+import atexit
+import queue
+import threading
+from collections import defaultdict
+from app import get_db
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundWriter:
+    """Bounded write-behind queue for side-effect documents.
+
+    Request handlers enqueue documents (admin notifications, activity log
+    entries, ...) and return immediately. A daemon thread drains the queue
+    and writes each collection's documents with one unordered ``insert_many``
+    per batch. When the queue is full the document is written synchronously
+    instead, so a burst slows the request down rather than losing writes.
+    """
+
+    def __init__(self, max_queued=10000, batch_size=500, flush_interval=0.25):
+        self.max_queued = max_queued
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.written_count = 0
+        self.error_count = 0
+
+    def _ensure_started(self):
+        if self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def enqueue(self, collection_name, document):
+        """Queue a document to be inserted into ``collection_name``"""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((collection_name, document))
+        except queue.Full:
+            logger.warning(f"Background write queue full, writing {collection_name} document inline")
+            self._write({collection_name: [document]})
+
+    def _run(self):
+        while True:
+            self._drain([self._queue.get()])
+
+    def _drain(self, batch):
+        """Collect up to ``batch_size`` queued documents and write them"""
+        try:
+            while len(batch) < self.batch_size:
+                batch.append(self._queue.get(timeout=self.flush_interval))
+        except queue.Empty:
+            pass
+
+        grouped = defaultdict(list)
+        for collection_name, document in batch:
+            grouped[collection_name].append(document)
+        self._write(grouped)
+        for _ in batch:
+            self._queue.task_done()
+
+    def _write(self, grouped):
+        db = get_db()
+        for collection_name, documents in grouped.items():
+            try:
+                db[collection_name].insert_many(documents, ordered=False)
+                self.written_count += len(documents)
+            except Exception as e:
+                logger.error(f"Error writing {len(documents)} {collection_name} documents: {str(e)}")
+                self.error_count += len(documents)
+
+    def flush(self):
+        """Write everything still queued (used on shutdown)"""
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+            if len(batch) >= self.batch_size:
+                self._drain(batch)
+                batch = []
+        if batch:
+            self._drain(batch)
+
+
+# Global background writer instance
+background_writer = BackgroundWriter()
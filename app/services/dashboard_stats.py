@@ -0,0 +1,112 @@
+import threading
+import time
+from datetime import datetime
+from app.models.user_models import users_collection
+from app.models.question_models import question_bank_collection
+from app.models.quiz_models import results_collection
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def compute_dashboard_stats():
+    """Totals, average score and top-10 shown on the admin dashboard"""
+    avg_score_result = list(results_collection.aggregate([
+        {"$match": {"published": True}},
+        {"$group": {
+            "_id": None,
+            "avg_score": {"$avg": {"$multiply": [{"$divide": ["$score", "$total"]}, 100]}}
+        }}
+    ]))
+
+    leaderboard = list(results_collection.aggregate([
+        {"$match": {"published": True}},
+        {"$sort": {"score": -1, "completion_time": 1, "timestamp": 1}},
+        {"$limit": 10},
+        {"$project": {
+            "scholar_id": 1,
+            "user_name": 1,
+            "course": 1,
+            "semester": 1,
+            "score": 1,
+            "total": 1,
+            "timestamp": 1,
+            "completion_time": 1,
+            "percentage": {"$multiply": [{"$divide": ["$score", "$total"]}, 100]}
+        }}
+    ]))
+    for item in leaderboard:
+        if 'timestamp' in item and isinstance(item['timestamp'], datetime):
+            item['formatted_date'] = item['timestamp'].strftime('%d/%m/%y')
+
+    return {
+        "total_students": users_collection.count_documents({}),
+        "total_questions": question_bank_collection.count_documents({}),
+        "total_quizzes": results_collection.count_documents({"published": True}),
+        "average_score": (avg_score_result[0]['avg_score'] or 0) if avg_score_result else 0,
+        "leaderboard": leaderboard,
+        "computed_at": datetime.now()
+    }
+
+
+class DashboardStatsSnapshot:
+    """Admin dashboard statistics served from memory.
+
+    A daemon thread recomputes the snapshot every ``refresh_interval``
+    seconds, or straight away when ``invalidate()`` reports a change (results
+    published, users or quizzes deleted). ``get`` never serves a snapshot
+    older than its ``max_age``; past that it recomputes inline.
+    """
+
+    def __init__(self, refresh_interval=30):
+        self.refresh_interval = refresh_interval
+        self._snapshot = None
+        self._computed_at = 0
+        self._lock = threading.Lock()
+        self._changed = threading.Event()
+        self._thread = None
+
+    def refresh(self, max_age=None):
+        """Recompute the snapshot and return it; with ``max_age`` a snapshot
+        another thread computed meanwhile is reused"""
+        with self._lock:
+            if (max_age is not None and self._snapshot is not None
+                    and time.monotonic() - self._computed_at <= max_age):
+                return self._snapshot
+            snapshot = compute_dashboard_stats()
+            self._snapshot = snapshot
+            self._computed_at = time.monotonic()
+        return snapshot
+
+    def invalidate(self):
+        """Ask the refresher thread to recompute after a change"""
+        self._changed.set()
+
+    def _run(self):
+        while True:
+            self._changed.wait(self.refresh_interval)
+            self._changed.clear()
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Error refreshing dashboard stats: {str(e)}")
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='dashboard-stats', daemon=True)
+                self._thread.start()
+
+    def get(self, max_age=60):
+        """Latest snapshot, recomputed inline if older than ``max_age`` seconds"""
+        self._ensure_started()
+        snapshot = self._snapshot
+        if snapshot is None or time.monotonic() - self._computed_at > max_age:
+            snapshot = self.refresh(max_age)
+        return snapshot
+
+
+# Global dashboard stats snapshot instance
+dashboard_stats_snapshot = DashboardStatsSnapshot()
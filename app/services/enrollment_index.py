@@ -0,0 +1,100 @@
+import threading
+import time
+from functools import lru_cache
+from app.models.quiz_models import quizzes_collection
+from app.utils.taxonomy import allowed_courses
+
+
+@lru_cache(maxsize=1024)
+def compile_quiz_filter(school, department, course, semester):
+    """Compile a quiz's hierarchical filters into an O(1) predicate.
+
+    The school, department and course filters are resolved to one set of
+    allowed courses, so checking a student is a set lookup plus a semester
+    compare.
+    """
+    allowed = allowed_courses(school, department, course)
+    required_semester = None if semester == 'all' else semester
+
+    def matches(student_course, student_semester):
+        if allowed is not None and student_course not in allowed:
+            return False
+        return required_semester is None or str(student_semester) == required_semester
+
+    return matches
+
+
+def compile_quiz(quiz):
+    """Compiled filter predicate of a quiz document"""
+    return compile_quiz_filter(
+        quiz.get('school', 'all'), quiz.get('department', 'all'),
+        quiz.get('course', 'all'), quiz.get('semester', 'all')
+    )
+
+
+class QuizEnrollment:
+    """Enrollment of one quiz: explicit participants plus the 'all' filter"""
+
+    __slots__ = ('participants', 'open_to_all', 'matches', 'loaded_at')
+
+    def __init__(self, quiz):
+        participants = quiz.get('participants', [])
+        if not isinstance(participants, list):
+            participants = []
+        self.participants = frozenset(participants)
+        self.open_to_all = 'all' in self.participants
+        self.matches = compile_quiz(quiz)
+        self.loaded_at = time.monotonic()
+
+    def is_enrolled(self, scholar_id, course, semester):
+        if scholar_id in self.participants:
+            return True
+        return self.open_to_all and self.matches(course, semester)
+
+
+class EnrollmentIndex:
+    """Process-wide cache of quiz enrollments keyed by quiz_id.
+
+    Routes that change a quiz's participants call ``invalidate(quiz_id)``;
+    entries also expire after ``ttl`` seconds so changes made by other worker
+    processes are picked up.
+    """
+
+    def __init__(self, ttl=30):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, quiz_id):
+        """Get the enrollment of a quiz, loading it on a miss; None if no such quiz"""
+        entry = self._entries.get(quiz_id)
+        if entry is not None and time.monotonic() - entry.loaded_at < self.ttl:
+            return entry
+
+        quiz = quizzes_collection.find_one(
+            {"quiz_id": quiz_id},
+            {'_id': 0, 'participants': 1, 'school': 1, 'department': 1, 'course': 1, 'semester': 1}
+        )
+        with self._lock:
+            if quiz is None:
+                self._entries.pop(quiz_id, None)
+                return None
+            entry = QuizEnrollment(quiz)
+            self._entries[quiz_id] = entry
+        return entry
+
+    def invalidate(self, quiz_id=None):
+        """Drop one quiz's enrollment, or all of them"""
+        with self._lock:
+            if quiz_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(quiz_id, None)
+
+    def is_enrolled(self, scholar_id, quiz_id, course, semester):
+        entry = self.get(quiz_id)
+        return entry is not None and entry.is_enrolled(scholar_id, course, semester)
+
+
+# Global enrollment index instance
+enrollment_index = EnrollmentIndex()
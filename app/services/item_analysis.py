@@ -0,0 +1,116 @@
+import threading
+from collections import OrderedDict
+from datetime import datetime
+import numpy as np
+from app.models.quiz_models import quizzes_collection, results_collection
+from app.services.paper_cache import paper_cache
+from app.utils.item_analysis import question_set_key, options_key, canonical_order, response_matrix, analyze_responses
+
+
+def _rounded(value, digits=4):
+    return None if np.isnan(value) else round(float(value), digits)
+
+
+def build_report(quiz_id, version, paper, order, analysis):
+    """JSON-ready item analysis report of a quiz paper"""
+    attempts = analysis["attempts"]
+    questions = []
+    for column, index in enumerate(order):
+        question = paper.questions[index]
+        vocab = paper.answer_key.vocab[index]
+        key = int(paper.answer_key.key[index])
+        options = []
+        for option, option_index in vocab.items():
+            count = int(analysis["option_counts"][column, option_index])
+            options.append({
+                "option": option,
+                "count": count,
+                "share": round(count / attempts, 4) if attempts else 0,
+                "correct": option_index == key
+            })
+        questions.append({
+            "question_id": question['question_id'],
+            "text": question.get('text', ''),
+            "p_value": _rounded(analysis["p_values"][column]),
+            "discrimination": _rounded(analysis["discrimination"][column]),
+            "options": options,
+            "unanswered": int(analysis["unanswered"][column]),
+            "unknown": int(analysis["unknown"][column])
+        })
+
+    scores = analysis["scores"]
+    return {
+        "quiz_id": quiz_id,
+        "paper_version": version,
+        "attempts": attempts,
+        "question_count": len(order),
+        "mean_score": round(float(scores.mean()), 2) if attempts else 0,
+        "questions": questions,
+        "computed_at": datetime.now().isoformat()
+    }
+
+
+class ItemAnalysisService:
+    """Item analysis reports cached per quiz paper version.
+
+    Results of attempts on the quiz's current question set and options are
+    loaded into one response matrix and analyzed in a single vectorized pass;
+    results encoded against since edited options (a different
+    ``options_key``) are left out rather than decoded with the wrong options. A report is
+    reused until the paper version changes (questions or answer key edited)
+    or more results of that question set come in, or until ``invalidate``
+    (stored responses were regraded).
+    """
+
+    def __init__(self, max_reports=64):
+        self.max_reports = max_reports
+        self._reports = OrderedDict()
+        self._lock = threading.Lock()
+
+    def invalidate(self, quiz_ids=None):
+        """Drop the reports of the given quizzes, or all of them"""
+        with self._lock:
+            if quiz_ids is None:
+                self._reports.clear()
+                return
+            for key in [key for key in self._reports if key[0] in quiz_ids]:
+                del self._reports[key]
+
+    def get_report(self, quiz_id):
+        """Item analysis of a quiz's current paper, or None if it has no question list"""
+        quiz = quizzes_collection.find_one({"quiz_id": quiz_id}, {'_id': 0, 'questions': 1, 'paper_version': 1})
+        if not quiz or not quiz.get('questions'):
+            return None
+
+        version = quiz.get('paper_version', 0)
+        paper = paper_cache.get(quiz_id, version, quiz['questions'])
+        order = canonical_order(paper.question_ids)
+        answer_key = paper.answer_key.take(order)
+        query = {
+            "quiz_id": quiz_id,
+            "question_set": question_set_key(paper.question_ids),
+            "options_key": options_key(answer_key)
+        }
+        count = results_collection.count_documents(query)
+
+        key = (quiz_id, version)
+        with self._lock:
+            cached = self._reports.get(key)
+            if cached is not None and cached[0] == count:
+                self._reports.move_to_end(key)
+                return cached[1]
+
+        rows = [result['responses'] for result in results_collection.find(query, {'_id': 0, 'responses': 1})]
+        analysis = analyze_responses(answer_key, response_matrix(rows, len(order)))
+        report = build_report(quiz_id, version, paper, order, analysis)
+
+        with self._lock:
+            self._reports[key] = (count, report)
+            self._reports.move_to_end(key)
+            while len(self._reports) > self.max_reports:
+                self._reports.popitem(last=False)
+        return report
+
+
+# Global item analysis service instance
+item_analysis_service = ItemAnalysisService()
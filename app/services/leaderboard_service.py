@@ -0,0 +1,201 @@
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+from pymongo import UpdateOne
+from app.models.leaderboard_models import leaderboards_collection
+from app.models.quiz_models import results_collection
+from app.services.response_cache import response_cache
+from app.services.user_name_cache import user_name_cache
+
+# Leaders kept per board and number of days shown
+LEADERBOARD_SIZE = 10
+LEADERBOARD_DAYS = 7
+# Ranking: best score first, then fastest, then earliest
+LEADER_SORT = {"score": -1, "completion_time": 1, "timestamp": 1}
+
+
+def leader_entry(result):
+    """Leaderboard entry for a published result"""
+    total = result.get('total') or 0
+    return {
+        "_id": str(result['_id']),
+        "scholar_id": result.get('scholar_id'),
+        "user_name": result.get('user_name'),
+        "course": result.get('course'),
+        "semester": result.get('semester'),
+        "score": result.get('score', 0),
+        "total": total,
+        "timestamp": result.get('timestamp'),
+        "completion_time": result.get('completion_time'),
+        "percentage": (result.get('score', 0) / total * 100) if total else 0
+    }
+
+
+def board_keys(result):
+    """Keys of the boards a result counts towards (daily and course/semester)"""
+    date = result['timestamp'].strftime('%Y-%m-%d')
+    return (
+        ("daily", None, None, date),
+        ("course", result.get('course'), result.get('semester'), date),
+    )
+
+
+def fill_user_names(entries):
+    """Resolve names for entries of older results stored without a user_name"""
+    missing = [entry for entry in entries if not entry.get('user_name')]
+    if missing:
+        names = user_name_cache.get_names(entry['scholar_id'] for entry in missing)
+        for entry in missing:
+            entry['user_name'] = names[entry['scholar_id']]
+    return entries
+
+
+def board_filter(key):
+    scope, course, semester, date = key
+    return {"scope": scope, "course": course, "semester": semester, "date": date}
+
+
+class LeaderboardService:
+    """Materialized top-k leaderboards in the ``leaderboards`` collection.
+
+    There is one document per day (``scope: daily``) and per course/semester
+    and day (``scope: course``) holding its ``LEADERBOARD_SIZE`` best entries.
+    Publishing merges the newly published results in with an atomic
+    ``$push``/``$sort``/``$slice``, so reads are a single indexed ``find``.
+    Boards whose results change or disappear are recomputed with ``refresh``.
+    Every write invalidates the cached leaderboard API responses.
+    """
+
+    def __init__(self):
+        self._backfill_lock = threading.Lock()
+        self._backfilled = False
+
+    def add_published(self, results):
+        """Merge newly published results into their boards"""
+        entries = defaultdict(list)
+        new_entries = []
+        for result in results:
+            if not isinstance(result.get('timestamp'), datetime):
+                continue
+            entry = leader_entry(result)
+            new_entries.append(entry)
+            for key in board_keys(result):
+                entries[key].append(entry)
+
+        if not entries:
+            return
+        fill_user_names(new_entries)
+        now = datetime.now()
+        leaderboards_collection.bulk_write([
+            UpdateOne(
+                board_filter(key),
+                {
+                    "$push": {"leaders": {"$each": board_entries, "$sort": LEADER_SORT, "$slice": LEADERBOARD_SIZE}},
+                    "$inc": {"count": len(board_entries)},
+                    "$set": {"updated_at": now}
+                },
+                upsert=True
+            )
+            for key, board_entries in entries.items()
+        ], ordered=False)
+        response_cache.invalidate()
+
+    def refresh(self, keys):
+        """Recompute boards from the results collection (after regrades or deletes)"""
+        now = datetime.now()
+        for key in set(keys):
+            scope, course, semester, date = key
+            day = datetime.strptime(date, '%Y-%m-%d')
+            query = {"published": True, "timestamp": {"$gte": day, "$lt": day + timedelta(days=1)}}
+            if scope == "course":
+                query.update({"course": course, "semester": semester})
+
+            count = results_collection.count_documents(query)
+            if not count:
+                leaderboards_collection.delete_one(board_filter(key))
+                continue
+            leaders = fill_user_names([
+                leader_entry(result)
+                for result in results_collection.find(query).sort(list(LEADER_SORT.items())).limit(LEADERBOARD_SIZE)
+            ])
+            leaderboards_collection.update_one(
+                board_filter(key),
+                {"$set": {"leaders": leaders, "count": count, "updated_at": now}},
+                upsert=True
+            )
+        response_cache.invalidate()
+
+    def refresh_for_results(self, results):
+        """Recompute the boards the given (published) results count towards"""
+        self.refresh(
+            key for result in results
+            if result.get('published') and isinstance(result.get('timestamp'), datetime)
+            for key in board_keys(result)
+        )
+
+    def rebuild(self):
+        """Rebuild every board in one pass over the published results"""
+        boards = defaultdict(lambda: {"leaders": [], "count": 0})
+        leader_entries = []
+        cursor = results_collection.find({"published": True, "timestamp": {"$type": "date"}}).sort(list(LEADER_SORT.items()))
+        for result in cursor:
+            entry = None
+            for key in board_keys(result):
+                board = boards[key]
+                board["count"] += 1
+                # Results arrive in rank order, so the first ones are the leaders
+                if len(board["leaders"]) < LEADERBOARD_SIZE:
+                    if entry is None:
+                        entry = leader_entry(result)
+                        leader_entries.append(entry)
+                    board["leaders"].append(entry)
+
+        fill_user_names(leader_entries)
+        now = datetime.now()
+        leaderboards_collection.delete_many({})
+        if boards:
+            leaderboards_collection.insert_many([
+                dict(board_filter(key), leaders=board["leaders"], count=board["count"], updated_at=now)
+                for key, board in boards.items()
+            ])
+        response_cache.invalidate()
+        return len(boards)
+
+    def _ensure_backfilled(self):
+        """Build the boards once for results published before they existed"""
+        if self._backfilled:
+            return
+        with self._backfill_lock:
+            if self._backfilled:
+                return
+            if (leaderboards_collection.estimated_document_count() == 0
+                    and results_collection.find_one({"published": True}, {'_id': 1})):
+                self.rebuild()
+            self._backfilled = True
+
+    def get_boards(self, scope, course=None, semester=None, days=LEADERBOARD_DAYS):
+        """Latest boards of a scope, newest day first, ready for JSON"""
+        self._ensure_backfilled()
+        boards = leaderboards_collection.find(
+            {"scope": scope, "course": course, "semester": semester},
+            {'_id': 0, 'date': 1, 'leaders': 1}
+        ).sort("date", -1).limit(days)
+
+        dates_data = []
+        for board in boards:
+            date_obj = datetime.strptime(board['date'], '%Y-%m-%d')
+            leaders = board.get('leaders', [])
+            for leader in leaders:
+                if isinstance(leader.get('timestamp'), datetime):
+                    leader['timestamp'] = leader['timestamp'].isoformat()
+            dates_data.append({
+                "date": board['date'],
+                # Format date as DD/MM/YY
+                "formatted_date": f"{date_obj.day:02d}/{date_obj.month:02d}/{date_obj.year % 100:02d}",
+                "leaders": leaders
+            })
+        return dates_data
+
+
+# Global leaderboard service instance
+leaderboard_service = LeaderboardService()
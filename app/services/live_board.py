@@ -0,0 +1,227 @@
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict
+from datetime import datetime
+from app.models.attempt_models import attempts_collection
+from app.models.quiz_models import results_collection
+
+
+def _timestamp(value):
+    return value.timestamp() if isinstance(value, datetime) else None
+
+
+class LiveBoard:
+    """Standings and attempt progress of one quiz while it runs.
+
+    Finished attempts are kept in a list sorted by
+    ``(-score, completion_time, scholar_id)``, so ranks come from a binary
+    search and the top k are a slice. Deadlines of unfinished attempts are
+    kept sorted as well, so counting the ones still running is a bisect.
+    """
+
+    def __init__(self, quiz_id):
+        self.quiz_id = quiz_id
+        self._keys = []
+        self._entries = {}
+        self._deadlines = {}
+        self._open_deadlines = []
+
+    def _close(self, scholar_id):
+        deadline = self._deadlines.get(scholar_id)
+        if deadline is not None and scholar_id not in self._entries:
+            index = bisect_left(self._open_deadlines, deadline)
+            if index < len(self._open_deadlines) and self._open_deadlines[index] == deadline:
+                del self._open_deadlines[index]
+
+    def start(self, scholar_id, deadline):
+        """Count a started attempt (a restart replaces the earlier deadline)"""
+        deadline = _timestamp(deadline) or float('inf')
+        self._close(scholar_id)
+        self._deadlines[scholar_id] = deadline
+        if scholar_id not in self._entries:
+            insort(self._open_deadlines, deadline)
+
+    def abandon(self, scholar_id):
+        """Count an attempt that was closed without a result"""
+        self._close(scholar_id)
+        self._deadlines[scholar_id] = None
+
+    def finish(self, result):
+        """Place a submitted result on the board"""
+        scholar_id = result['scholar_id']
+        self._close(scholar_id)
+        self._deadlines.setdefault(scholar_id, None)
+        previous = self._entries.pop(scholar_id, None)
+        if previous is not None:
+            del self._keys[bisect_left(self._keys, previous[0])]
+
+        score = result.get('score', 0)
+        total = result.get('total') or 0
+        key = (-score, result.get('completion_time') or 0, scholar_id)
+        self._entries[scholar_id] = (key, {
+            "scholar_id": scholar_id,
+            "user_name": result.get('user_name'),
+            "course": result.get('course'),
+            "semester": result.get('semester'),
+            "score": score,
+            "total": total,
+            "percentage": round(score / total * 100, 2) if total else 0,
+            "completion_time": result.get('completion_time'),
+            "late_submission": result.get('late_submission', False)
+        })
+        insort(self._keys, key)
+
+    def rank(self, scholar_id):
+        """1-based rank of a finished attempt (ties share a rank), else None"""
+        entry = self._entries.get(scholar_id)
+        if entry is None:
+            return None
+        return bisect_left(self._keys, entry[0][:2]) + 1
+
+    def top(self, limit):
+        return [
+            dict(self._entries[key[2]][1], rank=bisect_left(self._keys, key[:2]) + 1)
+            for key in self._keys[:limit]
+        ]
+
+    def progress(self, now=None):
+        now = time.time() if now is None else now
+        in_progress = len(self._open_deadlines) - bisect_right(self._open_deadlines, now)
+        started = len(self._deadlines)
+        finished = len(self._entries)
+        return {
+            "started": started,
+            "in_progress": in_progress,
+            "finished": finished,
+            "expired": started - finished - in_progress
+        }
+
+
+class LiveBoardService:
+    """Live boards of running quizzes, updated as attempts start and finish.
+
+    A board is loaded once from the quiz's attempts and results and then kept
+    current by ``record_start``/``record_finish`` from the quiz endpoints, so
+    refreshing it never aggregates ``results``. Boards are reloaded after
+    ``ttl`` seconds to pick up attempts handled by other worker processes, and
+    dropped when results of the quiz are regraded or deleted (``invalidate``).
+
+    Loads run outside the service lock, one per quiz at a time: other readers
+    wait for it (or keep using the expired board), and attempts recorded in
+    the meantime are replayed onto the new board before it is swapped in. A
+    load overtaken by ``invalidate`` is not cached.
+    """
+
+    def __init__(self, ttl=30, max_boards=64):
+        self.ttl = ttl
+        self.max_boards = max_boards
+        self._boards = OrderedDict()
+        self._loading = {}
+        self._lock = threading.Lock()
+
+    def _load(self, quiz_id):
+        board = LiveBoard(quiz_id)
+        for attempt in attempts_collection.find(
+                {"quiz_id": quiz_id},
+                {'_id': 0, 'scholar_id': 1, 'deadline': 1, 'status': 1}).sort('started_at', 1):
+            if attempt.get('status') == 'in_progress':
+                board.start(attempt['scholar_id'], attempt.get('deadline'))
+            else:
+                board.abandon(attempt['scholar_id'])
+        for result in results_collection.find(
+                {"quiz_id": quiz_id},
+                {'_id': 0, 'scholar_id': 1, 'user_name': 1, 'course': 1, 'semester': 1, 'score': 1,
+                 'total': 1, 'completion_time': 1, 'late_submission': 1}):
+            board.finish(result)
+        return board
+
+    def _board(self, quiz_id):
+        """Board of a quiz, loading it if it is missing or expired"""
+        while True:
+            with self._lock:
+                cached = self._boards.get(quiz_id)
+                if cached is not None and time.monotonic() - cached[0] < self.ttl:
+                    self._boards.move_to_end(quiz_id)
+                    return cached[1]
+                loading = self._loading.get(quiz_id)
+                if loading is None:
+                    loading = {"done": threading.Event(), "stale": False, "missed": []}
+                    self._loading[quiz_id] = loading
+                    break
+                if cached is not None:
+                    return cached[1]
+            # Another request is loading this board; if it fails, try again
+            loading["done"].wait()
+
+        try:
+            board = self._load(quiz_id)
+            with self._lock:
+                for method, args in loading["missed"]:
+                    getattr(board, method)(*args)
+                if not loading["stale"]:
+                    self._boards[quiz_id] = (time.monotonic(), board)
+                    self._boards.move_to_end(quiz_id)
+                    while len(self._boards) > self.max_boards:
+                        self._boards.popitem(last=False)
+            return board
+        finally:
+            with self._lock:
+                del self._loading[quiz_id]
+            loading["done"].set()
+
+    def _record(self, quiz_id, method, *args):
+        with self._lock:
+            cached = self._boards.get(quiz_id)
+            if cached is not None:
+                getattr(cached[1], method)(*args)
+            loading = self._loading.get(quiz_id)
+            if loading is not None:
+                loading["missed"].append((method, args))
+
+    def record_start(self, attempt):
+        """Count a newly started attempt on its quiz's board, if loaded"""
+        self._record(attempt.get('quiz_id'), 'start', attempt['scholar_id'], attempt.get('deadline'))
+
+    def record_finish(self, result):
+        """Place a newly submitted result on its quiz's board, if loaded"""
+        self._record(result.get('quiz_id'), 'finish', result)
+
+    def invalidate(self, quiz_ids=None):
+        """Drop the boards of the given quizzes, or all of them"""
+        with self._lock:
+            if quiz_ids is None:
+                self._boards.clear()
+                quiz_ids = list(self._loading)
+            for quiz_id in quiz_ids:
+                self._boards.pop(quiz_id, None)
+                if quiz_id in self._loading:
+                    self._loading[quiz_id]["stale"] = True
+
+    def get_board(self, quiz_id, limit=10):
+        """Progress counts and the top ``limit`` finished attempts of a quiz"""
+        board = self._board(quiz_id)
+        with self._lock:
+            return {
+                "quiz_id": quiz_id,
+                "progress": board.progress(),
+                "leaders": board.top(limit),
+                "as_of": datetime.now().isoformat()
+            }
+
+    def get_standing(self, quiz_id, scholar_id):
+        """Progress counts of a quiz plus one student's live rank"""
+        board = self._board(quiz_id)
+        with self._lock:
+            progress = board.progress()
+            return {
+                "quiz_id": quiz_id,
+                "progress": progress,
+                "rank": board.rank(scholar_id),
+                "ranked": progress["finished"],
+                "as_of": datetime.now().isoformat()
+            }
+
+
+# Global live board service instance
+live_board_service = LiveBoardService()
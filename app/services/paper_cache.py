@@ -0,0 +1,132 @@
+import json
+import random
+import threading
+from collections import OrderedDict
+from collections.abc import Sequence
+from types import MappingProxyType
+from app.models.question_models import question_bank_collection
+from app.utils.grading import AnswerKey
+
+# Question fields that are shipped to students; the answer key never is
+PUBLIC_QUESTION_FIELDS = ('question_id', 'text', 'options', 'image_path')
+
+
+def shuffle_order(seed, size):
+    """Deterministic question permutation for a per-attempt shuffle seed"""
+    return random.Random(seed).sample(range(size), size)
+
+
+class PaperQuestions(Sequence):
+    """Read-only view of a paper's questions in one attempt's order.
+
+    Attempts share the paper's frozen questions; a question dict including
+    its answer is only built when it is accessed.
+    """
+
+    __slots__ = ('paper', 'order')
+
+    def __init__(self, paper, order):
+        self.paper = paper
+        self.order = order
+
+    def __len__(self):
+        return len(self.order)
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(len(self)))]
+        index = self.order[position]
+        return dict(self.paper.questions[index], correct_answer=self.paper.correct_answers[index])
+
+
+class QuizPaper:
+    """Frozen, answer-stripped question paper for one version of a quiz.
+
+    Each question is serialized to JSON once when the paper is built, so
+    serving a student's (shuffled) paper is just joining pre-built bytes.
+    The answer key is kept alongside for server-side grading only.
+    """
+
+    def __init__(self, quiz_id, version, questions):
+        self.quiz_id = quiz_id
+        self.version = version
+        self.question_ids = tuple(q['question_id'] for q in questions)
+        self.correct_answers = tuple(q.get('correct_answer') for q in questions)
+        self.answer_key = AnswerKey(questions)
+        self.questions = tuple(
+            MappingProxyType({
+                k: tuple(q[k]) if k == 'options' else q[k]
+                for k in PUBLIC_QUESTION_FIELDS if k in q
+            })
+            for q in questions
+        )
+        self._question_json = tuple(
+            json.dumps({k: q[k] for k in PUBLIC_QUESTION_FIELDS if k in q},
+                       separators=(',', ':'), default=str).encode('utf-8')
+            for q in questions
+        )
+
+    def __len__(self):
+        return len(self.question_ids)
+
+    def permutation(self, seed):
+        """Question order for an attempt, derived from its shuffle seed"""
+        return shuffle_order(seed, len(self))
+
+    def to_json(self, order=None):
+        """Serialized paper (a JSON array) in the given question order"""
+        if order is None:
+            order = range(len(self))
+        return b'[' + b','.join(self._question_json[i] for i in order) + b']'
+
+    def questions_with_answers(self, order):
+        """Questions including the answer key in ``order``, for server-side
+        grading (a view, not a copy)"""
+        return PaperQuestions(self, order)
+
+
+class PaperCache:
+    """Versioned in-process LRU of quiz papers keyed by (quiz_id, version).
+
+    A quiz's ``paper_version`` is bumped whenever it is started or its
+    question list changes, so a new version never serves a stale paper while
+    in-flight attempts keep the version they started with.
+    """
+
+    def __init__(self, max_papers=64):
+        self.max_papers = max_papers
+        self._papers = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, quiz_id, version, question_ids):
+        """Get a paper, building it from ``question_ids`` on a cache miss"""
+        key = (quiz_id, version)
+        with self._lock:
+            paper = self._papers.get(key)
+            if paper is not None:
+                self._papers.move_to_end(key)
+                return paper
+        return self.build(quiz_id, version, question_ids)
+
+    def build(self, quiz_id, version, question_ids):
+        """Build a paper from the question bank and cache it"""
+        docs = {
+            q['question_id']: q
+            for q in question_bank_collection.find({"question_id": {"$in": list(question_ids)}}, {'_id': 0})
+        }
+        paper = QuizPaper(quiz_id, version, [docs[qid] for qid in question_ids if qid in docs])
+
+        with self._lock:
+            self._papers[(quiz_id, version)] = paper
+            self._papers.move_to_end((quiz_id, version))
+            while len(self._papers) > self.max_papers:
+                self._papers.popitem(last=False)
+        return paper
+
+    def build_for_quiz(self, quiz):
+        """Build the current paper of a quiz document"""
+        return self.build(quiz['quiz_id'], quiz.get('paper_version', 0), quiz.get('questions', []))
+
+
+# Global paper cache instance
+paper_cache = PaperCache()
@@ -0,0 +1,59 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class QuizCache:
+    """In-process LRU of values computed per quiz, with a TTL.
+
+    Values are computed outside the lock. ``invalidate()`` marks the
+    computations in flight for those quizzes as stale, and a stale value is
+    returned to its caller but not cached, so an invalidation that races a
+    computation is never lost. Other worker processes don't see
+    invalidations, so entries also expire after ``ttl`` seconds.
+    """
+
+    def __init__(self, max_entries=256, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._loads = {}
+        self._lock = threading.Lock()
+
+    def invalidate(self, quiz_ids=None):
+        """Drop the values of the given quizzes, or all of them"""
+        with self._lock:
+            if quiz_ids is None:
+                self._entries.clear()
+                quiz_ids = list(self._loads)
+            for quiz_id in quiz_ids:
+                self._entries.pop(quiz_id, None)
+                for load in self._loads.get(quiz_id, ()):
+                    load["stale"] = True
+
+    def get(self, quiz_id, compute):
+        """Cached value of a quiz, or ``compute(quiz_id)``; None is not cached"""
+        load = {"stale": False}
+        with self._lock:
+            cached = self._entries.get(quiz_id)
+            if cached is not None and time.monotonic() - cached[0] < self.ttl:
+                self._entries.move_to_end(quiz_id)
+                return cached[1]
+            self._loads.setdefault(quiz_id, []).append(load)
+
+        value = None
+        try:
+            value = compute(quiz_id)
+            return value
+        finally:
+            with self._lock:
+                loads = [other for other in self._loads[quiz_id] if other is not load]
+                if loads:
+                    self._loads[quiz_id] = loads
+                else:
+                    del self._loads[quiz_id]
+                if value is not None and not load["stale"]:
+                    self._entries[quiz_id] = (time.monotonic(), value)
+                    self._entries.move_to_end(quiz_id)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
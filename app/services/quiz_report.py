@@ -0,0 +1,117 @@
+from datetime import datetime
+import numpy as np
+from app.models.quiz_models import quizzes_collection, results_collection
+from app.services.quiz_cache import QuizCache
+
+# Score percentage histogram: ten 10-point bins, the last one includes 100
+HISTOGRAM_BINS = np.linspace(0, 100, 11)
+REPORT_PERCENTILES = (10, 25, 50, 75, 90)
+
+
+def summarize_scores(percentages, courses, pass_percentage):
+    """Distribution summary of score percentages plus a per-course breakdown"""
+    attempts = len(percentages)
+    if not attempts:
+        return {
+            "attempts": 0,
+            "mean": None,
+            "median": None,
+            "std": None,
+            "min": None,
+            "max": None,
+            "percentiles": {str(p): None for p in REPORT_PERCENTILES},
+            "pass_rate": None,
+            "histogram": [
+                {"from": int(low), "to": int(high), "count": 0}
+                for low, high in zip(HISTOGRAM_BINS[:-1], HISTOGRAM_BINS[1:])
+            ],
+            "courses": []
+        }
+
+    passed = percentages >= pass_percentage
+    counts, _ = np.histogram(percentages, bins=HISTOGRAM_BINS)
+    percentiles = np.percentile(percentages, REPORT_PERCENTILES)
+
+    course_names, course_index = np.unique(courses, return_inverse=True)
+    course_attempts = np.bincount(course_index, minlength=len(course_names))
+    course_sums = np.bincount(course_index, weights=percentages, minlength=len(course_names))
+    course_passed = np.bincount(course_index, weights=passed, minlength=len(course_names))
+
+    return {
+        "attempts": attempts,
+        "mean": round(float(percentages.mean()), 2),
+        "median": round(float(np.median(percentages)), 2),
+        "std": round(float(percentages.std()), 2),
+        "min": round(float(percentages.min()), 2),
+        "max": round(float(percentages.max()), 2),
+        "percentiles": {str(p): round(float(v), 2) for p, v in zip(REPORT_PERCENTILES, percentiles)},
+        "pass_rate": round(float(passed.mean()) * 100, 2),
+        "histogram": [
+            {"from": int(low), "to": int(high), "count": int(count)}
+            for low, high, count in zip(HISTOGRAM_BINS[:-1], HISTOGRAM_BINS[1:], counts)
+        ],
+        "courses": [
+            {
+                "course": name or None,
+                "attempts": int(n),
+                "mean": round(float(total / n), 2),
+                "pass_rate": round(float(p / n) * 100, 2)
+            }
+            for name, n, total, p in zip(course_names, course_attempts, course_sums, course_passed)
+        ]
+    }
+
+
+class QuizReportService:
+    """Per-quiz score reports computed from the quiz's published results.
+
+    One projected cursor is read into NumPy arrays and summarized in a few
+    vectorized calls. Reports are cached per quiz (a ``QuizCache``) until
+    results of that quiz are published, regraded or deleted (``invalidate``);
+    other worker processes pick changes up after ``ttl`` seconds.
+    """
+
+    def __init__(self, ttl=300, max_reports=256):
+        self._reports = QuizCache(max_entries=max_reports, ttl=ttl)
+
+    def invalidate(self, quiz_ids=None):
+        """Drop the reports of the given quizzes, or all of them"""
+        self._reports.invalidate(quiz_ids)
+
+    def get_report(self, quiz_id):
+        """Score report of a quiz, or None if there is no such quiz"""
+        return self._reports.get(quiz_id, self._compute)
+
+    def _compute(self, quiz_id):
+        quiz = quizzes_collection.find_one(
+            {"quiz_id": quiz_id},
+            {'_id': 0, 'quiz_id': 1, 'title': 1, 'pass_percentage': 1}
+        )
+        if quiz is None:
+            return None
+
+        scores, totals, courses = [], [], []
+        for result in results_collection.find(
+                {"quiz_id": quiz_id, "published": True},
+                {'_id': 0, 'score': 1, 'total': 1, 'course': 1}):
+            scores.append(result.get('score') or 0)
+            totals.append(result.get('total') or 0)
+            courses.append(result.get('course') or '')
+
+        scores = np.asarray(scores, dtype=np.float64)
+        totals = np.asarray(totals, dtype=np.float64)
+        percentages = np.divide(scores * 100, totals, out=np.zeros_like(scores), where=totals > 0)
+        pass_percentage = quiz.get('pass_percentage', 40)
+
+        report = {
+            "quiz_id": quiz_id,
+            "title": quiz.get('title', 'Untitled Quiz'),
+            "pass_percentage": pass_percentage,
+            **summarize_scores(percentages, np.asarray(courses, dtype=object), pass_percentage),
+            "computed_at": datetime.now().isoformat()
+        }
+        return report
+
+
+# Global quiz report service instance
+quiz_report_service = QuizReportService()
@@ -0,0 +1,67 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+class CachedResponse:
+    """Serialized body of a response plus its content hash"""
+
+    __slots__ = ('body', 'mimetype', 'etag', 'version', 'stored_at')
+
+    def __init__(self, body, mimetype, version):
+        self.body = body
+        self.mimetype = mimetype
+        self.etag = hashlib.sha1(body).hexdigest()
+        self.version = version
+        self.stored_at = time.monotonic()
+
+
+class ResponseCache:
+    """In-process LRU of serialized responses keyed by route and arguments.
+
+    Entries belong to the publish version they were rendered under;
+    ``invalidate()`` bumps the version so every entry goes stale at once.
+    Other worker processes don't see that counter, so entries also expire
+    after ``ttl`` seconds.
+    """
+
+    def __init__(self, max_entries=1024, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.version = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        """Mark every cached response stale after results were published"""
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+
+    def get(self, key):
+        """Cached response for a key, or None when missing or stale"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.version != self.version or time.monotonic() - entry.stored_at >= self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def store(self, key, body, mimetype, version):
+        """Cache a rendered body unless the version moved on while rendering"""
+        entry = CachedResponse(body, mimetype, version)
+        with self._lock:
+            if version == self.version:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return entry
+
+
+# Global response cache instance
+response_cache = ResponseCache()
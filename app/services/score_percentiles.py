@@ -0,0 +1,77 @@
+import numpy as np
+from app.models.quiz_models import results_collection
+from app.services.quiz_cache import QuizCache
+from app.services.student_stats import result_percentage
+
+
+def percentile_rank(sorted_scores, value):
+    """Share of ``sorted_scores`` at or below ``value``, as a percentage"""
+    if not len(sorted_scores):
+        return None
+    at_or_below = int(np.searchsorted(sorted_scores, value, side='right'))
+    return round(at_or_below / len(sorted_scores) * 100, 1)
+
+
+class QuizScores:
+    """Sorted score percentages of one quiz's published results, overall and per course"""
+
+    def __init__(self, percentages, courses):
+        percentages = np.asarray(percentages, dtype=np.float64)
+        courses = np.asarray(courses, dtype=object)
+        self.overall = np.sort(percentages)
+        self.by_course = {}
+        if len(percentages):
+            # Sort by course, then score, and slice out each course's run
+            order = np.lexsort((percentages, courses))
+            course_names, starts = np.unique(courses[order], return_index=True)
+            ends = list(starts[1:]) + [len(order)]
+            for name, start, end in zip(course_names, starts, ends):
+                self.by_course[name] = percentages[order[start:end]]
+
+    def rank(self, percentage, course):
+        return {
+            "percentile": percentile_rank(self.overall, percentage),
+            "course_percentile": percentile_rank(self.by_course.get(course or '', self.overall[:0]), percentage)
+        }
+
+
+class ScorePercentileIndex:
+    """Percentile ranks of published results within their quiz and course.
+
+    Each quiz's published score percentages are loaded once into sorted NumPy
+    arrays, so ranking a result is a binary search instead of a
+    ``count_documents`` per page view. A quiz is reloaded after results of it
+    are published, regraded or deleted (``invalidate``); other worker
+    processes pick changes up after ``ttl`` seconds.
+    """
+
+    def __init__(self, max_quizzes=256, ttl=300):
+        self._quizzes = QuizCache(max_entries=max_quizzes, ttl=ttl)
+
+    def invalidate(self, quiz_ids=None):
+        """Drop the score arrays of the given quizzes, or all of them"""
+        self._quizzes.invalidate(quiz_ids)
+
+    def _load(self, quiz_id):
+        percentages, courses = [], []
+        for result in results_collection.find(
+                {"published": True, "quiz_id": quiz_id},
+                {'_id': 0, 'score': 1, 'total': 1, 'course': 1}):
+            percentages.append(result_percentage(result))
+            courses.append(result.get('course') or '')
+        return QuizScores(percentages, courses)
+
+    def get(self, quiz_id):
+        """Sorted scores of a quiz, loaded from its published results if not cached"""
+        return self._quizzes.get(quiz_id, self._load)
+
+    def rank_results(self, results):
+        """Add ``percentile`` and ``course_percentile`` to published results in place"""
+        for result in results:
+            scores = self.get(result.get('quiz_id'))
+            result.update(scores.rank(result_percentage(result), result.get('course')))
+        return results
+
+
+# Global score percentile index instance
+score_percentile_index = ScorePercentileIndex()
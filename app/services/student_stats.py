@@ -0,0 +1,165 @@
+from collections import defaultdict
+from datetime import datetime
+from pymongo import UpdateOne, ReplaceOne
+from pymongo.errors import DuplicateKeyError
+from app.models.quiz_models import results_collection
+from app.models.stats_models import student_stats_collection
+
+# Score percentage of a result inside an aggregation (0 for an empty quiz)
+PERCENTAGE_EXPR = {"$cond": [
+    {"$gt": ["$total", 0]},
+    {"$multiply": [{"$divide": ["$score", "$total"]}, 100]},
+    0
+]}
+# Student stats written per bulk_write
+STATS_BATCH_SIZE = 1000
+
+
+def result_percentage(result):
+    total = result.get('total') or 0
+    return result.get('score', 0) / total * 100 if total else 0
+
+
+def empty_stats(scholar_id):
+    """Stats of a student without published results (``$max`` sets last_attempt later)"""
+    return {"_id": scholar_id, "attempts": 0, "percentage_sum": 0, "max_percentage": 0, "publish_ids": []}
+
+
+class StudentStatsService:
+    """Per-student totals of published results in ``student_stats``.
+
+    One document per student (``_id`` is the scholar_id) holds the number of
+    published attempts, the sum and maximum of their score percentages and
+    the last attempt time. Publishing updates it atomically with ``$inc`` and
+    ``$max``; regrades and deletions recompute the affected students.
+
+    Every document also lists the ``publish_id`` of each publish it counts.
+    An increment only applies to documents without its publish_id, so a
+    publish is never counted twice, and documents built from results catch
+    up on publishes that happened while they were being built.
+    """
+
+    def add_published(self, results):
+        """Count newly published results into their students' stats"""
+        updates = defaultdict(lambda: {"attempts": 0, "percentage_sum": 0, "max_percentage": 0, "last_attempt": None})
+        for result in results:
+            stats = updates[(result['scholar_id'], result.get('publish_id'))]
+            percentage = result_percentage(result)
+            stats["attempts"] += 1
+            stats["percentage_sum"] += percentage
+            stats["max_percentage"] = max(percentage, stats["max_percentage"])
+            if result.get('timestamp') and (stats["last_attempt"] is None or result['timestamp'] > stats["last_attempt"]):
+                stats["last_attempt"] = result['timestamp']
+
+        if not updates:
+            return
+        now = datetime.now()
+        operations = []
+        for (scholar_id, publish_id), stats in updates.items():
+            maximums = {"max_percentage": stats["max_percentage"]}
+            if stats["last_attempt"] is not None:
+                maximums["last_attempt"] = stats["last_attempt"]
+            update = {
+                "$inc": {"attempts": stats["attempts"], "percentage_sum": stats["percentage_sum"]},
+                "$max": maximums,
+                "$set": {"updated_at": now}
+            }
+            query = {"_id": scholar_id}
+            if publish_id is not None:
+                query["publish_ids"] = {"$ne": publish_id}
+                update["$push"] = {"publish_ids": publish_id}
+            # Students without a document yet are built from their results on first read
+            operations.append(UpdateOne(query, update))
+        student_stats_collection.bulk_write(operations, ordered=False)
+
+    def compute(self, scholar_ids=None):
+        """Stats of the given students (or everyone) computed from their results"""
+        match = {"published": True}
+        if scholar_ids is not None:
+            match["scholar_id"] = {"$in": list(scholar_ids)}
+        pipeline = [
+            {"$match": match},
+            {"$group": {
+                "_id": "$scholar_id",
+                "attempts": {"$sum": 1},
+                "percentage_sum": {"$sum": PERCENTAGE_EXPR},
+                "max_percentage": {"$max": PERCENTAGE_EXPR},
+                "last_attempt": {"$max": "$timestamp"},
+                "publish_ids": {"$addToSet": "$publish_id"}
+            }}
+        ]
+        computed = {}
+        for stats in results_collection.aggregate(pipeline, allowDiskUse=True):
+            stats["publish_ids"] = [publish_id for publish_id in stats.get("publish_ids", []) if publish_id]
+            computed[stats['_id']] = stats
+        return computed
+
+    def catch_up(self, stats_by_student):
+        """Count publishes of the given students that happened after their
+        stats documents were computed (``stats_by_student`` maps scholar_id
+        to the written document)"""
+        if not stats_by_student:
+            return
+        missed = [
+            result
+            for result in results_collection.find(
+                {"scholar_id": {"$in": list(stats_by_student)}, "published": True, "publish_id": {"$exists": True}},
+                {'_id': 0, 'scholar_id': 1, 'publish_id': 1, 'score': 1, 'total': 1, 'timestamp': 1}
+            )
+            if result['publish_id'] not in stats_by_student[result['scholar_id']].get('publish_ids', ())
+        ]
+        if missed:
+            self.add_published(missed)
+
+    def rebuild(self, scholar_ids=None):
+        """Recompute stats from the results collection; returns the number written.
+
+        Without ``scholar_ids`` every document is rebuilt and stats of
+        students without published results are removed.
+        """
+        if scholar_ids is not None:
+            scholar_ids = set(scholar_ids)
+            if not scholar_ids:
+                return 0
+        computed = self.compute(scholar_ids)
+        if scholar_ids is None:
+            student_stats_collection.delete_many({"_id": {"$nin": list(computed)}})
+        else:
+            for scholar_id in scholar_ids - set(computed):
+                computed[scholar_id] = empty_stats(scholar_id)
+
+        now = datetime.now()
+        operations = [
+            ReplaceOne({"_id": scholar_id}, dict(stats, updated_at=now), upsert=True)
+            for scholar_id, stats in computed.items()
+        ]
+        for start in range(0, len(operations), STATS_BATCH_SIZE):
+            student_stats_collection.bulk_write(operations[start:start + STATS_BATCH_SIZE], ordered=False)
+        if scholar_ids is not None:
+            self.catch_up(computed)
+        return len(operations)
+
+    def forget(self, scholar_id):
+        """Drop a deleted student's stats"""
+        student_stats_collection.delete_one({"_id": scholar_id})
+
+    def get(self, scholar_id):
+        """Stats document of a student, built from their results on first use"""
+        stats = student_stats_collection.find_one({"_id": scholar_id})
+        if stats is not None:
+            return stats
+
+        stats = self.compute([scholar_id]).get(scholar_id) or empty_stats(scholar_id)
+        stats["updated_at"] = datetime.now()
+        try:
+            student_stats_collection.insert_one(stats)
+        except DuplicateKeyError:
+            # Built concurrently by another request
+            return student_stats_collection.find_one({"_id": scholar_id}) or stats
+        # A publish between the computation and the insert found no document to update
+        self.catch_up({scholar_id: stats})
+        return student_stats_collection.find_one({"_id": scholar_id}) or stats
+
+
+# Global student stats service instance
+student_stats_service = StudentStatsService()
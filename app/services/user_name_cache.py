@@ -0,0 +1,53 @@
+import threading
+from cachetools import TTLCache
+from app.models.user_models import users_collection
+
+# Scholar ids per $in query
+NAME_BATCH_SIZE = 1000
+
+
+class UserNameCache:
+    """Bounded, short-lived cache of student names keyed by scholar_id.
+
+    Listing and export routes resolve the names of a whole page or export
+    with ``get_names``, which only queries the ids it doesn't already hold,
+    in batched ``$in`` fetches. Routes that rename a student call ``forget``.
+    """
+
+    def __init__(self, max_names=50000, ttl=600):
+        self._names = TTLCache(maxsize=max_names, ttl=ttl)
+        self._lock = threading.Lock()
+
+    def get_names(self, scholar_ids):
+        """Map each scholar_id to its name ('Unknown' for missing users)"""
+        names = {}
+        missing = []
+        with self._lock:
+            for scholar_id in set(scholar_ids):
+                name = self._names.get(scholar_id)
+                if name is None:
+                    missing.append(scholar_id)
+                else:
+                    names[scholar_id] = name
+
+        for start in range(0, len(missing), NAME_BATCH_SIZE):
+            batch = missing[start:start + NAME_BATCH_SIZE]
+            fetched = {
+                user['scholar_id']: user.get('name') or 'Unknown'
+                for user in users_collection.find({'scholar_id': {'$in': batch}}, {'_id': 0, 'scholar_id': 1, 'name': 1})
+            }
+            with self._lock:
+                for scholar_id in batch:
+                    names[scholar_id] = fetched.get(scholar_id, 'Unknown')
+                    if scholar_id in fetched:
+                        self._names[scholar_id] = fetched[scholar_id]
+        return names
+
+    def forget(self, scholar_id):
+        """Drop a cached name after the user was renamed or deleted"""
+        with self._lock:
+            self._names.pop(scholar_id, None)
+
+
+# Global user name cache instance
+user_name_cache = UserNameCache()
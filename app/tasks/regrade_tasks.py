@@ -0,0 +1,273 @@
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+from pymongo import UpdateOne
+from app.models.attempt_models import attempts_collection
+from app.models.question_models import question_bank_collection
+from app.models.quiz_models import results_collection
+from app.services.leaderboard_service import leaderboard_service
+from app.services.student_stats import student_stats_service
+from app.services.quiz_report import quiz_report_service
+from app.services.score_percentiles import score_percentile_index
+from app.services.live_board import live_board_service
+from app.services.dashboard_stats import dashboard_stats_snapshot
+from app.services.item_analysis import item_analysis_service
+from app.utils.grading import AnswerKey
+from app.utils.item_analysis import question_set_key, options_key
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Attempts re-scored and written back per bulk_write
+REGRADE_BATCH_SIZE = 1000
+# Score changes kept in memory for the status report
+MAX_REPORTED_DIFFS = 500
+# Attempts started this long after a regrade began may still have used the
+# old paper (other workers reload active quizzes every few seconds)
+STALE_START_WINDOW = timedelta(seconds=30)
+# Open attempts are regraded this long after their deadline, and given up on
+# (treated as abandoned) this long after it
+FOLLOW_UP_DELAY = timedelta(seconds=60)
+FOLLOW_UP_LIMIT = timedelta(minutes=5)
+
+class RegradeProcessor:
+    """Re-scores submitted attempts after a question's correct answer changes.
+
+    Attempts are streamed from the ``attempts`` collection in batches. Each
+    batch is graded in one go from the stored answers against the current
+    question bank, and only the results whose score changed are written back
+    with a single unordered ``bulk_write``, together with their per-question
+    ``responses`` re-encoded against the current answer key. Results without
+    an ``attempt_id`` predate stored responses and cannot be regraded.
+
+    Attempts still in progress when a job starts keep grading against the
+    answer key of the paper they started on. A follow-up job is scheduled
+    after their deadline that regrades the attempts finished since.
+    """
+
+    def __init__(self):
+        self.is_processing = False
+        self.processing_thread = None
+        self.pending = deque()
+        self.current_job = None
+        self.last_job = None
+        self._lock = threading.Lock()
+
+    def _new_job(self, question_id, query, follow_up):
+        return {
+            "question_id": question_id,
+            "follow_up": follow_up,
+            "total": attempts_collection.count_documents(query),
+            "processed": 0,
+            "changed": 0,
+            "skipped": 0,
+            "diffs": [],
+            "started_at": datetime.now(),
+            "finished_at": None,
+            "error": None
+        }
+
+    def regrade_question(self, question_id, since=None, started_before=None):
+        """Regrade every submitted attempt that contains ``question_id``.
+
+        A follow-up job passes ``since`` and ``started_before`` to only
+        regrade attempts that started before the regrade (on the old paper)
+        and finished after the previous job began.
+        """
+        query = {"question_ids": question_id, "status": {"$ne": "in_progress"}}
+        if since is not None:
+            query.update({"finished_at": {"$gte": since}, "started_at": {"$lte": started_before}})
+        job = self._new_job(question_id, query, since is not None)
+        self.current_job = job
+        if started_before is None:
+            started_before = job["started_at"] + STALE_START_WINDOW
+        # Attempts submitted while the pass runs may be missed by its cursor,
+        # so the attempts open at the start count towards the follow-up too
+        open_deadline = self._latest_open_deadline(question_id, started_before)
+        logger.info(f"Regrading {job['total']} attempts for question {question_id}")
+
+        questions = {}
+        batch = []
+        cursor = attempts_collection.find(
+            query,
+            {'_id': 0, 'attempt_id': 1, 'question_ids': 1, 'answers': 1}
+        ).batch_size(REGRADE_BATCH_SIZE)
+
+        try:
+            for attempt in cursor:
+                batch.append(attempt)
+                if len(batch) >= REGRADE_BATCH_SIZE:
+                    self._regrade_batch(job, batch, questions)
+                    batch = []
+            if batch:
+                self._regrade_batch(job, batch, questions)
+        except Exception as e:
+            logger.error(f"Error regrading question {question_id}: {str(e)}")
+            job["error"] = str(e)
+        finally:
+            cursor.close()
+
+        job["finished_at"] = datetime.now()
+        try:
+            deadlines = [d for d in (open_deadline, self._latest_open_deadline(question_id, started_before)) if d]
+            if deadlines:
+                self._schedule_follow_up(question_id, job["started_at"], started_before, max(deadlines))
+        except Exception as e:
+            logger.error(f"Error scheduling follow-up regrade of {question_id}: {str(e)}")
+        self.last_job = job
+        self.current_job = None
+        logger.info(f"Regrade of {question_id} completed. Processed: {job['processed']}, "
+                    f"changed: {job['changed']}, skipped: {job['skipped']}")
+        return job
+
+    def _regrade_batch(self, job, batch, questions):
+        """Grade one batch of attempts and write back the changed scores"""
+        missing = {qid for attempt in batch for qid in attempt['question_ids']} - questions.keys()
+        if missing:
+            for question in question_bank_collection.find(
+                    {"question_id": {"$in": list(missing)}},
+                    {'_id': 0, 'question_id': 1, 'options': 1, 'correct_answer': 1}):
+                questions[question['question_id']] = question
+            for qid in missing - questions.keys():
+                questions[qid] = None
+
+        # Attempts with a deleted question can't be re-scored against the bank
+        gradable = [a for a in batch if all(questions[qid] is not None for qid in a['question_ids'])]
+        job["skipped"] += len(batch) - len(gradable)
+
+        # One column per question of the batch, so differently shuffled
+        # attempts share one answer key and one response matrix
+        columns = list({qid for attempt in gradable for qid in attempt['question_ids']})
+        column_index = {qid: i for i, qid in enumerate(columns)}
+        answer_key = AnswerKey([questions[qid] for qid in columns])
+        answer_maps = [
+            {column_index[attempt['question_ids'][int(i)]]: answer
+             for i, answer in attempt.get('answers', {}).items()
+             if int(i) < len(attempt['question_ids'])}
+            for attempt in gradable
+        ]
+        responses = answer_key.encode_many(answer_maps)
+        scores = answer_key.score_many(responses)
+        new_scores = {attempt['attempt_id']: int(score) for attempt, score in zip(gradable, scores)}
+
+        # Stored responses are in question_id order and tagged with the
+        # options they were encoded against (see AttemptStore.get_responses)
+        new_responses = {}
+        for row, attempt in enumerate(gradable):
+            canonical = [column_index[qid] for qid in sorted(attempt['question_ids'])]
+            new_responses[attempt['attempt_id']] = {
+                "question_set": question_set_key(attempt['question_ids']),
+                "options_key": options_key(answer_key.take(canonical)),
+                "responses": responses[row, canonical].tolist()
+            }
+
+        now = datetime.now()
+        updates = []
+        changed_results = []
+        rewritten_quizzes = set()
+        for result in results_collection.find(
+                {"attempt_id": {"$in": list(new_scores)}},
+                {'_id': 0, 'attempt_id': 1, 'scholar_id': 1, 'quiz_id': 1, 'score': 1,
+                 'published': 1, 'timestamp': 1, 'course': 1, 'semester': 1,
+                 'options_key': 1, 'responses': 1}):
+            new_score = new_scores[result['attempt_id']]
+            stored = new_responses[result['attempt_id']]
+            score_changed = result.get('score') != new_score
+            if (not score_changed and result.get('options_key') == stored['options_key']
+                    and result.get('responses') == stored['responses']):
+                continue
+            rewritten_quizzes.add(result.get('quiz_id'))
+            updates.append(UpdateOne(
+                {"attempt_id": result['attempt_id']},
+                {"$set": {"score": new_score, **stored, "regraded_at": now}}
+            ))
+            if not score_changed:
+                continue
+            changed_results.append(result)
+            if len(job["diffs"]) < MAX_REPORTED_DIFFS:
+                job["diffs"].append({
+                    "attempt_id": result['attempt_id'],
+                    "scholar_id": result.get('scholar_id'),
+                    "quiz_id": result.get('quiz_id'),
+                    "old_score": result.get('score'),
+                    "new_score": new_score
+                })
+
+        if updates:
+            results_collection.bulk_write(updates, ordered=False)
+            item_analysis_service.invalidate(rewritten_quizzes)
+        if changed_results:
+            leaderboard_service.refresh_for_results(changed_results)
+            student_stats_service.rebuild(result['scholar_id'] for result in changed_results if result.get('published'))
+            quiz_report_service.invalidate({result.get('quiz_id') for result in changed_results})
+            score_percentile_index.invalidate({result.get('quiz_id') for result in changed_results})
+            live_board_service.invalidate({result.get('quiz_id') for result in changed_results})
+            dashboard_stats_snapshot.invalidate()
+        job["changed"] += len(changed_results)
+        job["processed"] += len(batch)
+
+    def _latest_open_deadline(self, question_id, started_before):
+        """Latest deadline of the open attempts that started on the old paper"""
+        attempt = attempts_collection.find_one(
+            {"question_ids": question_id, "status": "in_progress",
+             "started_at": {"$lte": started_before},
+             "deadline": {"$gt": datetime.now() - FOLLOW_UP_LIMIT}},
+            {'_id': 0, 'deadline': 1},
+            sort=[('deadline', -1)]
+        )
+        return attempt['deadline'] if attempt else None
+
+    def _schedule_follow_up(self, question_id, since, started_before, deadline):
+        """Queue a follow-up regrade for attempts finished after ``since``"""
+        delay = max(deadline + FOLLOW_UP_DELAY - datetime.now(), FOLLOW_UP_DELAY)
+        logger.info(f"Open attempts for question {question_id}; "
+                    f"follow-up regrade in {int(delay.total_seconds())}s")
+        timer = threading.Timer(delay.total_seconds(), self._enqueue, (question_id, since, started_before))
+        timer.daemon = True
+        timer.start()
+
+    def process_pending(self):
+        """Regrade queued questions until the queue is empty"""
+        try:
+            while True:
+                with self._lock:
+                    if not self.pending:
+                        self.is_processing = False
+                        return
+                    question_id, since, started_before = self.pending.popleft()
+                self.regrade_question(question_id, since, started_before)
+        except Exception as e:
+            logger.error(f"Error in regrade thread: {str(e)}")
+            with self._lock:
+                self.is_processing = False
+
+    def start_regrade(self, question_id):
+        """Queue a question for regrading and start the background thread"""
+        self._enqueue(question_id)
+
+    def _enqueue(self, question_id, since=None, started_before=None):
+        item = (question_id, since, started_before)
+        with self._lock:
+            if item not in self.pending:
+                self.pending.append(item)
+            if self.is_processing:
+                logger.info(f"Regrade of {question_id} queued")
+                return
+            self.is_processing = True
+
+        self.processing_thread = threading.Thread(target=self.process_pending)
+        self.processing_thread.daemon = True
+        self.processing_thread.start()
+        logger.info("Regrade background processing started")
+
+    def get_status(self):
+        """Progress of the running job and the report of the last one"""
+        return {
+            "is_processing": self.is_processing,
+            "pending": [item[0] for item in self.pending],
+            "current_job": self.current_job,
+            "last_job": self.last_job
+        }
+
+# Global regrade processor instance
+regrade_processor = RegradeProcessor()
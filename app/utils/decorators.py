@@ -1,7 +1,8 @@
 from functools import wraps
-from flask import session, redirect, url_for, abort, make_response, flash
+from flask import session, redirect, url_for, abort, make_response, flash, request, Response
 from app.utils.helpers import ROLES
 from app.models.user_models import users_collection
+from app.services.response_cache import response_cache
 
 def login_required(f):
     """Decorator to require login for any user"""
@@ -130,4 +131,30 @@ def no_cache(f):
         response.headers['Pragma'] = 'no-cache'
         response.headers['Expires'] = '0'
         return response
-    return decorated_function
\ No newline at end of file
+    return decorated_function
+
+def cached_response(max_age=60):
+    """Decorator to serve a public GET route from the response cache.
+    
+    Successful responses are cached per route and arguments until the next
+    publish; clients get an ETag and a 304 when their copy is current.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            key = (request.endpoint, tuple(sorted(kwargs.items())))
+            entry = response_cache.get(key)
+            if entry is None:
+                version = response_cache.version
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                entry = response_cache.store(key, response.get_data(), response.mimetype, version)
+            
+            response = Response(entry.body, mimetype=entry.mimetype)
+            response.set_etag(entry.etag)
+            response.cache_control.public = True
+            response.cache_control.max_age = max_age
+            return response.make_conditional(request)
+        return decorated_function
+    return decorator
\ No newline at end of file
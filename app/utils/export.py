@@ -0,0 +1,70 @@
+import csv
+import io
+import tempfile
+import zlib
+from datetime import datetime
+
+# Rows serialized before a CSV chunk is handed to the response
+CSV_CHUNK_ROWS = 1000
+
+
+def iter_csv(header, rows, compress=False):
+    """Serialize rows to CSV incrementally, yielding encoded chunks.
+
+    Only one chunk of rows is held in memory at a time. With ``compress``
+    the chunks form a single gzip stream.
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(header)
+
+    def take_chunk():
+        data = buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+        return compressor.compress(data) if compressor else data
+
+    pending = 1
+    for row in rows:
+        writer.writerow(row)
+        pending += 1
+        if pending >= CSV_CHUNK_ROWS:
+            chunk = take_chunk()
+            if chunk:
+                yield chunk
+            pending = 0
+
+    chunk = take_chunk()
+    if compressor:
+        chunk += compressor.flush()
+    if chunk:
+        yield chunk
+
+
+def write_xlsx(header, rows, sheet_name='Sheet1'):
+    """Write rows to an XLSX temporary file in XlsxWriter's constant-memory
+    mode and return the file rewound to the start.
+
+    Each row is flushed to disk as soon as it is written, so memory stays flat
+    regardless of the number of rows. Raises ImportError when XlsxWriter is not
+    installed.
+    """
+    import xlsxwriter
+
+    output = tempfile.TemporaryFile()
+    workbook = xlsxwriter.Workbook(output, {'constant_memory': True})
+    worksheet = workbook.add_worksheet(sheet_name)
+    date_format = workbook.add_format({'num_format': 'yyyy-mm-dd hh:mm:ss'})
+
+    worksheet.write_row(0, 0, header)
+    for row_index, row in enumerate(rows, start=1):
+        for col_index, value in enumerate(row):
+            if isinstance(value, datetime):
+                worksheet.write_datetime(row_index, col_index, value, date_format)
+            elif value is not None:
+                worksheet.write(row_index, col_index, value)
+
+    workbook.close()
+    output.seek(0)
+    return output
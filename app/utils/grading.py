@@ -0,0 +1,82 @@
+import numpy as np
+
+# Response codes; none of them can ever equal an answer key entry
+UNANSWERED = -1
+UNKNOWN_ANSWER = -2
+NO_KEY = -3
+
+
+class AnswerKey:
+    """Answer key of a question list encoded as option indices.
+
+    Every question gets a small vocabulary of its options (plus the correct
+    answer, if it isn't one of them) and responses are encoded against it, so
+    grading is an integer compare against ``key`` instead of string compares.
+    Grading gives the same result as ``answer == question['correct_answer']``.
+    """
+
+    def __init__(self, questions):
+        self.vocab = []
+        self.key = np.full(len(questions), NO_KEY, dtype=np.int16)
+        for i, question in enumerate(questions):
+            vocab = {}
+            for option in question.get('options') or ():
+                vocab.setdefault(option, len(vocab))
+            correct_answer = question.get('correct_answer')
+            if correct_answer is not None:
+                self.key[i] = vocab.setdefault(correct_answer, len(vocab))
+            self.vocab.append(vocab)
+
+    def __len__(self):
+        return len(self.key)
+
+    def take(self, order):
+        """Answer key of the same questions in another order (e.g. an attempt's shuffle)"""
+        answer_key = AnswerKey.__new__(AnswerKey)
+        answer_key.vocab = [self.vocab[i] for i in order]
+        answer_key.key = self.key[list(order)]
+        return answer_key
+
+    def encode(self, answers):
+        """Encode an answer map ({question_index: answer}) as a response row"""
+        row = np.full(len(self), UNANSWERED, dtype=np.int16)
+        for question_index, answer in answers.items():
+            try:
+                i = int(question_index)
+                if 0 <= i < len(self):
+                    row[i] = self.vocab[i].get(answer, UNKNOWN_ANSWER)
+            except (TypeError, ValueError):
+                continue
+        return row
+
+    def encode_many(self, answer_maps):
+        """Encode many answer maps as an (attempts x questions) response matrix"""
+        matrix = np.full((len(answer_maps), len(self)), UNANSWERED, dtype=np.int16)
+        for row, answers in enumerate(answer_maps):
+            matrix[row] = self.encode(answers)
+        return matrix
+
+    def correct(self, responses):
+        """Boolean mask of correct responses for a response row or matrix"""
+        return responses == self.key
+
+    def score(self, answers):
+        """Score a single attempt's answer map"""
+        return int(self.correct(self.encode(answers)).sum())
+
+    def score_many(self, responses):
+        """Score every row of a response matrix"""
+        return self.correct(responses).sum(axis=1)
+
+
+def grade_attempt(questions, answers):
+    """Grade one attempt; returns the score and a per-question correct mask"""
+    answer_key = AnswerKey(questions)
+    correct = answer_key.correct(answer_key.encode(answers))
+    return int(correct.sum()), correct
+
+
+def grade_attempts(questions, answer_maps):
+    """Grade many attempts of the same question list at once"""
+    answer_key = AnswerKey(questions)
+    return answer_key.score_many(answer_key.encode_many(answer_maps))
@@ -10,6 +10,10 @@ from io import BytesIO
 import random
 import json
 import os
+import logging
+from app.utils.taxonomy import SCHOOL_DEPARTMENTS, DEPARTMENT_COURSES, SCHOOL_NAMES, DEPARTMENT_NAMES, COURSE_NAMES, student_course_filter
+
+logger = logging.getLogger(__name__)
 
 # Collections
 def get_collection(collection_name):
@@ -35,101 +39,9 @@ ROLES = {
     }
 }
 
-# School to Department mapping
-schoolDepartments = {
-    "School of Technology, Communication and Management": [
-        "Department of Computer Sciences",
-        "Department of Tourism Management",
-        "Department of Journalism & Mass Communication",
-        "Department of Animation and Visual Effects",
-    ],
-    "School of Biological Sciences and Sustainability": [
-        "Department of Rural Studies and Sustainability",
-    ],
-    "School of Indology": [
-        "Department of Sanskrit and Vedic Studies",
-        "Department of Hindi",
-        "Department of Indian Classical Music",
-        "Department of History and Indian Culture",
-    ],
-    "School of Humanities, Social Sciences and Foundation Courses": [
-        "Department of English",
-        "Department of Education",
-        "Department of Psychology",
-        "Department of Life Management",
-        "Department of Scientific Spirituality",
-        "Department of Oriental Studies, Religious Studies & Philosophy",
-        "Department of Yogic Sciences and Human Consciousness",
-    ],
-}
-
-# Department to Course mapping
-departmentCourses = {
-    "Department of Computer Sciences": [
-        "B.Sc. Information Technology (Honors)",
-        "Bachelor of Computer Application (Honors)",
-        "Master of Computer Application (Data Science)",
-    ],
-    "Department of Tourism Management": [
-        "B.B.A Tourism & Travel Management (Honors)",
-        "M.B.A. Tourism & Travel Management",
-    ],
-    "Department of Journalism & Mass Communication": [
-        "B.A. Journalism and Mass Communication (Honors)",
-        "M. A. Journalism and Mass Communication",
-        "M. A. Spiritual Journalism",
-    ],
-    "Department of Animation and Visual Effects": [
-        "B.Voc. (Bachelor of Vocation) in 3D Animation and VFX (Honors)",
-    ],
-    "Department of Rural Studies and Sustainability": [
-        "Bachelor of Rural Studies (Honors)",
-    ],
-    "Department of English": ["B.A. English (Honors)"],
-    "Department of Education": ["B.Ed. (Bachelor of Education)"],
-    "Department of Psychology": [
-        "B.A. Psychology (Honors)",
-        "M.A. Counselling Psychology",
-        "M.Sc. Counselling Psychology",
-    ],
-    "Department of Life Management": [
-        "Life Management - Compulsory Program for PG and UG",
-    ],
-    "Department of Scientific Spirituality": [
-        "M.Sc. Herbal Medicine and Natural Product Chemistry",
-        "M.Sc. Molecular Physiology and Traditional Health Sciences",
-        "M.Sc. Indigenous Approaches for Child Development & Generational Dynamics",
-        "M.Sc. Indian Knowledge Systems",
-        "M.A. Indian Knowledge Systems",
-    ],
-    "Department of Oriental Studies, Religious Studies & Philosophy": [
-        "M.A. Hindu Studies",
-        "M.A. Philosophy",
-    ],
-    "Department of Yogic Sciences and Human Consciousness": [
-        "B.Sc. Yogic Science (Honors)",
-        "M.Sc. Yoga Therapy",
-        "M.A. Human Consciousness & Yogic Science",
-        "M.Sc. Human Consciousness & Yogic Science",
-        "P. G. Diploma Human Consciousness, Yoga & Alternative Therapy",
-        "Certificate In Yoga And Alternative Therapy",
-    ],
-    "Department of Sanskrit and Vedic Studies": [
-        "B.A. Sanskrit (Honors)",
-        "M.A. Sanskrit",
-    ],
-    "Department of Hindi": ["B.A. Hindi (Honors)", "M.A. Hindi"],
-    "Department of Indian Classical Music": [
-        "B.A. Music (Vocal) (Honors)",
-        "M.A. Music (Vocal)",
-        "B.A. Music Instrumental Mridang/Tabla (Honors)",
-        "M.A. Music (Tabla, Pakhaawaj)",
-    ],
-    "Department of History and Indian Culture": [
-        "B.A. History (Honors)",
-        "M. A. History and Indian Culture",
-    ],
-}
+# Academic hierarchy (kept under its historical names)
+schoolDepartments = SCHOOL_DEPARTMENTS
+departmentCourses = DEPARTMENT_COURSES
 
 # Question difficulty tags
 QUESTION_TAGS = ['beginner', 'easy', 'intermediate', 'advanced', 'expert']
@@ -162,16 +74,24 @@ def create_indexes():
     activities_collection = get_collection('activities')
     quiz_participants_collection = get_collection('quiz_participants')
     admin_users_collection = get_collection('admin_users')
+    attempts_collection = get_collection('attempts')
+    leaderboards_collection = get_collection('leaderboards')
 
     users_collection.create_index("scholar_id", unique=True)
     users_collection.create_index("email", unique=True)
     questions_collection.create_index("question_id", unique=True)
     question_review_collection.create_index("question_id", unique=True)
     question_bank_collection.create_index("question_id", unique=True)
+    question_bank_collection.create_index([("difficulty", 1), ("_id", 1)])
+    question_review_collection.create_index([("difficulty", 1), ("_id", 1)])
     quizzes_collection.create_index("quiz_id", unique=True)
+    quizzes_collection.create_index("questions")
+    quizzes_collection.create_index([("status", 1), ("course", 1), ("semester", 1)])
     results_collection.create_index("scholar_id")
     results_collection.create_index("workspace_id")
     results_collection.create_index([("scholar_id", 1), ("timestamp", -1)])
+    results_collection.create_index([("timestamp", -1), ("_id", -1)])
+    results_collection.create_index([("course_id", 1), ("semester", 1), ("timestamp", -1), ("_id", -1)])
     user_sessions_collection.create_index("workspace_id", unique=True)
     user_sessions_collection.create_index("scholar_id")
     quiz_settings_collection.create_index([("course", 1), ("semester", 1)], unique=True)
@@ -180,6 +100,10 @@ def create_indexes():
     notifications_collection.create_index("scholar_id")
     notifications_collection.create_index("timestamp")
     users_collection.create_index("blocked")
+    users_collection.create_index([("course", 1), ("semester", 1), ("scholar_id", 1), ("_id", 1)])
+    users_collection.create_index("school_id")
+    users_collection.create_index("department_id")
+    users_collection.create_index("course_id")
     admin_notifications_collection.create_index("timestamp")
     admin_notifications_collection.create_index("read")
     activities_collection.create_index("timestamp")
@@ -187,6 +111,38 @@ def create_indexes():
     admin_users_collection.create_index("username", unique=True)
     admin_users_collection.create_index("role")
     admin_users_collection.create_index("active")
+    attempts_collection.create_index("attempt_id", unique=True)
+    attempts_collection.create_index([("scholar_id", 1), ("quiz_id", 1)])
+    attempts_collection.create_index([("quiz_id", 1), ("started_at", 1)])
+    attempts_collection.create_index("question_ids")
+    results_collection.create_index("attempt_id")
+    results_collection.create_index("publish_id", sparse=True)
+    results_collection.create_index([("published", 1), ("timestamp", -1)])
+    # Admin leaderboard filters on the student attributes copied onto results
+    results_collection.create_index([("published", 1), ("school_id", 1), ("department_id", 1), ("course_id", 1), ("semester", 1)])
+    results_collection.create_index([("published", 1), ("course", 1), ("semester", 1)])
+    results_collection.create_index([("published", 1), ("quiz_id", 1)])
+    results_collection.create_index([("quiz_id", 1), ("question_set", 1), ("options_key", 1)])
+    leaderboards_collection.create_index([("scope", 1), ("course", 1), ("semester", 1), ("date", -1)], unique=True)
+    try:
+        # One result per student and quiz; legacy results without a quiz_id are exempt
+        results_collection.create_index(
+            [("scholar_id", 1), ("quiz_id", 1)],
+            unique=True,
+            partialFilterExpression={"quiz_id": {"$type": "string"}}
+        )
+    except Exception as e:
+        # Without it a resubmitted quiz is no longer rejected, so make it loud
+        logger.error(f"Error creating unique result index on (scholar_id, quiz_id); "
+                     f"duplicate results will not be rejected until it is built: {str(e)}")
+    # Superseded by the indexes on the integer academic codes and options_key
+    for index_name in ("course_1_semester_1_timestamp_-1__id_-1",
+                       "published_1_school_1_department_1_course_1_semester_1",
+                       "quiz_id_1_question_set_1"):
+        try:
+            results_collection.drop_index(index_name)
+        except Exception:
+            pass
 
 def initialize_ai_monitoring():
     """Initialize AI monitoring collections and settings"""
@@ -222,15 +178,19 @@ def initialize_ai_monitoring():
 def initialize_notification_system():
     """Initialize notification collections"""
     try:
-        from app.models.notification_models import get_notifications_collection, get_admin_notifications_collection
+        from app.models.notification_models import get_notifications_collection, get_admin_notifications_collection, get_broadcast_notifications_collection
         
         notifications_collection = get_notifications_collection()
         admin_notifications_collection = get_admin_notifications_collection()
+        broadcast_notifications_collection = get_broadcast_notifications_collection()
         
         # Create indexes for better performance
         notifications_collection.create_index([("scholar_id", 1), ("timestamp", -1)])
         notifications_collection.create_index([("read", 1)])
         
+        broadcast_notifications_collection.create_index([("audience.scholar_ids", 1), ("timestamp", -1)])
+        broadcast_notifications_collection.create_index([("audience.course", 1), ("audience.semester", 1), ("timestamp", -1)])
+        
         admin_notifications_collection.create_index([("timestamp", -1)])
         admin_notifications_collection.create_index([("read", 1)])
         
@@ -277,12 +237,90 @@ def add_created_at_to_users():
         {"$set": {"created_at": datetime.now()}}
     )
 
+def run_migration_once(name, migration, description):
+    """Run a one-off data migration unless the migrations collection records
+    it as done, so later startups skip its ``$exists`` scans"""
+    migrations_collection = get_collection('migrations')
+    if migrations_collection.find_one({'_id': name}, {'_id': 1}):
+        return
+    migration()
+    migrations_collection.update_one(
+        {'_id': name},
+        {'$setOnInsert': {'description': description, 'completed_at': datetime.now()}},
+        upsert=True
+    )
+
+def add_student_fields_to_results():
+    """Copy school, department and name of the student onto existing results"""
+    from pymongo import UpdateOne
+    from app.utils.taxonomy import course_info
+    results_collection = get_collection('results')
+    users_collection = get_collection('users')
+    
+    cursor = results_collection.find(
+        {"school": {"$exists": False}},
+        {'_id': 1, 'scholar_id': 1, 'course': 1, 'user_name': 1}
+    ).batch_size(1000)
+    
+    def backfill(batch):
+        users = {
+            user['scholar_id']: user
+            for user in users_collection.find(
+                {"scholar_id": {"$in": list({r.get('scholar_id') for r in batch})}},
+                {'_id': 0, 'scholar_id': 1, 'name': 1, 'school': 1, 'department': 1}
+            )
+        }
+        updates = []
+        for result in batch:
+            user = users.get(result.get('scholar_id'), {})
+            mapping = course_info(result.get('course')) or {}
+            fields = {
+                "school": user.get('school') or mapping.get('school'),
+                "department": user.get('department') or mapping.get('department')
+            }
+            if not result.get('user_name'):
+                fields["user_name"] = user.get('name')
+            updates.append(UpdateOne({"_id": result['_id']}, {"$set": fields}))
+        results_collection.bulk_write(updates, ordered=False)
+    
+    batch = []
+    for result in cursor:
+        batch.append(result)
+        if len(batch) >= 1000:
+            backfill(batch)
+            batch = []
+    if batch:
+        backfill(batch)
+
+def add_academic_codes():
+    """Store the integer school/department/course codes on existing users and results"""
+    from app.utils.taxonomy import academic_codes
+    for collection_name in ('users', 'results'):
+        collection = get_collection(collection_name)
+        # Few distinct name combinations exist, so one update_many per combination
+        combinations = collection.aggregate([
+            {"$match": {"course_id": {"$exists": False}}},
+            {"$group": {"_id": {"school": "$school", "department": "$department", "course": "$course"}}}
+        ])
+        for combination in combinations:
+            names = combination['_id']
+            query = {"course_id": {"$exists": False}}
+            query.update((field, names.get(field)) for field in ('school', 'department', 'course'))
+            collection.update_many(
+                query,
+                {"$set": academic_codes(names.get('school'), names.get('department'), names.get('course'))}
+            )
+
 def initialize_database():
     """Initialize the complete database"""
     cleanup_duplicate_emails()
     create_indexes()
     add_blocked_field()
     add_created_at_to_users()
+    run_migration_once('student_fields_on_results', add_student_fields_to_results,
+                       'School, department and name copied onto existing results')
+    run_migration_once('academic_codes', add_academic_codes,
+                       'Integer school/department/course codes stored on existing users and results')
     initialize_roles()
     initialize_notification_system()
     initialize_ai_monitoring()  # Add AI monitoring initialization
@@ -292,7 +330,9 @@ def initialize_database():
 def get_all_courses():
     """Get all unique courses from the database"""
     users_collection = get_collection('users')
-    courses = users_collection.distinct("course")
+    courses = {COURSE_NAMES[code] for code in users_collection.distinct("course_id") if code in COURSE_NAMES}
+    # Names outside the taxonomy have no code
+    courses.update(users_collection.distinct("course", {"course_id": None}))
     return sorted([course for course in courses if course])
 
 def get_all_semesters():
@@ -304,13 +344,17 @@ def get_all_semesters():
 def get_all_departments():
     """Get all unique departments from the database"""
     users_collection = get_collection('users')
-    departments = users_collection.distinct("department")
+    departments = {DEPARTMENT_NAMES[code] for code in users_collection.distinct("department_id") if code in DEPARTMENT_NAMES}
+    # Names outside the taxonomy have no code
+    departments.update(users_collection.distinct("department", {"department_id": None}))
     return sorted([dept for dept in departments if dept])
 
 def get_all_schools():
     """Get all unique schools from the database"""
     users_collection = get_collection('users')
-    schools = users_collection.distinct("school")
+    schools = {SCHOOL_NAMES[code] for code in users_collection.distinct("school_id") if code in SCHOOL_NAMES}
+    # Names outside the taxonomy have no code
+    schools.update(users_collection.distinct("school", {"school_id": None}))
     return sorted([school for school in schools if school])
 
 
@@ -324,6 +368,17 @@ def create_notification(scholar_id, title, message, notification_type="info", co
         print(f"Error creating notification: {str(e)}")
         return False
 
+def create_broadcast_notification(title, message, notification_type="info", course=None, semester=None, scholar_ids=None):
+    """Create one notification for every student of a course/semester (None
+    for all) or of an explicit scholar_id list"""
+    try:
+        from app.models.notification_models import create_broadcast_notification as create_broadcast
+        notification_id = create_broadcast(title, message, notification_type, course, semester, scholar_ids)
+        return notification_id is not None
+    except Exception as e:
+        print(f"Error creating broadcast notification: {str(e)}")
+        return False
+
 def create_admin_notification(title, message, notification_type="info", scholar_id=None, course=None, semester=None):
     """Create a notification for admin users"""
     try:
@@ -334,6 +389,12 @@ def create_admin_notification(title, message, notification_type="info", scholar_
         print(f"Error creating admin notification: {str(e)}")
         return False
 
+def queue_admin_notification(title, message, notification_type="info", scholar_id=None, course=None, semester=None):
+    """Queue an admin notification to be written in the background"""
+    from app.models.notification_models import build_notification
+    from app.services.background_writer import background_writer
+    background_writer.enqueue('admin_notifications', build_notification(title, message, notification_type, scholar_id, course, semester))
+
 def get_notifications(scholar_id, limit=10):
     """Get student notifications"""
     try:
@@ -363,22 +424,13 @@ def mark_admin_notifications_read():
 
 def get_user_stats(scholar_id):
     """Get user statistics"""
-    results_collection = get_collection('results')
-    quiz_attempts = results_collection.count_documents({"scholar_id": scholar_id, "published": True})
-    pipeline = [
-        {"$match": {"scholar_id": scholar_id, "published": True}},
-        {"$group": {
-            "_id": None,
-            "average_score": {"$avg": {"$multiply": [{"$divide": ["$score", "$total"]}, 100]}},
-            "highest_score": {"$max": {"$multiply": [{"$divide": ["$score", "$total"]}, 100]}}
-        }}
-    ]
-    stats = list(results_collection.aggregate(pipeline))
-    if stats:
+    from app.services.student_stats import student_stats_service
+    stats = student_stats_service.get(scholar_id)
+    if stats.get("attempts"):
         return {
-            "quiz_attempts": quiz_attempts,
-            "average_score": round(stats[0].get("average_score", 0), 1),
-            "highest_score": round(stats[0].get("highest_score", 0), 1)
+            "quiz_attempts": stats["attempts"],
+            "average_score": round(stats["percentage_sum"] / stats["attempts"], 1),
+            "highest_score": round(stats.get("max_percentage") or 0, 1)
         }
     else:
         return {
@@ -389,35 +441,8 @@ def get_user_stats(scholar_id):
 
 def is_quiz_active(course, semester):
     """Check if there's an active quiz for the given course/semester"""
-    quizzes_collection = get_collection('quizzes')
-    specific_quiz = quizzes_collection.find_one({
-        "course": course,
-        "semester": semester,
-        "status": "active"
-    })
-    
-    all_course_quiz = quizzes_collection.find_one({
-        "course": "all",
-        "semester": semester,
-        "status": "active"
-    })
-    
-    all_semester_quiz = quizzes_collection.find_one({
-        "course": course,
-        "semester": "all",
-        "status": "active"
-    })
-    
-    all_course_semester_quiz = quizzes_collection.find_one({
-        "course": "all",
-        "semester": "all", 
-        "status": "active"
-    })
-    
-    return (specific_quiz is not None or 
-            all_course_quiz is not None or 
-            all_semester_quiz is not None or 
-            all_course_semester_quiz is not None)
+    from app.services.active_quiz_resolver import active_quiz_resolver
+    return active_quiz_resolver.is_active(course, semester)
 
 def has_dashboard_access(path):
     """Check if user has access to the requested path"""
@@ -442,37 +467,8 @@ def has_dashboard_access(path):
 
 def find_active_quiz(course, semester):
     """Find an active quiz for the given course/semester"""
-    quizzes_collection = get_collection('quizzes')
-    quiz = quizzes_collection.find_one({
-        "course": course,
-        "semester": semester,
-        "status": "active"
-    })
-    if quiz:
-        return quiz
-    
-    quiz = quizzes_collection.find_one({
-        "course": "all",
-        "semester": semester,
-        "status": "active"
-    })
-    if quiz:
-        return quiz
-    
-    quiz = quizzes_collection.find_one({
-        "course": course,
-        "semester": "all",
-        "status": "active"
-    })
-    if quiz:
-        return quiz
-    
-    quiz = quizzes_collection.find_one({
-        "course": "all",
-        "semester": "all",
-        "status": "active"
-    })
-    return quiz
+    from app.services.active_quiz_resolver import active_quiz_resolver
+    return active_quiz_resolver.find(course, semester)
 
 def log_activity(activity_type, description, scholar_id=None, course=None, semester=None):
     """Log system activity"""
@@ -488,46 +484,44 @@ def log_activity(activity_type, description, scholar_id=None, course=None, semes
     activities_collection.insert_one(activity)
     return activity
 
+def queue_activity(activity_type, description, scholar_id=None, course=None, semester=None):
+    """Queue an activity log entry to be written in the background"""
+    from app.services.background_writer import background_writer
+    activity = {
+        "type": activity_type,
+        "description": description,
+        "scholar_id": scholar_id,
+        "course": course,
+        "semester": semester,
+        "timestamp": datetime.now()
+    }
+    background_writer.enqueue('activities', activity)
+    return activity
+
+def sync_result_student_fields(scholar_id, fields):
+    """Copy a changed display name (user_name) onto the student's results and
+    refresh the leaderboards showing them. School and department are
+    snapshotted at submission, like the course, and are not synced."""
+    from app.services.leaderboard_service import leaderboard_service
+    if not fields:
+        return
+    results_collection = get_collection('results')
+    results_collection.update_many({"scholar_id": scholar_id}, {"$set": fields})
+    if 'user_name' in fields:
+        leaderboard_service.refresh_for_results(results_collection.find(
+            {"scholar_id": scholar_id, "published": True},
+            {'_id': 0, 'published': 1, 'timestamp': 1, 'course': 1, 'semester': 1}
+        ))
+
 def check_student_enrollment(scholar_id, quiz_id, course, semester):
     """Check if a student is enrolled in a quiz"""
-    quizzes_collection = get_collection('quizzes')
-    quiz = quizzes_collection.find_one({"quiz_id": quiz_id})
-    if not quiz:
-        return False
-    
-    participants = quiz.get('participants', [])
-    
-    if scholar_id in participants:
-        return True
-    
-    if 'all' in participants:
-        return check_student_matches_filters(course, semester, quiz)
-    
-    return False
+    from app.services.enrollment_index import enrollment_index
+    return enrollment_index.is_enrolled(scholar_id, quiz_id, course, semester)
 
 def check_student_matches_filters(student_course, student_semester, quiz):
     """Check if a student matches the quiz's hierarchical filters"""
-    if quiz['school'] != 'all':
-        departments_in_school = schoolDepartments.get(quiz['school'], [])
-        course_matches_school = False
-        for dept in departments_in_school:
-            if student_course in departmentCourses.get(dept, []):
-                course_matches_school = True
-                break
-        if not course_matches_school:
-            return False
-    
-    if quiz['department'] != 'all':
-        if student_course not in departmentCourses.get(quiz['department'], []):
-            return False
-    
-    if quiz['course'] != 'all' and student_course != quiz['course']:
-        return False
-    
-    if quiz['semester'] != 'all' and str(student_semester) != quiz['semester']:
-        return False
-    
-    return True
+    from app.services.enrollment_index import compile_quiz
+    return compile_quiz(quiz)(student_course, student_semester)
 
 def validate_input(input_data, expected_fields):
     """Validate input data against expected fields"""
@@ -551,48 +545,11 @@ def build_student_query(quiz):
     """Build student query based on quiz filters"""
     query = {}
     
-    if quiz.get('school') != 'all':
-        school_name = quiz.get('school')
-        departments_in_school = schoolDepartments.get(school_name, [])
-        
-        if quiz.get('department') != 'all' and quiz.get('department') in departments_in_school:
-            departments_to_filter = [quiz.get('department')]
-        else:
-            departments_to_filter = departments_in_school
-        
-        courses_to_filter = []
-        for dept in departments_to_filter:
-            courses_to_filter.extend(departmentCourses.get(dept, []))
-        
-        if quiz.get('course') != 'all' and quiz.get('course') in courses_to_filter:
-            query['course'] = quiz.get('course')
-        else:
-            query['course'] = {'$in': courses_to_filter}
-        
-        if quiz.get('semester') != 'all':
-            query['semester'] = quiz.get('semester')
+    course_fragment = student_course_filter(quiz.get('school'), quiz.get('department'), quiz.get('course'))
+    if course_fragment is not None:
+        query['course'] = course_fragment
     
-    else:
-        if quiz.get('department') != 'all':
-            dept_name = quiz.get('department')
-            courses_to_filter = departmentCourses.get(dept_name, [])
-            
-            if quiz.get('course') != 'all' and quiz.get('course') in courses_to_filter:
-                query['course'] = quiz.get('course')
-            else:
-                query['course'] = {'$in': courses_to_filter}
-            
-            if quiz.get('semester') != 'all':
-                query['semester'] = quiz.get('semester')
-        
-        else:
-            if quiz.get('course') != 'all':
-                query['course'] = quiz.get('course')
-                
-                if quiz.get('semester') != 'all':
-                    query['semester'] = quiz.get('semester')
-            else:
-                if quiz.get('semester') != 'all':
-                    query['semester'] = quiz.get('semester')
+    if quiz.get('semester') != 'all':
+        query['semester'] = quiz.get('semester')
     
     return query
\ No newline at end of file
@@ -0,0 +1,99 @@
+import hashlib
+import numpy as np
+from app.utils.grading import UNANSWERED, UNKNOWN_ANSWER
+
+# Response codes are shifted by this much to index the option count columns
+CODE_OFFSET = -UNKNOWN_ANSWER
+
+
+def question_set_key(question_ids):
+    """Short fingerprint of a set of questions, independent of their order"""
+    digest = hashlib.sha1('\n'.join(sorted(question_ids)).encode('utf-8')).hexdigest()
+    return digest[:16]
+
+
+def options_key(answer_key):
+    """Short fingerprint of the option vocabularies of an answer key.
+
+    Stored responses are option indices, so they can only be decoded with
+    the vocabulary they were encoded against; results are tagged with this
+    key and editing or reordering options changes it.
+    """
+    vocab = [sorted(v.items(), key=lambda item: item[1]) for v in answer_key.vocab]
+    digest = hashlib.sha1(repr(vocab).encode('utf-8')).hexdigest()
+    return digest[:16]
+
+
+def canonical_order(question_ids):
+    """Positions of ``question_ids`` sorted by id; stored responses use this order"""
+    return sorted(range(len(question_ids)), key=question_ids.__getitem__)
+
+
+def response_matrix(rows, n_questions):
+    """Stack stored response arrays into an (attempts x questions) int16 matrix,
+    skipping rows of a different length"""
+    rows = [row for row in rows if len(row) == n_questions]
+    if not rows:
+        return np.empty((0, n_questions), dtype=np.int16)
+    return np.asarray(rows, dtype=np.int16)
+
+
+def analyze_responses(answer_key, responses):
+    """Classical item analysis of a response matrix in one vectorized pass.
+
+    ``responses`` holds option indices (or the UNANSWERED/UNKNOWN_ANSWER codes)
+    in the same question order as ``answer_key``. Returns a dict of arrays:
+
+    - ``p_values``: share of attempts answering each question correctly
+    - ``discrimination``: point-biserial correlation between getting the
+      question right and the score on the other questions (NaN when either
+      side has no variance)
+    - ``option_counts``: questions x options matrix of how often each option
+      was chosen (distractor frequencies)
+    - ``unanswered`` / ``unknown``: per-question counts of skipped questions
+      and answers that are no longer options
+    - ``scores``: each attempt's total score
+    """
+    n_attempts, n_questions = responses.shape
+    # Indices past a question's current options (it was edited) count as unknown
+    vocab_sizes = np.array([len(vocab) for vocab in answer_key.vocab], dtype=np.int16)
+    responses = np.where(responses < vocab_sizes, responses, UNKNOWN_ANSWER).astype(np.int16)
+
+    correct = answer_key.correct(responses)
+    scores = correct.sum(axis=1)
+    if not n_attempts:
+        empty = np.zeros(n_questions, dtype=np.int64)
+        return {
+            "attempts": 0,
+            "p_values": np.full(n_questions, np.nan),
+            "discrimination": np.full(n_questions, np.nan),
+            "option_counts": np.zeros((n_questions, int(vocab_sizes.max(initial=0))), dtype=np.int64),
+            "unanswered": empty,
+            "unknown": empty,
+            "scores": scores
+        }
+
+    correct_f = correct.astype(np.float64)
+    p_values = correct_f.mean(axis=0)
+
+    # Item-rest correlation: the item itself is left out of the total
+    rest = scores[:, None] - correct_f
+    with np.errstate(invalid='ignore', divide='ignore'):
+        covariance = (correct_f * rest).mean(axis=0) - p_values * rest.mean(axis=0)
+        discrimination = covariance / (np.sqrt(p_values * (1 - p_values)) * rest.std(axis=0))
+    discrimination[~np.isfinite(discrimination)] = np.nan
+
+    # One bincount over (question, code) pairs gives every option count at once
+    width = int(vocab_sizes.max(initial=0)) + CODE_OFFSET
+    cells = responses.astype(np.int64) + CODE_OFFSET + np.arange(n_questions) * width
+    counts = np.bincount(cells.ravel(), minlength=n_questions * width).reshape(n_questions, width)
+
+    return {
+        "attempts": n_attempts,
+        "p_values": p_values,
+        "discrimination": discrimination,
+        "option_counts": counts[:, CODE_OFFSET:],
+        "unanswered": counts[:, UNANSWERED + CODE_OFFSET],
+        "unknown": counts[:, UNKNOWN_ANSWER + CODE_OFFSET],
+        "scores": scores
+    }
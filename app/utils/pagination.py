@@ -0,0 +1,151 @@
+import base64
+import threading
+from cachetools import TTLCache
+from bson import json_util
+
+# Cached totals and summaries for listing pages:
+# (collection, query) -> count, (collection, 'aggregate', pipeline) -> document
+_count_cache = TTLCache(maxsize=1024, ttl=60)
+_count_lock = threading.Lock()
+
+
+def encode_cursor(values):
+    """Opaque, URL-safe page cursor for a list of sort key values"""
+    raw = json_util.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """Sort key values of a cursor, or None for a missing/malformed cursor"""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json_util.loads(raw.decode('utf-8'))
+    except (ValueError, TypeError):
+        return None
+    return values if isinstance(values, list) else None
+
+
+def keyset_filter(sort, values, forward=True):
+    """Filter for documents strictly after (or before) ``values`` in ``sort`` order.
+
+    For a sort of ``[(a, 1), (_id, 1)]`` this is
+    ``{$or: [{a: {$gt: va}}, {a: va, _id: {$gt: vid}}]}``.
+    """
+    clauses = []
+    for i, (field, direction) in enumerate(sort):
+        clause = {f: v for (f, _), v in zip(sort[:i], values[:i])}
+        op = '$gt' if (direction == 1) == forward else '$lt'
+        clause[field] = {op: values[i]}
+        clauses.append(clause)
+    return {'$or': clauses}
+
+
+def _sort_values(doc, sort):
+    return [doc.get(field) for field, _ in sort]
+
+
+def page_projection(projection, sort):
+    """Projection that keeps the sort keys needed for the cursors.
+
+    Returns ``(projection, strip_id)``; with ``strip_id`` the caller removes
+    ``_id`` from the items once the cursors are built.
+    """
+    if projection is None:
+        return None, False
+    projection = dict(projection)
+    strip_id = False
+    if projection.get('_id', 1) == 0:
+        projection.pop('_id')
+        strip_id = True
+    if any(v == 1 for v in projection.values()):
+        for field, _ in sort:
+            projection[field] = 1
+    return projection, strip_id
+
+
+def page_plan(sort, per_page, page=1, after=None, before=None):
+    """How to fetch one page: ``(filter, sort, skip, backward)``.
+
+    ``filter`` is the keyset range for a cursor (None when paging by number)
+    and ``backward`` means the page is read in reverse and must be flipped.
+    """
+    after_values = decode_cursor(after)
+    if after_values is not None and len(after_values) == len(sort):
+        return keyset_filter(sort, after_values), sort, 0, False
+    before_values = decode_cursor(before) if after_values is None else None
+    if before_values is not None and len(before_values) == len(sort):
+        reverse = [(field, -direction) for field, direction in sort]
+        return keyset_filter(sort, before_values, forward=False), reverse, 0, True
+    return None, sort, max(page - 1, 0) * per_page, False
+
+
+def finish_page(items, sort, per_page, page=1, keyset=False, backward=False, strip_id=False):
+    """Trim a page fetched with ``per_page + 1`` items and build its cursors"""
+    more = len(items) > per_page
+    items = items[:per_page]
+    if backward:
+        items = items[::-1]
+        has_next, has_prev = True, more
+    else:
+        has_next, has_prev = more, keyset or page > 1
+
+    next_cursor = encode_cursor(_sort_values(items[-1], sort)) if items and has_next else None
+    prev_cursor = encode_cursor(_sort_values(items[0], sort)) if items and has_prev else None
+
+    if strip_id:
+        for item in items:
+            item.pop('_id', None)
+    return items, next_cursor, prev_cursor
+
+
+def keyset_page(collection, query, sort, per_page, page=1, after=None, before=None, projection=None):
+    """Fetch one page of a listing using keyset pagination.
+
+    ``sort`` must end with ``('_id', direction)`` so the order is total. With
+    an ``after`` (or ``before``) cursor the page is an index range seek that
+    costs the same at any depth; without one the page number falls back to
+    ``skip``. Returns ``(items, next_cursor, prev_cursor)``; a cursor is None
+    when there is no page in that direction.
+    """
+    # Sort keys must come back with the documents to build the cursors
+    projection, strip_id = page_projection(projection, sort)
+    range_filter, order, skip, backward = page_plan(sort, per_page, page, after, before)
+    if range_filter is not None:
+        query = {'$and': [query, range_filter]}
+
+    items = list(collection.find(query, projection).sort(order).skip(skip).limit(per_page + 1))
+    return finish_page(items, sort, per_page, page, range_filter is not None, backward, strip_id)
+
+
+def cached_count(collection, query):
+    """Total for a listing, cached for a minute so paging doesn't recount.
+
+    An unfiltered total is the collection's metadata count, which is cheap
+    enough not to cache.
+    """
+    if not query:
+        return collection.estimated_document_count()
+
+    key = (collection.name, json_util.dumps(query, sort_keys=True))
+    with _count_lock:
+        total = _count_cache.get(key)
+    if total is None:
+        total = collection.count_documents(query)
+        with _count_lock:
+            _count_cache[key] = total
+    return total
+
+
+def cached_aggregate(collection, pipeline):
+    """First document of a summary aggregation for a listing (e.g. a
+    ``$facet`` of averages), cached for a minute like ``cached_count``"""
+    key = (collection.name, 'aggregate', json_util.dumps(pipeline, sort_keys=True))
+    with _count_lock:
+        summary = _count_cache.get(key)
+    if summary is None:
+        summary = next(collection.aggregate(pipeline, allowDiskUse=True), {})
+        with _count_lock:
+            _count_cache[key] = summary
+    return summary
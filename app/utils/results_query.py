@@ -0,0 +1,65 @@
+from app.utils.pagination import keyset_page, cached_count, cached_aggregate
+from app.utils.taxonomy import results_filter
+
+# Admin listing order: newest first, _id breaks ties
+RESULTS_SORT = [('timestamp', -1), ('_id', -1)]
+
+
+class ResultsQuery:
+    """Results filter built from the admin school/department/course/semester
+    selection, shared by the results listing and the export.
+    """
+
+    def __init__(self, school='', department='', course='', semester='', published_only=False):
+        self.school = school
+        self.department = department
+        self.course = course
+        self.semester = semester
+        self.query = results_filter(
+            school, department, course, semester,
+            base={"published": True} if published_only else None
+        )
+
+    @classmethod
+    def from_args(cls, args, published_only=False):
+        """Build the filter from request arguments"""
+        return cls(
+            args.get('school', ''), args.get('department', ''),
+            args.get('course', ''), args.get('semester', ''),
+            published_only=published_only
+        )
+
+    def summary_pipeline(self):
+        """``$facet`` pipeline for the number of distinct students and the
+        average score of the matching results"""
+        return [
+            {"$match": self.query},
+            {"$facet": {
+                "students": [{"$group": {"_id": "$scholar_id"}}, {"$count": "count"}],
+                "average": [{"$group": {"_id": None, "avg_score": {"$avg": "$score"}}}]
+            }}
+        ]
+
+    def read_page(self, collection, per_page, page=1, after=None, before=None, projection=None, sort=RESULTS_SORT):
+        """Fetch a listing page plus its summary.
+
+        The page is a keyset index seek, and the total and the summary
+        aggregation (student count and average score) are cached for a
+        minute per filter like the other admin listing totals, so paging
+        doesn't rescan the matching results. Returns a dict with ``items``, ``next_cursor``,
+        ``prev_cursor``, ``total``, ``total_students`` and ``average_score``.
+        """
+        items, next_cursor, prev_cursor = keyset_page(
+            collection, self.query, sort, per_page, page=page, after=after, before=before, projection=projection
+        )
+        facets = cached_aggregate(collection, self.summary_pipeline())
+        students = facets.get('students') or [{}]
+        average = facets.get('average') or [{}]
+        return {
+            'items': items,
+            'next_cursor': next_cursor,
+            'prev_cursor': prev_cursor,
+            'total': cached_count(collection, self.query),
+            'total_students': students[0].get('count', 0),
+            'average_score': average[0].get('avg_score', 0)
+        }
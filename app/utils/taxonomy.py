@@ -0,0 +1,276 @@
+from functools import lru_cache
+from types import MappingProxyType
+
+# School to Department mapping
+SCHOOL_DEPARTMENTS = {
+    "School of Technology, Communication and Management": [
+        "Department of Computer Sciences",
+        "Department of Tourism Management",
+        "Department of Journalism & Mass Communication",
+        "Department of Animation and Visual Effects",
+    ],
+    "School of Biological Sciences and Sustainability": [
+        "Department of Rural Studies and Sustainability",
+    ],
+    "School of Indology": [
+        "Department of Sanskrit and Vedic Studies",
+        "Department of Hindi",
+        "Department of Indian Classical Music",
+        "Department of History and Indian Culture",
+    ],
+    "School of Humanities, Social Sciences and Foundation Courses": [
+        "Department of English",
+        "Department of Education",
+        "Department of Psychology",
+        "Department of Life Management",
+        "Department of Scientific Spirituality",
+        "Department of Oriental Studies, Religious Studies & Philosophy",
+        "Department of Yogic Sciences and Human Consciousness",
+    ],
+}
+
+# Department to Course mapping
+DEPARTMENT_COURSES = {
+    "Department of Computer Sciences": [
+        "B.Sc. Information Technology (Honors)",
+        "Bachelor of Computer Application (Honors)",
+        "Master of Computer Application (Data Science)",
+    ],
+    "Department of Tourism Management": [
+        "B.B.A Tourism & Travel Management (Honors)",
+        "M.B.A. Tourism & Travel Management",
+    ],
+    "Department of Journalism & Mass Communication": [
+        "B.A. Journalism and Mass Communication (Honors)",
+        "M. A. Journalism and Mass Communication",
+        "M. A. Spiritual Journalism",
+    ],
+    "Department of Animation and Visual Effects": [
+        "B.Voc. (Bachelor of Vocation) in 3D Animation and VFX (Honors)",
+    ],
+    "Department of Rural Studies and Sustainability": [
+        "Bachelor of Rural Studies (Honors)",
+    ],
+    "Department of English": ["B.A. English (Honors)"],
+    "Department of Education": ["B.Ed. (Bachelor of Education)"],
+    "Department of Psychology": [
+        "B.A. Psychology (Honors)",
+        "M.A. Counselling Psychology",
+        "M.Sc. Counselling Psychology",
+    ],
+    "Department of Life Management": [
+        "Life Management - Compulsory Program for PG and UG",
+    ],
+    "Department of Scientific Spirituality": [
+        "M.Sc. Herbal Medicine and Natural Product Chemistry",
+        "M.Sc. Molecular Physiology and Traditional Health Sciences",
+        "M.Sc. Indigenous Approaches for Child Development & Generational Dynamics",
+        "M.Sc. Indian Knowledge Systems",
+        "M.A. Indian Knowledge Systems",
+    ],
+    "Department of Oriental Studies, Religious Studies & Philosophy": [
+        "M.A. Hindu Studies",
+        "M.A. Philosophy",
+    ],
+    "Department of Yogic Sciences and Human Consciousness": [
+        "B.Sc. Yogic Science (Honors)",
+        "M.Sc. Yoga Therapy",
+        "M.A. Human Consciousness & Yogic Science",
+        "M.Sc. Human Consciousness & Yogic Science",
+        "P. G. Diploma Human Consciousness, Yoga & Alternative Therapy",
+        "Certificate In Yoga And Alternative Therapy",
+    ],
+    "Department of Sanskrit and Vedic Studies": [
+        "B.A. Sanskrit (Honors)",
+        "M.A. Sanskrit",
+    ],
+    "Department of Hindi": ["B.A. Hindi (Honors)", "M.A. Hindi"],
+    "Department of Indian Classical Music": [
+        "B.A. Music (Vocal) (Honors)",
+        "M.A. Music (Vocal)",
+        "B.A. Music Instrumental Mridang/Tabla (Honors)",
+        "M.A. Music (Tabla, Pakhaawaj)",
+    ],
+    "Department of History and Indian Culture": [
+        "B.A. History (Honors)",
+        "M. A. History and Indian Culture",
+    ],
+}
+
+# Reverse maps, compiled once at import
+DEPARTMENT_SCHOOL = MappingProxyType({
+    department: school
+    for school, departments in SCHOOL_DEPARTMENTS.items()
+    for department in departments
+})
+COURSE_DEPARTMENT = MappingProxyType({
+    course: department
+    for department, courses in DEPARTMENT_COURSES.items()
+    for course in courses
+})
+COURSE_SCHOOL = MappingProxyType({
+    course: DEPARTMENT_SCHOOL.get(department)
+    for course, department in COURSE_DEPARTMENT.items()
+})
+COURSE_MAPPING = MappingProxyType({
+    course: MappingProxyType({"school": COURSE_SCHOOL[course], "department": department})
+    for course, department in COURSE_DEPARTMENT.items()
+})
+
+# Forward course sets, for O(1) membership tests
+SCHOOL_COURSES = MappingProxyType({
+    school: frozenset(course for department in departments for course in DEPARTMENT_COURSES.get(department, []))
+    for school, departments in SCHOOL_DEPARTMENTS.items()
+})
+DEPARTMENT_COURSE_SETS = MappingProxyType({
+    department: frozenset(courses)
+    for department, courses in DEPARTMENT_COURSES.items()
+})
+ALL_COURSES = tuple(COURSE_DEPARTMENT)
+
+# Integer codes stored next to the names on users and results, so indexes,
+# $match and $group work on small ints. Codes are hierarchical and positional
+# (department = school * 100 + n, course = department * 100 + n): append new
+# entries to the end of their list and never reorder or remove them.
+SCHOOL_CODES = MappingProxyType({school: n for n, school in enumerate(SCHOOL_DEPARTMENTS, 1)})
+DEPARTMENT_CODES = MappingProxyType({
+    department: SCHOOL_CODES[school] * 100 + n
+    for school, departments in SCHOOL_DEPARTMENTS.items()
+    for n, department in enumerate(departments, 1)
+})
+COURSE_CODES = MappingProxyType({
+    course: DEPARTMENT_CODES[department] * 100 + n
+    for department, courses in DEPARTMENT_COURSES.items() if department in DEPARTMENT_CODES
+    for n, course in enumerate(courses, 1)
+})
+
+# Decode tables
+SCHOOL_NAMES = MappingProxyType({code: name for name, code in SCHOOL_CODES.items()})
+DEPARTMENT_NAMES = MappingProxyType({code: name for name, code in DEPARTMENT_CODES.items()})
+COURSE_NAMES = MappingProxyType({code: name for name, code in COURSE_CODES.items()})
+ACADEMIC_FIELDS = (
+    ("school", SCHOOL_CODES, SCHOOL_NAMES),
+    ("department", DEPARTMENT_CODES, DEPARTMENT_NAMES),
+    ("course", COURSE_CODES, COURSE_NAMES),
+)
+
+
+def is_unset(value):
+    """Filter values that mean 'no filter' ('', None, 'all' or 'All')"""
+    return not value or value in ('all', 'All')
+
+
+def course_info(course):
+    """School and department of a course, or None for unknown courses"""
+    return COURSE_MAPPING.get(course)
+
+
+def academic_codes(school=None, department=None, course=None):
+    """``school_id``/``department_id``/``course_id`` for the given names (None
+    outside the taxonomy); school and department default to the course's"""
+    mapping = course_info(course) or {}
+    return {
+        "school_id": SCHOOL_CODES.get(school or mapping.get('school')),
+        "department_id": DEPARTMENT_CODES.get(department or mapping.get('department')),
+        "course_id": COURSE_CODES.get(course)
+    }
+
+
+def academic_match(field, value):
+    """``(key, value)`` query condition on a school/department/course name:
+    the indexed code for taxonomy names, the name itself otherwise"""
+    codes = {name: codes for name, codes, _ in ACADEMIC_FIELDS}[field]
+    if value in codes:
+        return f"{field}_id", codes[value]
+    return field, value
+
+
+def _ordered(courses):
+    """Course set as a tuple in taxonomy order (stable query fragments)"""
+    return tuple(c for c in ALL_COURSES if c in courses)
+
+
+@lru_cache(maxsize=512)
+def allowed_courses(school, department, course):
+    """Frozenset of courses allowed by all of the given filters (strict
+    intersection), or None when none of them is set"""
+    allowed = None
+    if not is_unset(school):
+        allowed = SCHOOL_COURSES.get(school, frozenset())
+    if not is_unset(department):
+        department_courses = DEPARTMENT_COURSE_SETS.get(department, frozenset())
+        allowed = department_courses if allowed is None else allowed & department_courses
+    if not is_unset(course):
+        allowed = frozenset([course]) if allowed is None else allowed & {course}
+    return allowed
+
+
+@lru_cache(maxsize=512)
+def _course_fragment(school, department, course):
+    allowed = allowed_courses(school, department, course)
+    if allowed is None:
+        return None
+    if not is_unset(course):
+        return course if course in allowed else ()
+    return _ordered(allowed)
+
+
+def course_filter(school='', department='', course=''):
+    """Query fragment for the 'course' field matching the given filters.
+
+    Every filter narrows the previous one: a department outside the school or
+    a course outside both yields an empty match. Returns None when nothing is
+    filtered, a course name, or a fresh ``{'$in': [...]}`` built from a
+    memoized tuple.
+    """
+    fragment = _course_fragment(school, department, course)
+    if fragment is None or isinstance(fragment, str):
+        return fragment
+    return {'$in': list(fragment)}
+
+
+def results_filter(school='', department='', course='', semester='', base=None):
+    """Results query for the admin school/department/course/semester filters.
+
+    Matches on the indexed ``course_id`` codes; a course outside the taxonomy
+    can only be matched by name.
+    """
+    query = dict(base or {})
+    fragment = _course_fragment(school, department, course)
+    if isinstance(fragment, str):
+        query.update([academic_match('course', fragment)])
+    elif fragment is not None:
+        query['course_id'] = {'$in': [COURSE_CODES[c] for c in fragment]}
+    if not is_unset(semester):
+        query['semester'] = semester
+    return query
+
+
+@lru_cache(maxsize=512)
+def _student_course_fragment(school, department, course):
+    if not is_unset(school):
+        school_departments = SCHOOL_DEPARTMENTS.get(school, [])
+        if not is_unset(department) and department in school_departments:
+            courses = DEPARTMENT_COURSE_SETS[department] if department in DEPARTMENT_COURSE_SETS else frozenset()
+        else:
+            courses = SCHOOL_COURSES.get(school, frozenset())
+    elif not is_unset(department):
+        courses = DEPARTMENT_COURSE_SETS.get(department, frozenset())
+    else:
+        return course if not is_unset(course) else None
+    if not is_unset(course) and course in courses:
+        return course
+    return _ordered(courses)
+
+
+def student_course_filter(school='all', department='all', course='all'):
+    """Query fragment for targeting students of a quiz.
+
+    Unlike ``course_filter`` this is lenient, as quiz targeting always was: a
+    department outside the school or a course outside the selection widens
+    back to the enclosing school/department instead of matching nothing.
+    """
+    fragment = _student_course_fragment(school, department, course)
+    if fragment is None or isinstance(fragment, str):
+        return fragment
+    return {'$in': list(fragment)}